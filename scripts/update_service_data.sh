@@ -20,26 +20,35 @@ if [[ $? != 0 ]]; then
     exit -1
 fi
 
+# Recompute the substitution counts for the overview API
+python3 ~/NarrativeIntelligence/src/narraint/queryengine/index/compute_substitution_counts.py
+if [[ $? != 0 ]]; then
+    echo "Previous script returned exit code != 0 -> Stopping pipeline."
+    exit -1
+fi
 
-# Set DB date to now
-python3 ~/NarrativeIntelligence/src/narraint/queryengine/update_database_update_date.py
+
+# Add the newly inserted documents to the content statistics (help and stats page)
+# must run before the DB date is set, because only documents inserted since the last update are counted
+python3 ~/NarrativeIntelligence/src/narraint/frontend/ui/service_content.py --newer-documents
 if [[ $? != 0 ]]; then
     echo "Previous script returned exit code != 0 -> Stopping pipeline."
     exit -1
 fi
 
 
-# Update clinical trial phases for drug overviews
-python ~/NarrativeIntelligence/src/narraint/clinicaltrials/extract_trial_phases.py
+# Set DB date to now
+python3 ~/NarrativeIntelligence/src/narraint/queryengine/update_database_update_date.py
 if [[ $? != 0 ]]; then
-     echo "Previous script returned exit code != 0 -> Stopping pipeline."
-     exit -1
+    echo "Previous script returned exit code != 0 -> Stopping pipeline."
+    exit -1
 fi
 
 
-# Update content information (help-page)
-python ~/NarrativeIntelligence/src/narraint/frontend/ui/service_content.py
+# Update clinical trial phases for drug overviews
+python ~/NarrativeIntelligence/src/narraint/clinicaltrials/extract_trial_phases.py --workers 4
 if [[ $? != 0 ]]; then
      echo "Previous script returned exit code != 0 -> Stopping pipeline."
      exit -1
 fi
+
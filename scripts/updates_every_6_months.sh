@@ -11,7 +11,7 @@ fi
 export PYTHONPATH="/root/NarrativeIntelligence/src/:/root/NarrativeIntelligence/lib/NarrativeAnnotation/src/:/root/NarrativeIntelligence/lib/KGExtractionToolbox/src/"
 
 # Generate Drug Overviews
-python3 ~/NarrativeIntelligence/src/narraint/keywords/generate_drug_keywords.py 2> /root/ns_update_every_6_month_err.log
+python3 ~/NarrativeIntelligence/src/narraint/keywords/generate_drug_keywords.py --workers 4 2> /root/ns_update_every_6_month_err.log
 if [[ $? != 0 ]]; then
     mailx -s "$SUBJECT" "$ADDRESS" -r "$SENDER" < /root/ns_update_every_6_month_err.log
     exit -1
@@ -45,5 +45,12 @@ if [[ $? != 0 ]]; then
     exit -1
 fi
 
+# Recount the content statistics (help and stats page) to reflect deleted documents
+python3 ~/NarrativeIntelligence/src/narraint/frontend/ui/service_content.py 2> /root/ns_update_every_6_month_err.log
+if [[ $? != 0 ]]; then
+    mailx -s "$SUBJECT" "$ADDRESS" -r "$SENDER" < /root/ns_update_every_6_month_err.log
+    exit -1
+fi
+
 
 echo "Narrative Every-6-Month Update done" | mailx -s "Narrative Service  Every-6-Month Update done" "$ADDRESS" -r "$SENDER"
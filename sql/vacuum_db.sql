@@ -12,6 +12,7 @@ VACUUM FULL public.predication_to_delete;
 VACUUM FULL public.sentence;
 VACUUM FULL public.doc_processed_by_ie;
 VACUUM FULL public.predication_inverted_index;
+VACUUM FULL public.substitution_count;
 VACUUM FULL public.tag_inverted_index;
 VACUUM FULL public.term_inverted_index;
 
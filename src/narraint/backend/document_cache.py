@@ -0,0 +1,152 @@
+import logging
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Set, List, Callable
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import DatabaseUpdate
+from narraint.backend.retrieve import retrieve_narrative_documents
+
+NARRATIVE_DOCUMENT = "narrative"
+
+
+class NarrativeDocumentCache:
+    """
+    Process-level LRU cache for narrative documents and documents that are derived from them
+    (e.g. IndexedDocument or RecommenderDocument). Entries are kept as compressed pickles, so that the memory
+    budget is measured exactly and every lookup returns a fresh object that may be modified by the caller.
+    All entries are dropped if the database has been updated.
+    """
+    # maximum number of bytes of all cached (compressed) entries
+    MAX_CACHE_BYTES = 128 * 1024 * 1024
+    # larger entries are not cached
+    MAX_ENTRY_BYTES = 4 * 1024 * 1024
+    # seconds between two checks whether the database has been updated (the metrics are logged then as well)
+    CACHE_VALIDATION_INTERVAL = 600
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_entry_bytes=MAX_ENTRY_BYTES,
+                 validation_interval=CACHE_VALIDATION_INTERVAL):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.validation_interval = validation_interval
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__cache_db_update = None
+        self.__cache_validated_at = 0
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size_bytes = 0
+
+    def _validate_cache(self):
+        """
+        Drops all entries if the database has been updated since they were cached
+        The database is updated by a different process, so web workers must detect updates via the database
+        """
+        now = time.time()
+        if now - self.__cache_validated_at < self.validation_interval:
+            return
+        self.__cache_validated_at = now
+        logging.info(f'Narrative document cache: {self.get_metrics()}')
+
+        try:
+            last_update = DatabaseUpdate.get_latest_update(SessionExtended.get())
+        except ValueError:
+            last_update = None
+
+        if last_update != self.__cache_db_update:
+            if self.__entries:
+                self.invalidations += 1
+            self.clear()
+            self.__cache_db_update = last_update
+
+    def get(self, kind: str, document_collection: str, document_id: int):
+        """
+        Loads a cached document
+        :param kind: the kind of the document (e.g. narrative or a derived document class)
+        :param document_collection: the document collection
+        :param document_id: the document id
+        :return: the document or None if it is not cached
+        """
+        key = (kind, document_collection, document_id)
+        with self.__lock:
+            data = self.__entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(zlib.decompress(data))
+
+    def put(self, kind: str, document_collection: str, document_id: int, document):
+        """
+        Caches a document and evicts the least recently used documents if the memory budget is exceeded
+        :param kind: the kind of the document (e.g. narrative or a derived document class)
+        :param document_collection: the document collection
+        :param document_id: the document id
+        :param document: a picklable document
+        """
+        data = zlib.compress(pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.max_entry_bytes:
+            return
+        key = (kind, document_collection, document_id)
+        with self.__lock:
+            if key in self.__entries:
+                self.size_bytes -= len(self.__entries.pop(key))
+            self.__entries[key] = data
+            self.size_bytes += len(data)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_documents(self, document_ids: Set[int], document_collection: str, kind: str = NARRATIVE_DOCUMENT,
+                      derive: Callable = None) -> List:
+        """
+        Retrieves documents from the cache and loads missing documents from the database
+        :param document_ids: a set of document ids
+        :param document_collection: the document collection
+        :param kind: the kind of documents (narrative if no derive function is given)
+        :param derive: a function that derives the requested document from a narrative document
+        :return: a list of documents sorted by their id (descending)
+        """
+        self._validate_cache()
+        documents = []
+        missing_ids = set()
+        for document_id in document_ids:
+            document = self.get(kind, document_collection, document_id)
+            if document is None:
+                missing_ids.add(document_id)
+            else:
+                documents.append(document)
+
+        if missing_ids:
+            if derive:
+                narrative_documents = self.get_documents(missing_ids, document_collection)
+            else:
+                narrative_documents = retrieve_narrative_documents(missing_ids, document_collection)
+            for narrative_document in narrative_documents:
+                document = derive(narrative_document) if derive else narrative_document
+                self.put(kind, document_collection, narrative_document.id, document)
+                documents.append(document)
+
+        documents.sort(key=lambda d: d.id, reverse=True)
+        return documents
+
+    def get_metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(entries=len(self.__entries), size_bytes=self.size_bytes, max_bytes=self.max_bytes,
+                    hits=self.hits, misses=self.misses, hit_ratio=round(self.hits / lookups, 3) if lookups else 0.0,
+                    evictions=self.evictions, invalidations=self.invalidations)
+
+
+NARRATIVE_DOCUMENT_CACHE = NarrativeDocumentCache()
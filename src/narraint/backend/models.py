@@ -63,6 +63,25 @@ class PredicationInvertedIndex(Extended, DatabaseTable):
         return list(int(doc_id) for doc_id in document_ids_str.strip("[]").split(","))
 
 
+class SubstitutionCount(Extended, DatabaseTable):
+    """
+    Number of documents per substitution of a variable in a fact pattern with a single fixed entity
+    (e.g. Metformin treats ?X(Disease)). Computed from the predication_inverted_index including
+    predicate expansion. The primary key (in column order) is used for the lookup of a fixed entity.
+    """
+    __tablename__ = "substitution_count"
+
+    document_collection = Column(String, nullable=False, primary_key=True)
+    entity_id = Column(String, nullable=False, primary_key=True)
+    entity_type = Column(String, nullable=False, primary_key=True)
+    relation = Column(String, nullable=False, primary_key=True)
+    variable_position = Column(String, nullable=False, primary_key=True)
+    substitution_id = Column(String, nullable=False, primary_key=True)
+    substitution_type = Column(String, nullable=False, primary_key=True)
+    support = Column(Integer, nullable=False)
+    max_document_id = Column(BigInteger, nullable=False)
+
+
 class Tagger(models.Tagger):
     pass
 
@@ -173,6 +192,35 @@ class DatabaseUpdate(Extended, DatabaseTable):
         session.commit()
 
 
+class TableVersion(Extended, DatabaseTable):
+    """
+    Version counters of tables that are kept in memory by the web service
+    Jobs increment the version in the same transaction as their changes, so that web workers can detect them
+    """
+    __tablename__ = "table_version"
+
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    @staticmethod
+    def get_version(session, table_name: str) -> int:
+        row = session.query(TableVersion.version).filter(TableVersion.table_name == table_name).first()
+        return row[0] if row else 0
+
+    @staticmethod
+    def increment_version(session, table_name: str) -> int:
+        """
+        Increments the version of a table (the caller commits)
+        :param session: the database session
+        :param table_name: the table name
+        :return: the new version
+        """
+        version = TableVersion.get_version(session, table_name) + 1
+        session.execute(delete(TableVersion).where(TableVersion.table_name == table_name))
+        session.execute(insert(TableVersion).values(table_name=table_name, version=version))
+        return version
+
+
 class EntityTaggerData(Extended, DatabaseTable):
     __tablename__ = "entity_tagger_data"
     entity_id = Column(String, primary_key=True)
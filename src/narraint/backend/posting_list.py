@@ -0,0 +1,63 @@
+import random
+from typing import List
+
+"""
+Operations on encoded posting lists of the inverted indexes (e.g. '[9, 5, 2]').
+The index jobs store document ids in sorted order (descending), which is required by the sampling.
+"""
+
+
+def _get_bounds(document_ids_str: str) -> (int, int):
+    # positions of the first and behind the last character of the ids
+    return document_ids_str.index("[") + 1, document_ids_str.rindex("]")
+
+
+def count_document_ids(document_ids_str: str) -> int:
+    """
+    Counts the document ids of an encoded posting list without decoding it
+    :param document_ids_str: the encoded posting list
+    :return: the number of document ids
+    """
+    start, end = _get_bounds(document_ids_str)
+    if not document_ids_str[start:end].strip():
+        return 0
+    return document_ids_str.count(",", start, end) + 1
+
+
+def sample_document_ids(document_ids_str: str, k: int, rng: random.Random = None) -> List[int]:
+    """
+    Draws up to k distinct document ids uniformly from an encoded posting list without decoding it.
+    Random character positions are mapped to the id they belong to. Ids with more characters are hit more often,
+    so an id is accepted with the probability min_width / width (rejection sampling), which makes each id equally
+    likely. min_width is taken from the first and the last id of the sorted list. Time and memory are proportional
+    to k (unless k exceeds half of the list).
+    :param document_ids_str: the encoded posting list (sorted)
+    :param k: the sample size
+    :param rng: a random generator (e.g. seeded for reproducible samples)
+    :return: a sorted list of up to k document ids
+    """
+    rng = rng or random.Random()
+    n = count_document_ids(document_ids_str)
+    if k <= 0 or n == 0:
+        return []
+    if 2 * k > n:
+        # most ids are drawn anyway
+        document_ids = [int(d) for d in document_ids_str.strip("[] ").split(",")]
+        return sorted(rng.sample(document_ids, min(k, n)))
+
+    start, end = _get_bounds(document_ids_str)
+    # the width of an id includes its separator (except for the last id)
+    first_width = document_ids_str.find(",", start, end) + 1 - start
+    last_width = end - (document_ids_str.rfind(",", start, end) + 1)
+    min_width = min(first_width, last_width)
+
+    sample = {}
+    while len(sample) < k:
+        pos = rng.randrange(start, end)
+        id_start = document_ids_str.rfind(",", start, pos) + 1 or start
+        id_end = document_ids_str.find(",", pos, end)
+        width = id_end + 1 - id_start if id_end >= 0 else end - id_start
+        if id_start not in sample and rng.random() * width < min_width:
+            id_end = id_end if id_end >= 0 else end
+            sample[id_start] = int(document_ids_str[id_start:id_end])
+    return sorted(sample.values())
@@ -0,0 +1,66 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Set, List
+
+from kgextractiontoolbox.backend.retrieve import retrieve_narrative_documents_from_database
+from kgextractiontoolbox.document.narrative_document import NarrativeDocument
+from narraint.backend.database import SessionExtended
+
+NARRATIVE_DOCUMENT_CHUNK_SIZE = 500
+NARRATIVE_DOCUMENT_FETCH_WORKERS = 4
+
+
+def _retrieve_chunk(document_ids: Set[int], document_collection: str) -> List[NarrativeDocument]:
+    # the scoped session provides a separate session (and pooled connection) for each worker thread
+    session = SessionExtended.get()
+    try:
+        return retrieve_narrative_documents_from_database(session, document_ids=document_ids,
+                                                          document_collection=document_collection)
+    finally:
+        session.remove()
+
+
+def iter_narrative_documents(document_ids: Set[int], document_collection: str,
+                             chunk_size=NARRATIVE_DOCUMENT_CHUNK_SIZE, max_workers=NARRATIVE_DOCUMENT_FETCH_WORKERS):
+    """
+    Retrieves narrative documents in chunks of document ids. Chunks are retrieved concurrently by several worker
+    threads and yielded in the order of their ids (latest first). At most two chunks per worker are retrieved
+    ahead of the consumer, so a large set of documents is never materialized as a whole.
+    :param document_ids: a set of document ids
+    :param document_collection: the document collection
+    :param chunk_size: number of document ids that are retrieved by a single worker
+    :param max_workers: number of worker threads
+    :return: a generator of narrative documents
+    """
+    document_ids = sorted(document_ids, reverse=True)
+    chunks = [set(document_ids[i:i + chunk_size]) for i in range(0, len(document_ids), chunk_size)]
+    if len(chunks) <= 1:
+        # small requests are retrieved with the session of the calling thread
+        for chunk in chunks:
+            yield from retrieve_narrative_documents_from_database(SessionExtended.get(), document_ids=chunk,
+                                                                  document_collection=document_collection)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(executor.submit(_retrieve_chunk, chunk, document_collection))
+                if len(pending) >= 2 * max_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # the consumer might stop early (e.g. a closed connection)
+            for future in pending:
+                future.cancel()
+
+
+def retrieve_narrative_documents(document_ids: Set[int], document_collection: str) -> List[NarrativeDocument]:
+    """
+    Retrieves narrative documents chunk-wise and concurrently (see iter_narrative_documents)
+    :param document_ids: a set of document ids
+    :param document_collection: the document collection
+    :return: a list of narrative documents
+    """
+    return list(iter_narrative_documents(document_ids, document_collection))
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import DrugDiseaseTrialPhase, TableVersion
+
+
+class DrugIndicationIndex:
+    """
+    Process-local map of drugs to their indications (diseases with the maximum clinical trial phase)
+    The table is refreshed by a different process, so its version is checked periodically and the map is reloaded
+    if the version has changed.
+    """
+    __instance = None
+
+    # seconds between two checks whether the table version has changed
+    VERSION_CHECK_INTERVAL = 60
+
+    def __new__(cls):
+        if cls.__instance is None:
+            cls.__instance = super().__new__(cls)
+            cls.__instance.drug2indications = {}
+            cls.__instance.version = None
+            cls.__instance.checked_at = 0
+            cls.__instance.lock = threading.Lock()
+        return cls.__instance
+
+    def _load(self, session, version: int):
+        drug2indications = defaultdict(list)
+        q = session.query(DrugDiseaseTrialPhase).order_by(DrugDiseaseTrialPhase.drug, DrugDiseaseTrialPhase.disease)
+        for row in q:
+            drug2indications[row.drug].append(dict(mesh_id=row.disease, max_phase_for_ind=row.phase))
+        # the map is replaced as a whole, so concurrent readers see either the old or the new map
+        self.drug2indications = dict(drug2indications)
+        self.version = version
+        logging.info(f'Loaded indications of {len(self.drug2indications)} drugs (table version {version})')
+
+    def _check_version(self):
+        now = time.time()
+        if now - self.checked_at < DrugIndicationIndex.VERSION_CHECK_INTERVAL:
+            return
+        with self.lock:
+            if now - self.checked_at < DrugIndicationIndex.VERSION_CHECK_INTERVAL:
+                return
+            session = SessionExtended.get()
+            version = TableVersion.get_version(session, DrugDiseaseTrialPhase.__tablename__)
+            if version != self.version:
+                self._load(session, version)
+            self.checked_at = now
+
+    def get_indications(self, drug: str) -> [dict]:
+        """
+        Returns the indications of a drug
+        :param drug: the ChEMBL id of the drug
+        :return: a list of dicts (mesh_id, max_phase_for_ind)
+        """
+        self._check_version()
+        return list(self.drug2indications.get(drug, []))
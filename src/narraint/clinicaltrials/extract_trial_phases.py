@@ -1,38 +1,60 @@
+import argparse
 import csv
 import itertools
 import logging
+import multiprocessing
 import os
 import shutil
 import tempfile
 from datetime import datetime
 
-import requests
-from sqlalchemy import delete
+from sqlalchemy import delete, tuple_
 
 import kgextractiontoolbox.document.document as doc
 import kgextractiontoolbox.entitylinking.entity_linking_config as cnf
 from kgextractiontoolbox.progress import print_progress_with_eta
 from narraint.backend.database import SessionExtended
-from narraint.backend.models import DrugDiseaseTrialPhase
+from narraint.backend.models import DrugDiseaseTrialPhase, TableVersion
+from narraint.clinicaltrials.fetch_trials import ClinicalTrialPageFetcher
 from narrant.config import PREPROCESS_CONFIG
 from narrant.entitylinking.pharmacy.disease import DiseaseTagger
 from narrant.entitylinking.pharmacy.drug import DrugTagger
 
+# number of unique intervention / condition strings that are tagged by a single worker task
+TAGGING_BATCH_SIZE = 1000
+
+# number of (drug, disease) keys per delete statement
+DELETE_BATCH_SIZE = 1000
+
+# taggers are prepared once and inherited by forked worker processes
+_TRIAL_TAGGERS = {}
+
 
 class ClinicalTrialPhaseExtractor:
-    CLINICA_TRIAL_REQUEST = "https://clinicaltrials.gov/api/v2/studies?format=csv&fields=Study+Title%7CNCT+Number%7CStudy+Status%7CConditions%7CInterventions%7CSponsor%7CStudy+Type%7CPhases"
 
-    def __init__(self):
+    def __init__(self, workers: int = 1, fetcher: ClinicalTrialPageFetcher = None):
         self.tmp_dir = None
         self.clinical_trial_file = None
+        self.workers = workers
+        self.fetcher = fetcher or ClinicalTrialPageFetcher()
 
-    def load_and_extract(self):
-        self.tmp_dir = tempfile.mkdtemp()
-        logging.info(f'Clinical phases data will be stored temporarily in {self.tmp_dir}')
-        self.clinical_trial_file = os.path.join(self.tmp_dir, 'clinical_phases.csv')
+    def load_and_extract(self, clinical_trial_file: str = None, offline: bool = False, resume: bool = False):
+        """
+        Fetches the clinical trial data, extracts all (drug, disease, phase) tuples and stores them in the database
+        :param clinical_trial_file: use this local CSV file instead of fetching the data from ClinicalTrials.gov
+        :param offline: replay the latest cached snapshot instead of fetching the data
+        :param resume: continue an interrupted fetch
+        :return: None
+        """
+        if clinical_trial_file:
+            self.clinical_trial_file = clinical_trial_file
+        else:
+            self.tmp_dir = tempfile.mkdtemp()
+            logging.info(f'Clinical phases data will be stored temporarily in {self.tmp_dir}')
+            self.clinical_trial_file = os.path.join(self.tmp_dir, 'clinical_phases.csv')
 
-        # Step one: fetch clinical trial data
-        self.fetch_study_data()
+            # Step one: fetch clinical trial data
+            self.fetch_study_data(offline=offline, resume=resume)
 
         # Step two: extract all (drug, disease, phase) tuples
         ddp = self.extract_drug_disease_phase_tuples()
@@ -40,45 +62,88 @@ class ClinicalTrialPhaseExtractor:
         # Step three: put everything into a database table
         ClinicalTrialPhaseExtractor.insert_ddp_tuples_into_db(ddp)
 
-        # ... do stuff with dirpath
-        shutil.rmtree(self.tmp_dir)
-
-    def fetch_study_data(self):
-        logging.info("Starting the process to fetch all studies.")
-
-        with open(self.clinical_trial_file, "w", newline="", encoding="utf-8") as csv_file:
-            logging.debug('Sending request to ClinicalTrials.gov...')
-            response = requests.get(
-                ClinicalTrialPhaseExtractor.CLINICA_TRIAL_REQUEST,
-                params={
-                    "pageSize": 10000,
-                },
-            )
-            csv_file.write(response.text)
-            while 'x-next-page-token' in response.headers:
-                logging.debug('Sending request to ClinicalTrials.gov...')
-                response = requests.get(
-                    ClinicalTrialPhaseExtractor.CLINICA_TRIAL_REQUEST,
-                    params={
-                        "pageSize": 10000,
-                        "pageToken": response.headers['x-next-page-token'],
-                    },
-                )
-                csv_file.write(response.text)
-
-        logging.info("Finished fetching all studies.")
+        if self.tmp_dir:
+            shutil.rmtree(self.tmp_dir)
+
+    def fetch_study_data(self, offline: bool = False, resume: bool = False):
+        """
+        Writes all studies into the clinical trial file. Fetched pages are kept in the local cache.
+        :param offline: replay the latest cached snapshot instead of fetching the data
+        :param resume: continue an interrupted fetch
+        """
+        if offline:
+            logging.info("Replaying the latest cached studies.")
+            self.fetcher.write_csv(self.clinical_trial_file)
+        else:
+            logging.info("Starting the process to fetch all studies.")
+            snapshot = self.fetcher.fetch(resume=resume)
+            self.fetcher.write_csv(self.clinical_trial_file, snapshot)
+            logging.info("Finished fetching all studies.")
+
+    @staticmethod
+    def split_items(text: str) -> [str]:
+        return [item for item in text.split("|") if item.strip()]
+
+    @staticmethod
+    def iter_trial_rows(clinical_trial_file: str):
+        """
+        Streams the rows of the clinical trial CSV file
+        The file consists of several fetched pages, each of them starting with its own header line
+        :param clinical_trial_file: path to the CSV file
+        :return: a generator of row dicts
+        """
+        with open(clinical_trial_file, newline='', encoding="utf-8") as csvfile:
+            csv_reader = csv.DictReader(csvfile)
+            for row in csv_reader:
+                # repeated header line of the next page
+                if all(key == value for key, value in row.items()):
+                    continue
+                yield row
 
     @staticmethod
-    def retrieve_tags(tagger, text):
-        tagged_list = []
-        untagged_list = text.split("|")
-        for item in untagged_list:
+    def tag_items(tagger, items: [str]):
+        """
+        Tags each item (an intervention or a condition) separately
+        :param tagger: a prepared tagger
+        :param items: a list of strings
+        :return: a list of (item, entity ids) tuples
+        """
+        item_tags = []
+        for item in items:
             text_doc = doc.TaggedDocument(title=item, abstract="", id=1)
             tagger.tag_doc(text_doc)
             text_doc.remove_duplicates_and_sort_tags()
-            for tag in text_doc.tags:
-                tagged_list.append(tag.ent_id)
-        return tagged_list
+            item_tags.append((item, sorted({tag.ent_id for tag in text_doc.tags})))
+        return item_tags
+
+    @staticmethod
+    def _tag_batch(args):
+        # executed by worker processes
+        tagger_name, items = args
+        return ClinicalTrialPhaseExtractor.tag_items(_TRIAL_TAGGERS[tagger_name], items)
+
+    def tag_unique_items(self, tagger_name: str, items: {str}) -> {str: [str]}:
+        """
+        Tags unique strings in batches that are spread over the worker processes
+        :param tagger_name: the name of a prepared tagger in _TRIAL_TAGGERS
+        :param items: a set of strings
+        :return: a dict mapping each item to its entity ids
+        """
+        items = sorted(items)
+        batches = [(tagger_name, items[i:i + TAGGING_BATCH_SIZE]) for i in range(0, len(items), TAGGING_BATCH_SIZE)]
+        logging.info(f'Tagging {len(items)} unique items with {tagger_name} tagger ({self.workers} workers)...')
+        item2ids = {}
+        start_time = datetime.now()
+        if self.workers > 1 and len(batches) > 1:
+            with multiprocessing.Pool(min(self.workers, len(batches))) as pool:
+                for idx, item_tags in enumerate(pool.imap_unordered(ClinicalTrialPhaseExtractor._tag_batch, batches)):
+                    item2ids.update(item_tags)
+                    print_progress_with_eta(f"tagging {tagger_name} items", idx, len(batches), start_time)
+        else:
+            for idx, batch in enumerate(batches):
+                item2ids.update(ClinicalTrialPhaseExtractor._tag_batch(batch))
+                print_progress_with_eta(f"tagging {tagger_name} items", idx, len(batches), start_time)
+        return item2ids
 
     @staticmethod
     def convert_phase(phases_text):
@@ -96,61 +161,88 @@ class ClinicalTrialPhaseExtractor:
         return max_value
 
     def extract_drug_disease_phase_tuples(self):
+        """
+        Extracts all (drug, disease, phase) tuples of the clinical trial file
+        Interventions and conditions repeat across trials, so each unique string is tagged only once. The file is
+        streamed twice: once to collect the unique strings and once to join the tagged strings back to the trials.
+        :return: a list of (drug, disease, phase) tuples (the maximum phase of each drug-disease pair)
+        """
         logging.info("Starting the process to extract phases.")
+        interventions, conditions = set(), set()
+        for row in ClinicalTrialPhaseExtractor.iter_trial_rows(self.clinical_trial_file):
+            interventions.update(ClinicalTrialPhaseExtractor.split_items(row["Interventions"]))
+            conditions.update(ClinicalTrialPhaseExtractor.split_items(row["Conditions"]))
+
         config = cnf.Config(PREPROCESS_CONFIG)
         config.config["dict"]["min_full_tag_len"] = 3
-        dd_phase = {}
         drug_tagger = DrugTagger(**dict(logger=logging, config=config, collection="trial_drugs"))
         drug_tagger.prepare()
         disease_tagger = DiseaseTagger(**dict(logger=logging, config=config, collection="trial_diseases"))
         disease_tagger.prepare()
+        _TRIAL_TAGGERS.update(drug=drug_tagger, disease=disease_tagger)
+        intervention2drugs = self.tag_unique_items("drug", interventions)
+        condition2diseases = self.tag_unique_items("disease", conditions)
+        _TRIAL_TAGGERS.clear()
 
-        with open(self.clinical_trial_file, newline='') as csvfile:
-            csv_reader = csv.DictReader(csvfile)
-            total_rows = sum(1 for row in csv_reader)
-            csvfile.seek(0)
-            idx = 0
-            start_time = datetime.now()
-            for row in csv_reader:
-                try:
-                    drugs = ClinicalTrialPhaseExtractor.retrieve_tags(drug_tagger, row["Interventions"])
-                    diseases = ClinicalTrialPhaseExtractor.retrieve_tags(disease_tagger, row["Conditions"])
-
-                    if not drugs or not diseases:
-                        print_progress_with_eta("reading clinical trial rows", idx, total_rows, start_time)
-                        idx += 1
-                        continue
-
-                    phase = ClinicalTrialPhaseExtractor.convert_phase(row["Phases"])
+        dd_phase = {}
+        trials = 0
+        for row in ClinicalTrialPhaseExtractor.iter_trial_rows(self.clinical_trial_file):
+            trials += 1
+            try:
+                drugs = {d for item in ClinicalTrialPhaseExtractor.split_items(row["Interventions"])
+                         for d in intervention2drugs[item]}
+                diseases = {d for item in ClinicalTrialPhaseExtractor.split_items(row["Conditions"])
+                            for d in condition2diseases[item]}
+                if not drugs or not diseases:
+                    continue
 
-                    for drug, disease in itertools.product(drugs, diseases):
-                        if (drug, disease) in dd_phase and phase > dd_phase[(drug, disease)]:
-                            dd_phase[(drug, disease)] = phase
-                        elif (drug, disease) not in dd_phase:
-                            dd_phase[(drug, disease)] = phase
+                phase = ClinicalTrialPhaseExtractor.convert_phase(row["Phases"])
+                for drug, disease in itertools.product(drugs, diseases):
+                    if (drug, disease) not in dd_phase or phase > dd_phase[(drug, disease)]:
+                        dd_phase[(drug, disease)] = phase
 
-                except Exception as e:
-                    logging.error(f"Error processing row: {row}. Error: {e}")
-                print_progress_with_eta("reading clinical trial rows", idx, total_rows, start_time)
-                idx += 1
+            except Exception as e:
+                logging.error(f"Error processing row: {row}. Error: {e}")
 
-        logging.info(f"Finished extracting phases. Total unique drug-disease pairs: {len(dd_phase)}")
+        logging.info(f"Finished extracting phases of {trials} trials. "
+                     f"Total unique drug-disease pairs: {len(dd_phase)}")
         # Generate final tuples
         ddp = [(drug, disease, phase) for (drug, disease), phase in dd_phase.items()]
         return ddp
 
     @staticmethod
     def insert_ddp_tuples_into_db(ddp):
-        logging.info('Deleting data from table: drug_disease_trial_phase')
+        """
+        Updates the drug_disease_trial_phase table to the given tuples
+        Only changed rows are deleted and inserted. All changes and the new table version are committed in a single
+        transaction, so readers never see an empty or partially updated table.
+        :param ddp: a list of (drug, disease, phase) tuples
+        :return: None
+        """
         session = SessionExtended.get()
-        session.execute(delete(DrugDiseaseTrialPhase))
-        session.commit()
+        existing = {(row.drug, row.disease): row.phase for row in session.query(DrugDiseaseTrialPhase)}
+        ddp2phase = {(drug, disease): phase for drug, disease, phase in ddp}
 
-        logging.info(f'Inserting {len(ddp)} tuples into database...')
-        values = [dict(drug=dr, disease=di, phase=p) for dr, di, p in ddp]
-        DrugDiseaseTrialPhase.bulk_insert_values_into_table(session, values)
+        outdated = [key for key, phase in existing.items() if ddp2phase.get(key) != phase]
+        new = [key for key, phase in ddp2phase.items() if existing.get(key) != phase]
+        logging.info(f'Updating table drug_disease_trial_phase: {len(outdated)} rows deleted or changed, '
+                     f'{len(new)} rows changed or inserted ({len(ddp2phase)} rows in total)')
+        if not outdated and not new:
+            logging.info('Finished')
+            return
 
-        logging.info('Finished')
+        for idx in range(0, len(outdated), DELETE_BATCH_SIZE):
+            keys = outdated[idx:idx + DELETE_BATCH_SIZE]
+            session.execute(delete(DrugDiseaseTrialPhase)
+                            .where(tuple_(DrugDiseaseTrialPhase.drug, DrugDiseaseTrialPhase.disease).in_(keys)))
+
+        values = [dict(drug=drug, disease=disease, phase=ddp2phase[(drug, disease)]) for drug, disease in new]
+        if values:
+            DrugDiseaseTrialPhase.bulk_insert_values_into_table(session, values, check_constraints=False,
+                                                                commit=False)
+        version = TableVersion.increment_version(session, DrugDiseaseTrialPhase.__tablename__)
+        session.commit()
+        logging.info(f'Finished (table version {version})')
 
 
 def main():
@@ -158,8 +250,17 @@ def main():
                         datefmt='%Y-%m-%d:%H:%M:%S',
                         level=logging.DEBUG)
 
-    c = ClinicalTrialPhaseExtractor()
-    c.load_and_extract()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=False, default=None,
+                        help="Extract the phases from this local CSV file instead of fetching ClinicalTrials.gov")
+    parser.add_argument("--offline", action="store_true",
+                        help="Replay the latest cached snapshot of ClinicalTrials.gov instead of fetching it")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted fetch")
+    parser.add_argument("--workers", type=int, default=1, help="Number of tagging worker processes")
+    args = parser.parse_args()
+
+    c = ClinicalTrialPhaseExtractor(workers=args.workers)
+    c.load_and_extract(clinical_trial_file=args.csv, offline=args.offline, resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from narraint.config import CLINICAL_TRIALS_CACHE_DIR
+
+CLINICAL_TRIAL_REQUEST = "https://clinicaltrials.gov/api/v2/studies?format=csv&fields=Study+Title%7CNCT+Number%7CStudy+Status%7CConditions%7CInterventions%7CSponsor%7CStudy+Type%7CPhases"
+CLINICAL_TRIAL_PAGE_SIZE = 10000
+
+
+class ClinicalTrialPageFetcher:
+    """
+    Fetches the pages of ClinicalTrials.gov studies into a local cache.
+    Each snapshot (a pass over all pages) is a directory containing the pages and a manifest that lists them in
+    order. Pages are stored under the hash of their page token and the manifest is updated after every page, so an
+    interrupted fetch can be resumed. Complete snapshots can be replayed without network access.
+    The API paginates with opaque tokens (the next token is part of the previous response), so pages of a snapshot
+    are requested one after another via a pooled session that retries failed requests.
+    """
+    MANIFEST_FILE = "manifest.json"
+    SNAPSHOT_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+    def __init__(self, cache_dir: str = CLINICAL_TRIALS_CACHE_DIR, page_size: int = CLINICAL_TRIAL_PAGE_SIZE,
+                 keep_snapshots: int = 2, timeout: int = 300, session=None):
+        """
+        :param cache_dir: directory of the snapshots
+        :param page_size: number of studies per page
+        :param keep_snapshots: number of complete snapshots that are kept after a fetch
+        :param timeout: timeout of a single request in seconds
+        :param session: a requests session (a pooled session with retries is created if None)
+        """
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        self.keep_snapshots = keep_snapshots
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            retries = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
+            session.mount("https://", HTTPAdapter(max_retries=retries))
+        self.session = session
+
+    @staticmethod
+    def get_page_key(page_token: str) -> str:
+        return hashlib.sha256((page_token or "").encode("utf-8")).hexdigest()
+
+    def _load_manifest(self, snapshot: str) -> dict:
+        with open(os.path.join(self.cache_dir, snapshot, ClinicalTrialPageFetcher.MANIFEST_FILE), "rt") as f:
+            return json.load(f)
+
+    def _store_manifest(self, snapshot: str, manifest: dict):
+        path = os.path.join(self.cache_dir, snapshot, ClinicalTrialPageFetcher.MANIFEST_FILE)
+        with open(path + ".tmp", "wt") as f:
+            json.dump(manifest, f, indent=1)
+        # the manifest is replaced atomically, so an interrupted fetch never leaves a broken manifest
+        os.replace(path + ".tmp", path)
+
+    def get_snapshots(self, complete: bool = None) -> [str]:
+        """
+        Lists the cached snapshots
+        :param complete: only list complete (True) or incomplete (False) snapshots (all if None)
+        :return: a list of snapshot names (oldest first)
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        snapshots = []
+        for snapshot in sorted(os.listdir(self.cache_dir)):
+            if not os.path.isfile(os.path.join(self.cache_dir, snapshot, ClinicalTrialPageFetcher.MANIFEST_FILE)):
+                continue
+            if complete is None or self._load_manifest(snapshot)["complete"] == complete:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def _store_page(self, snapshot: str, manifest: dict, page_token: str, response):
+        content = response.content
+        key = ClinicalTrialPageFetcher.get_page_key(page_token)
+        path = os.path.join(self.cache_dir, snapshot, f"{key}.csv")
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+
+        next_token = response.headers.get("x-next-page-token")
+        manifest["pages"].append(dict(token=page_token, key=key, sha256=hashlib.sha256(content).hexdigest()))
+        manifest["next_token"] = next_token
+        manifest["complete"] = next_token is None
+        self._store_manifest(snapshot, manifest)
+
+    def fetch(self, resume: bool = False) -> str:
+        """
+        Fetches all pages into a new snapshot or continues the latest incomplete snapshot
+        :param resume: continue the latest incomplete snapshot (if there is one)
+        :return: the name of the complete snapshot
+        """
+        incomplete = self.get_snapshots(complete=False)
+        if resume and incomplete:
+            snapshot = incomplete[-1]
+            manifest = self._load_manifest(snapshot)
+            logging.info(f'Resuming snapshot {snapshot} after {len(manifest["pages"])} pages')
+        else:
+            snapshot = datetime.now().strftime(ClinicalTrialPageFetcher.SNAPSHOT_FORMAT)
+            os.makedirs(os.path.join(self.cache_dir, snapshot), exist_ok=True)
+            manifest = dict(pages=[], next_token=None, complete=False)
+            self._store_manifest(snapshot, manifest)
+            logging.info(f'Fetching studies into snapshot {snapshot}')
+
+        while not manifest["complete"]:
+            page_token = manifest["next_token"]
+            params = dict(pageSize=self.page_size)
+            if page_token:
+                params["pageToken"] = page_token
+            logging.debug(f'Sending request to ClinicalTrials.gov (page {len(manifest["pages"]) + 1})...')
+            response = self.session.get(CLINICAL_TRIAL_REQUEST, params=params, timeout=self.timeout)
+            # page tokens of an old incomplete snapshot might be expired - the fetch must be restarted then
+            response.raise_for_status()
+            self._store_page(snapshot, manifest, page_token, response)
+
+        logging.info(f'Snapshot {snapshot} complete ({len(manifest["pages"])} pages)')
+        self.remove_old_snapshots()
+        return snapshot
+
+    def remove_old_snapshots(self):
+        """
+        Removes incomplete snapshots and all but the latest keep_snapshots complete snapshots
+        """
+        complete = self.get_snapshots(complete=True)
+        outdated = self.get_snapshots(complete=False) + complete[:max(0, len(complete) - self.keep_snapshots)]
+        for snapshot in outdated:
+            logging.info(f'Removing clinical trial snapshot {snapshot}')
+            shutil.rmtree(os.path.join(self.cache_dir, snapshot))
+
+    def iter_pages(self, snapshot: str = None):
+        """
+        Replays the pages of a complete snapshot without network access
+        :param snapshot: the snapshot name (the latest complete snapshot if None)
+        :return: a generator of page contents (CSV strings)
+        """
+        if not snapshot:
+            complete = self.get_snapshots(complete=True)
+            if not complete:
+                raise ValueError(f'No complete clinical trial snapshot in {self.cache_dir}')
+            snapshot = complete[-1]
+        manifest = self._load_manifest(snapshot)
+        if not manifest["complete"]:
+            raise ValueError(f'Clinical trial snapshot {snapshot} is incomplete')
+
+        for page in manifest["pages"]:
+            with open(os.path.join(self.cache_dir, snapshot, f'{page["key"]}.csv'), "rb") as f:
+                content = f.read()
+            if hashlib.sha256(content).hexdigest() != page["sha256"]:
+                raise ValueError(f'Page {page["key"]} of snapshot {snapshot} is corrupted')
+            yield content.decode("utf-8")
+
+    def write_csv(self, clinical_trial_file: str, snapshot: str = None):
+        """
+        Writes the pages of a complete snapshot into a single CSV file
+        :param clinical_trial_file: path to the CSV file
+        :param snapshot: the snapshot name (the latest complete snapshot if None)
+        """
+        with open(clinical_trial_file, "w", newline="", encoding="utf-8") as csv_file:
+            for page in self.iter_pages(snapshot):
+                csv_file.write(page)
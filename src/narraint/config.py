@@ -63,3 +63,6 @@ AUTOCOMPLETION_TMP_INDEX = os.path.join(TMP_DIR, 'autocompletion.pkl')
 
 # Drug keyword extraction stopword list
 DRUG_KEYWORD_STOPWORD_LIST = os.path.join(RESOURCE_DIR, 'stopwords_drug_keywords.txt')
+
+# Local cache of fetched ClinicalTrials.gov pages
+CLINICAL_TRIALS_CACHE_DIR = os.path.join(CACHE_DIR, 'clinicaltrials')
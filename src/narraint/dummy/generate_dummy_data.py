@@ -1,9 +1,18 @@
+import csv
+import hashlib
+import io
+import itertools
 import logging
+import multiprocessing
 import random
-import string
 from argparse import ArgumentParser
+from datetime import date
+from typing import Dict
 
-from kgextractiontoolbox.backend.models import Document, Tag, Sentence, Predication
+from sqlalchemy import text
+from sqlalchemy.sql.functions import func
+
+from kgextractiontoolbox.backend.models import Document, Tag, Sentence, Predication, DocumentMetadata
 from kgextractiontoolbox.progress import Progress
 from narraint.backend.database import SessionExtended
 from narraint.backend.delete_collection import delete_document_collection_from_database_enhanced
@@ -12,130 +21,324 @@ from narraint.backend.util import get_db_connection_name
 NUMBER_OF_ENTITIES = 100000
 NUMBER_OF_ENTITY_TYPES = 10
 NUMBER_OF_RELATIONS = 10
+NUMBER_OF_WORDS = 10000
+NUMBER_OF_AUTHORS = 100000
+NUMBER_OF_JOURNALS = 1000
+
+# documents that are generated (and written) by a worker at once
+DUMMY_CHUNK_SIZE = 10000
+
+DOCUMENT_COLUMNS = ["id", "collection", "title", "abstract", "date_inserted"]
+SENTENCE_COLUMNS = ["id", "document_collection", "text", "md5hash"]
+TAG_COLUMNS = ["id", "ent_type", "start", "end", "ent_id", "ent_str", "document_id", "document_collection"]
+METADATA_COLUMNS = ["document_id", "document_collection", "document_id_original", "authors", "journals",
+                    "publication_year", "publication_month", "publication_doi"]
+PREDICATION_COLUMNS = ["id", "document_id", "document_collection", "subject_id", "subject_str", "subject_type",
+                       "predicate", "relation", "object_id", "object_str", "object_type", "confidence",
+                       "sentence_id", "extraction_type"]
+TABLE_COLUMNS = [(Document, DOCUMENT_COLUMNS), (DocumentMetadata, METADATA_COLUMNS), (Sentence, SENTENCE_COLUMNS),
+                 (Tag, TAG_COLUMNS), (Predication, PREDICATION_COLUMNS)]
+
+
+class ZipfSampler:
+    """
+    Draws ranks 0..n-1 with a probability proportional to 1 / (rank + 1) ^ skew
+    A skew of 0 is uniform, PubMed entity frequencies roughly follow a skew of 1 (a few entities occur in a large
+    share of documents, most entities occur rarely).
+    """
+
+    def __init__(self, n: int, skew: float):
+        self.population = range(n)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(n)))
+
+    def sample(self, rng: random.Random, k: int) -> [int]:
+        return rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+
+class DummyCorpusConfig:
+    """
+    Sizes and distributions of a synthetic corpus
+    Entities, relations and words are drawn from Zipf distributions. The number of sentences, tags and predications
+    per document is drawn from an exponential distribution with the given means (long-tailed).
+    """
+
+    def __init__(self, entities: int = NUMBER_OF_ENTITIES, entity_types: int = NUMBER_OF_ENTITY_TYPES,
+                 relations: int = NUMBER_OF_RELATIONS, entity_skew: float = 1.0, relation_skew: float = 1.0,
+                 sentences_per_document: float = 5.0, tags_per_document: float = 10.0,
+                 predications_per_document: float = 5.0, title_words: int = 10, abstract_words: int = 60):
+        """
+        :param entities: number of distinct entities
+        :param entity_types: number of entity types (each entity has a fixed type)
+        :param relations: number of distinct relations
+        :param entity_skew: Zipf exponent of the entity frequencies (0 is uniform)
+        :param relation_skew: Zipf exponent of the relation frequencies (0 is uniform)
+        :param sentences_per_document: mean number of sentences per document (at least one sentence)
+        :param tags_per_document: mean number of tags per document
+        :param predications_per_document: mean number of predications per document
+        :param title_words: number of words per title
+        :param abstract_words: number of words per abstract
+        """
+        self.entities = entities
+        self.entity_types = entity_types
+        self.relations = relations
+        self.entity_skew = entity_skew
+        self.relation_skew = relation_skew
+        self.sentences_per_document = sentences_per_document
+        self.tags_per_document = tags_per_document
+        self.predications_per_document = predications_per_document
+        self.title_words = title_words
+        self.abstract_words = abstract_words
+
+    def create_samplers(self) -> Dict[str, ZipfSampler]:
+        return dict(entity=ZipfSampler(self.entities, self.entity_skew),
+                    relation=ZipfSampler(self.relations, self.relation_skew),
+                    word=ZipfSampler(NUMBER_OF_WORDS, 1.0),
+                    author=ZipfSampler(NUMBER_OF_AUTHORS, 1.0),
+                    journal=ZipfSampler(NUMBER_OF_JOURNALS, 1.0))
+
+
+def get_entity(rank: int, entity_types: int = NUMBER_OF_ENTITY_TYPES) -> (str, str, str):
+    # entities are identified by their frequency rank (entity_id_0 is the most frequent entity)
+    return f"entity_id_{rank}", f"entity_type_{rank % entity_types}", f"entity {rank}"
+
+
+def get_word(rank: int) -> str:
+    return hashlib.md5(str(rank).encode()).hexdigest()[:3 + rank % 8]
+
+
+WORDS = [get_word(rank) for rank in range(NUMBER_OF_WORDS)]
+
+
+def _draw_count(rng: random.Random, mean: float) -> int:
+    if mean <= 0:
+        return 0
+    return int(rng.expovariate(1.0 / mean))
+
+
+def _draw_document_counts(config: DummyCorpusConfig, rng: random.Random) -> (int, int, int):
+    sentences = 1 + _draw_count(rng, config.sentences_per_document - 1)
+    return sentences, _draw_count(rng, config.tags_per_document), _draw_count(rng, config.predications_per_document)
+
+
+def _get_chunk_seed(seed: int, collection: str, first_document_id: int, kind: str) -> str:
+    # every chunk has its own generator, so the corpus does not depend on the number of workers
+    return f"{seed}:{collection}:{first_document_id}:{kind}"
+
+
+_DUMMY_CONFIG = None
+_DUMMY_SAMPLERS = None
+
+
+def _init_worker(config: DummyCorpusConfig):
+    global _DUMMY_CONFIG, _DUMMY_SAMPLERS
+    _DUMMY_CONFIG = config
+    _DUMMY_SAMPLERS = config.create_samplers()
+
+
+def count_chunk_rows(chunk: dict) -> (int, int, int):
+    """
+    Counts the sentences, tags and predications of a chunk (ids are assigned to chunks based on these counts)
+    :param chunk: the chunk description
+    :return: the number of sentences, tags and predications
+    """
+    rng = random.Random(_get_chunk_seed(chunk["seed"], chunk["collection"], chunk["first_document_id"], "counts"))
+    totals = [0, 0, 0]
+    for _ in range(chunk["documents"]):
+        for i, count in enumerate(_draw_document_counts(_DUMMY_CONFIG, rng)):
+            totals[i] += count
+    return tuple(totals)
+
+
+def generate_chunk_rows(chunk: dict) -> dict:
+    """
+    Generates the rows of a chunk of documents
+    :param chunk: the chunk description (collection, first document id, number of documents, seed and first ids)
+    :return: a dict mapping each table to a list of row tuples (see TABLE_COLUMNS)
+    """
+    config, samplers = _DUMMY_CONFIG, _DUMMY_SAMPLERS
+    collection = chunk["collection"]
+    count_rng = random.Random(_get_chunk_seed(chunk["seed"], collection, chunk["first_document_id"], "counts"))
+    rng = random.Random(_get_chunk_seed(chunk["seed"], collection, chunk["first_document_id"], "rows"))
+    sentence_id, tag_id, predication_id = chunk["sentence_id"], chunk["tag_id"], chunk["predication_id"]
+    date_inserted = chunk["date_inserted"]
+
+    rows = {table: [] for table, _ in TABLE_COLUMNS}
+    for document_id in range(chunk["first_document_id"], chunk["first_document_id"] + chunk["documents"]):
+        n_sentences, n_tags, n_predications = _draw_document_counts(config, count_rng)
+        title = " ".join(WORDS[w] for w in samplers["word"].sample(rng, config.title_words))
+        abstract = " ".join(WORDS[w] for w in samplers["word"].sample(rng, config.abstract_words))
+        rows[Document].append((document_id, collection, title, abstract, date_inserted))
+        # most publications are recent
+        year = date_inserted.year - min(70, int(rng.expovariate(0.1)))
+        authors = " | ".join(f"Author {a}" for a in samplers["author"].sample(rng, rng.randint(1, 5)))
+        journal = f"Journal {samplers['journal'].sample(rng, 1)[0]}"
+        rows[DocumentMetadata].append((document_id, collection, f"{collection}{document_id}", authors, journal, year,
+                                       rng.randint(1, 12), f"10.0000/{collection.lower()}.{document_id}"))
+
+        document_sentence_ids = range(sentence_id, sentence_id + n_sentences)
+        for sid in document_sentence_ids:
+            sentence = f"{title} {sid}"
+            rows[Sentence].append((sid, collection, sentence, hashlib.md5(sentence.encode()).hexdigest()))
+        sentence_id += n_sentences
+
+        entity_ranks = samplers["entity"].sample(rng, n_tags)
+        for rank in entity_ranks:
+            ent_id, ent_type, ent_str = get_entity(rank, config.entity_types)
+            start = rng.randint(0, 300)
+            rows[Tag].append((tag_id, ent_type, start, start + len(ent_str), ent_id, ent_str, document_id,
+                              collection))
+            tag_id += 1
+
+        # statements are extracted between entities of the document (if it has at least two tags)
+        relation_ranks = samplers["relation"].sample(rng, n_predications)
+        for relation_rank in relation_ranks:
+            if len(entity_ranks) >= 2:
+                subject_rank, object_rank = rng.sample(entity_ranks, 2)
+            else:
+                subject_rank, object_rank = samplers["entity"].sample(rng, 2)
+            subject_id, subject_type, subject_str = get_entity(subject_rank, config.entity_types)
+            object_id, object_type, object_str = get_entity(object_rank, config.entity_types)
+            relation = f"relation_{relation_rank}"
+            rows[Predication].append((predication_id, document_id, collection, subject_id, subject_str,
+                                      subject_type, relation, relation, object_id, object_str, object_type,
+                                      round(rng.random(), 4), rng.choice(document_sentence_ids), "dummy"))
+            predication_id += 1
+    return rows
+
+
+def _copy_rows(session, rows: dict):
+    # COPY is the fastest way to load rows into Postgres
+    cursor = session.connection().connection.cursor()
+    for table, columns in TABLE_COLUMNS:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows[table])
+        buffer.seek(0)
+        quoted_columns = ", ".join(f'"{c}"' for c in columns)
+        cursor.copy_expert(f"COPY {table.__tablename__} ({quoted_columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    session.commit()
+
+
+def _insert_rows(session, rows: dict):
+    if SessionExtended.is_sqlite:
+        # executemany of the DB-API avoids building SQLAlchemy statements per row
+        cursor = session.connection().connection.cursor()
+        for table, columns in TABLE_COLUMNS:
+            quoted_columns = ", ".join(f'"{c}"' for c in columns)
+            placeholders = ", ".join("?" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table.__tablename__} ({quoted_columns}) VALUES ({placeholders})",
+                               rows[table])
+        session.commit()
+    else:
+        for table, columns in TABLE_COLUMNS:
+            table.bulk_insert_values_into_table(session, [dict(zip(columns, row)) for row in rows[table]],
+                                                check_constraints=False, commit=False)
+        session.commit()
 
 
-def get_random_entity_id():
-    return "entity_id_" + str(random.randint(0, NUMBER_OF_ENTITIES))
-
-
-def get_random_entity_type():
-    return "entity_type_" + str(random.randint(0, NUMBER_OF_ENTITY_TYPES))
-
-
-def get_random_relation():
-    return "relation_" + str(random.randint(0, NUMBER_OF_RELATIONS))
-
-
-def get_random_string(min_length: int, max_length: int):
-    length = random.randint(min_length, max_length)
-    # choose from all lowercase letter
-    letters = string.ascii_lowercase
-    result_str = ''.join(random.choice(letters) for _ in range(length))
-    return result_str
-
-
-def generate_dummy_db_data(number_of_documents: int, collection: str, incremental: bool):
-    if not number_of_documents:
+def _generate_and_copy_chunk(chunk: dict) -> (int, dict):
+    # Postgres workers write their chunks in parallel
+    rows = generate_chunk_rows(chunk)
+    session = SessionExtended.get()
+    _copy_rows(session, rows)
+    return chunk["documents"], {table: len(rows[table]) for table, _ in TABLE_COLUMNS}
+
+
+def _generate_chunk(chunk: dict) -> (int, dict):
+    return chunk["documents"], generate_chunk_rows(chunk)
+
+
+def _query_highest_id(session, table) -> int:
+    return session.query(func.max(table.id)).scalar() or 0
+
+
+def generate_dummy_corpus(collection2documents: Dict[str, int], config: DummyCorpusConfig = None, seed: int = 0,
+                          workers: int = 1, incremental: bool = False, chunk_size: int = DUMMY_CHUNK_SIZE):
+    """
+    Generates a synthetic corpus (documents, document metadata, sentences, tags and predications)
+    Documents are generated in chunks by worker processes. Each chunk has its own seeded random generator, so the
+    same seed always produces the same corpus (regardless of the number of workers). Ids are assigned densely after
+    counting the rows of each chunk. Postgres workers write their chunks via COPY, otherwise the rows are inserted
+    by the main process (via executemany for SQLite).
+    :param collection2documents: a dict mapping document collections to their number of documents
+    :param config: the sizes and distributions of the corpus
+    :param seed: the random seed
+    :param workers: the number of worker processes
+    :param incremental: add documents behind the highest document id of each collection
+    :param chunk_size: number of documents per chunk
+    :return: None
+    """
+    if not collection2documents or min(collection2documents.values()) <= 0:
         raise ValueError('Number of documents must be > 0')
-
+    config = config or DummyCorpusConfig()
     session = SessionExtended.get()
 
-    document_values = []
-    tag_values = []
-    predication_values = []
-    sentence_values = []
+    chunks = []
+    for collection, documents in sorted(collection2documents.items()):
+        doc_offset = 0
+        if incremental:
+            doc_offset = Document.query_highest_document_id(session, document_collection=collection) + 1
+        logging.info(f'Generating {documents} documents for {collection} (next document id is: {doc_offset})')
+        for first in range(0, documents, chunk_size):
+            chunks.append(dict(collection=collection, first_document_id=doc_offset + first,
+                               documents=min(chunk_size, documents - first), seed=seed,
+                               date_inserted=date.today()))
 
     sentence_id = Sentence.query_highest_sentence_id(session) + 1
-    if incremental:
-        doc_offset = Document.query_highest_document_id(session, document_collection=collection) + 1
+    tag_id = _query_highest_id(session, Tag) + 1
+    predication_id = _query_highest_id(session, Predication) + 1
+
+    total_documents = sum(collection2documents.values())
+    progress = Progress(total=total_documents, print_every=chunk_size, text="Generating DB data")
+    stats = dict(documents=0)
+    if SessionExtended.is_postgres:
+        generate_chunk = _generate_and_copy_chunk
     else:
-        doc_offset = 0
+        generate_chunk = _generate_chunk
+
+    def assign_ids(chunk_counts):
+        nonlocal sentence_id, tag_id, predication_id
+        for chunk, (sentences, tags, predications) in zip(chunks, chunk_counts):
+            chunk.update(sentence_id=sentence_id, tag_id=tag_id, predication_id=predication_id)
+            sentence_id, tag_id, predication_id = sentence_id + sentences, tag_id + tags, predication_id + predications
+        logging.info(f'Counted the rows of {len(chunks)} chunks')
+        progress.start_time()
+
+    def store_chunk(documents, rows):
+        if not SessionExtended.is_postgres:
+            _insert_rows(session, rows)
+            rows = {table: len(rows[table]) for table, _ in TABLE_COLUMNS}
+        for table, _ in TABLE_COLUMNS:
+            stats[table.__tablename__] = stats.get(table.__tablename__, 0) + rows[table]
+        stats["documents"] += documents
+        progress.print_progress(stats["documents"])
+
+    if workers > 1:
+        # forked workers must not share pooled connections of the parent process
+        session.remove()
+        session.get_bind().dispose()
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(config,)) as pool:
+            assign_ids(pool.map(count_chunk_rows, chunks))
+            for documents, rows in pool.imap_unordered(generate_chunk, chunks):
+                store_chunk(documents, rows)
+    else:
+        _init_worker(config)
+        assign_ids(map(count_chunk_rows, chunks))
+        for documents, rows in map(generate_chunk, chunks):
+            store_chunk(documents, rows)
+    progress.done()
 
-    logging.info(f'Next sentence id is: {sentence_id}')
-    logging.info(f'Next document id is: {doc_offset}')
-    logging.info('-' * 60)
-    logging.info('-' * 60)
-    logging.info('Beginning generation phase')
-    progress = Progress(total=number_of_documents, print_every=100, text="Generating DB data")
-    progress.start_time()
-    for doc_idx in range(0, number_of_documents):
-        progress.print_progress(doc_idx)
-        document_values.append(dict(id=doc_offset + doc_idx,
-                                    collection=collection,
-                                    title=get_random_string(20, 50),
-                                    abstract=get_random_string(300, 500)))
-
-        # Every document has 0... to 20 tags
-        for tag_idx in range(0, random.randint(0, 20)):
-            tag_values.append(dict(ent_type=get_random_entity_type(),
-                                   start=random.randint(0, 300),
-                                   end=random.randint(0, 300),
-                                   ent_id=get_random_entity_id(),
-                                   ent_str=get_random_string(5, 50),
-                                   document_id=doc_idx,
-                                   document_collection=collection))
-
-        # Every document has 1... to 10 sentences
-        sentences_to_generate = random.randint(1, 10)
-        for sent_idx in range(0, sentences_to_generate):
-            sentence_values.append(dict(
-                id=sentence_id,
-                document_collection=collection,
-                text=get_random_string(10, 100),
-                md5hash=get_random_string(20, 20)
-            ))
-            sentence_id += 1
-
-        # Every document has 0... to 20 tags
-        for predication_idx in range(0, random.randint(0, 20)):
-            predication_values.append(dict(
-                document_id=doc_idx,
-                document_collection=collection,
-                subject_id=get_random_entity_id(),
-                subject_str=get_random_string(5, 50),
-                subject_type=get_random_entity_type(),
-                predicate=get_random_string(5, 50),
-                relation=get_random_relation(),
-                object_id=get_random_entity_id(),
-                object_str=get_random_string(5, 50),
-                object_type=get_random_entity_type(),
-                confidence=random.random(),
-                sentence_id=random.randint(1, sentences_to_generate),
-                extraction_type="random"
-            ))
-
-        # Insert every 10000 documents
-        if doc_idx > 0 and doc_idx % 10000 == 0:
-            print()
-            logging.info(f'Inserting {len(document_values)} documents /'
-                         f' {len(tag_values)} tags /'
-                         f' {len(sentence_values)} sentences /'
-                         f' {len(predication_values)} predications')
-            Document.bulk_insert_values_into_table(session, document_values)
-            Tag.bulk_insert_values_into_table(session, tag_values)
-            Sentence.bulk_insert_values_into_table(session, sentence_values)
-            Predication.bulk_insert_values_into_table(session, predication_values)
-
-            document_values.clear()
-            tag_values.clear()
-            sentence_values.clear()
-            predication_values.clear()
-
-    # Insert Remaining data
-    print()
-    logging.info(f'Inserting {len(document_values)} documents /'
-                 f' {len(tag_values)} tags /'
-                 f' {len(sentence_values)} sentences /'
-                 f' {len(predication_values)} predications')
-
-    Document.bulk_insert_values_into_table(session, document_values)
-    Tag.bulk_insert_values_into_table(session, tag_values)
-    Sentence.bulk_insert_values_into_table(session, sentence_values)
-    Predication.bulk_insert_values_into_table(session, predication_values)
+    if SessionExtended.is_postgres:
+        # ids have been assigned explicitly, so serial sequences must continue behind them
+        for table in [Tag, Predication]:
+            session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.__tablename__}', 'id'), "
+                                 f"(SELECT max(id) FROM {table.__tablename__}))"))
+        session.commit()
+    session.remove()
+    logging.info(f'Generated {stats}')
 
-    progress.done()
-    logging.info('-' * 60)
-    logging.info('-' * 60)
+
+def generate_dummy_db_data(number_of_documents: int, collection: str, incremental: bool):
+    generate_dummy_corpus({collection: number_of_documents}, incremental=incremental, seed=random.randint(0, 2 ** 31))
 
 
 def main():
@@ -144,11 +347,33 @@ def main():
                         level=logging.INFO)
 
     parser = ArgumentParser(description="Generate dummy data for the DB for test purposes")
-    parser.add_argument('number_of_documents', type=int, help="Number of documents that should be generated")
+    parser.add_argument('number_of_documents', type=int, nargs="?", default=0,
+                        help="Number of documents that should be generated in the collection DUMMY_GENERATOR")
+    parser.add_argument('--collection', action="append", default=[], metavar="COLLECTION=DOCUMENTS",
+                        help="Generate documents for a collection (can be repeated)")
     parser.add_argument('--incremental', action="store_true", help="Don't delete data and just add incremental data")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (the same seed generates the same corpus)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--entities', type=int, default=NUMBER_OF_ENTITIES, help="Number of distinct entities")
+    parser.add_argument('--relations', type=int, default=NUMBER_OF_RELATIONS, help="Number of distinct relations")
+    parser.add_argument('--entity-skew', type=float, default=1.0,
+                        help="Zipf exponent of the entity frequencies (0 is uniform)")
+    parser.add_argument('--relation-skew', type=float, default=1.0,
+                        help="Zipf exponent of the relation frequencies (0 is uniform)")
+    parser.add_argument('--sentences', type=float, default=5.0, help="Mean number of sentences per document")
+    parser.add_argument('--tags', type=float, default=10.0, help="Mean number of tags per document")
+    parser.add_argument('--predications', type=float, default=5.0, help="Mean number of predications per document")
     args = parser.parse_args()
 
-    document_collection = "DUMMY_GENERATOR"
+    collection2documents = dict()
+    if args.number_of_documents:
+        collection2documents["DUMMY_GENERATOR"] = args.number_of_documents
+    for collection_size in args.collection:
+        collection, documents = collection_size.rsplit("=", 1)
+        collection2documents[collection] = int(documents)
+    if not collection2documents:
+        parser.error('Either the number of documents or --collection must be given')
+
     if not args.incremental:
         logging.info('=' * 70)
         logging.info('=' * 70)
@@ -161,22 +386,30 @@ def main():
         logging.info(f'Your current database is: {database_name}')
 
         session = SessionExtended.get()
-        doc_count = session.query(Document.id.distinct()).filter(Document.collection == document_collection).count()
-        logging.info('{} documents found in collection {}'.format(doc_count, document_collection))
-        print('{} documents are found'.format(doc_count))
-        print(f'Are you really want to delete documents in collection {document_collection}? '
-              f'This will also delete all corresponding tags (Tag), '
-              'tagging information (doc_taggedb_by), facts (Predication) and extraction information (doc_processed_by_ie)')
-        answer = input('Enter y(yes) to proceed the deletion...')
-        if (answer and (answer.lower() == 'y' or answer.lower() == 'yes')):
-            delete_document_collection_from_database_enhanced(document_collection)
-            logging.info('Finished')
-        else:
-            print('Canceled')
+        for document_collection in sorted(collection2documents):
+            doc_count = session.query(Document.id.distinct()).filter(
+                Document.collection == document_collection).count()
+            logging.info('{} documents found in collection {}'.format(doc_count, document_collection))
+            print('{} documents are found'.format(doc_count))
+            print(f'Are you really want to delete documents in collection {document_collection}? '
+                  f'This will also delete all corresponding tags (Tag), '
+                  'tagging information (doc_taggedb_by), facts (Predication) and extraction information '
+                  '(doc_processed_by_ie)')
+            answer = input('Enter y(yes) to proceed the deletion...')
+            if (answer and (answer.lower() == 'y' or answer.lower() == 'yes')):
+                delete_document_collection_from_database_enhanced(document_collection)
+                logging.info('Finished')
+            else:
+                print('Canceled')
+                return
     else:
-        logging.info(f'Adding incremental data to collection: {document_collection}')
+        logging.info(f'Adding incremental data to collections: {sorted(collection2documents)}')
 
-    generate_dummy_db_data(int(args.number_of_documents), document_collection, args.incremental)
+    config = DummyCorpusConfig(entities=args.entities, relations=args.relations, entity_skew=args.entity_skew,
+                               relation_skew=args.relation_skew, sentences_per_document=args.sentences,
+                               tags_per_document=args.tags, predications_per_document=args.predications)
+    generate_dummy_corpus(collection2documents, config=config, seed=args.seed, workers=args.workers,
+                          incremental=args.incremental)
 
 
 if __name__ == "__main__":
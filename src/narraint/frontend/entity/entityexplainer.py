@@ -1,11 +1,12 @@
 import logging
 import string
-from collections import defaultdict
+import time
+from collections import defaultdict, OrderedDict
 
 from sqlalchemy import delete
 
 from narraint.backend.database import SessionExtended
-from narraint.backend.models import EntityExplainerData
+from narraint.backend.models import EntityExplainerData, DatabaseUpdate
 from narraint.frontend.entity.entityindexbase import EntityIndexBase
 from narraint.frontend.entity.entitytagger import EntityTagger
 from narrant.entity.entityresolver import EntityResolver
@@ -17,6 +18,11 @@ class EntityExplainer(EntityIndexBase):
     VERSION = 1
     NAME = "EntityExplainer"
 
+    # maximum number of memoized explanations (entity sets) kept in memory (least recently used are evicted)
+    MAX_CACHED_EXPLANATIONS = 10000
+    # seconds between two checks whether the database has been updated (memoized explanations are dropped then)
+    CACHE_VALIDATION_INTERVAL = 600
+
     def __init__(self):
         if self.__initialized:
             return
@@ -29,6 +35,9 @@ class EntityExplainer(EntityIndexBase):
         self.version = None
         trans_map = {p: '' for p in string.punctuation}
         self.__translator = str.maketrans(trans_map)
+        self.__explanation_cache = OrderedDict()
+        self.__cache_db_update = None
+        self.__cache_validated_at = 0
         self.__initialized = True
 
     def store_index(self):
@@ -51,6 +60,7 @@ class EntityExplainer(EntityIndexBase):
         EntityExplainerData.bulk_insert_values_into_table(session, entries)
 
         self.entity2terms.clear()
+        self.clear_explanation_cache()
         logging.info('Finished')
 
     def _add_term(self, term, entity_id: str, entity_type: str, entity_class: str = None):
@@ -82,22 +92,64 @@ class EntityExplainer(EntityIndexBase):
 
         return selected_headings
 
+    @staticmethod
+    def query_terms_for_entity_ids(entity_ids) -> dict:
+        """
+        Retrieves the known terms for all given entity ids in a single database query
+        :param entity_ids: a collection of entity ids
+        :return: a dict mapping each entity id to its list of terms (unknown ids are skipped)
+        """
+        if not entity_ids:
+            return {}
+        session = SessionExtended.get()
+        query = session.query(EntityExplainerData.entity_id, EntityExplainerData.entity_terms)
+        query = query.filter(EntityExplainerData.entity_id.in_(entity_ids))
+
+        entity_id2terms = dict()
+        for row in query:
+            entity_id2terms[row.entity_id] = EntityExplainerData.string_to_synonyms(row.entity_terms)
+        return entity_id2terms
+
+    def clear_explanation_cache(self):
+        self.__explanation_cache.clear()
+
+    def _validate_explanation_cache(self):
+        """
+        Drops all memoized explanations if the database has been updated since they were computed
+        The index is rebuilt in a different process, so web workers must detect updates via the database
+        """
+        now = time.time()
+        if now - self.__cache_validated_at < EntityExplainer.CACHE_VALIDATION_INTERVAL:
+            return
+        self.__cache_validated_at = now
+
+        try:
+            last_update = DatabaseUpdate.get_latest_update(SessionExtended.get())
+        except ValueError:
+            last_update = None
+
+        if last_update != self.__cache_db_update:
+            self.clear_explanation_cache()
+            self.__cache_db_update = last_update
+
     def explain_entities(self, entities, truncate_at_k=25):
+        # explanations only depend on the entity set, so they can be memoized
+        self._validate_explanation_cache()
+        cache_key = frozenset((e.entity_id, e.entity_type) for e in entities), truncate_at_k
+        if cache_key in self.__explanation_cache:
+            self.__explanation_cache.move_to_end(cache_key)
+            return list(self.__explanation_cache[cache_key])
+
         resolver = EntityResolver()
         headings = set()
-        # Add all headings and known terms for the possible entity ids
+        # Add all headings for the possible entity ids
         for entity in entities:
             heading = resolver.get_name_for_var_ent_id(entity.entity_id, entity.entity_type, resolve_gene_by_id=False)
             headings.add(heading)
 
-            session = SessionExtended.get()
-            query = session.query(EntityExplainerData.entity_terms)
-            query = query.filter(entity.entity_id == EntityExplainerData.entity_id)
-
-            if query.count() == 0:
-                continue
-            terms = query.first()[0]
-            terms = EntityExplainerData.string_to_synonyms(terms)
+        # Add all known terms for the possible entity ids (one query for all entities)
+        entity_id2terms = self.query_terms_for_entity_ids({entity.entity_id for entity in entities})
+        for terms in entity_id2terms.values():
             headings |= set(terms)
 
         # Convert it to a list and sort
@@ -112,6 +164,9 @@ class EntityExplainer(EntityIndexBase):
             headings = headings[:truncate_at_k]
             headings.append(f"and {heading_len - truncate_at_k} more")
 
+        if len(self.__explanation_cache) >= EntityExplainer.MAX_CACHED_EXPLANATIONS:
+            self.__explanation_cache.popitem(last=False)
+        self.__explanation_cache[cache_key] = tuple(headings)
         return headings
 
     def explain_entity_str(self, entity_str, truncate_at_k=25):
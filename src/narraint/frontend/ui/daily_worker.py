@@ -13,6 +13,9 @@ if not os.path.exists(log_path):
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+REFRESH_INTERVAL = timedelta(hours=1)
+
+
 def cache_daily_logs():
     logging.info("Starting the daily log caching process...")
     while True:
@@ -21,20 +24,20 @@ def cache_daily_logs():
         cache_filename = f"daily_logs_cache_{today.strftime('%Y%m%d')}.json"
         cache_file_path = os.path.join(log_path, cache_filename)
 
+        # statistics are updated incrementally, so the cache of today is refreshed periodically
+        logging.info("Processing new log data...")
+        data = create_dictionary_of_logs()
 
-        if not os.path.exists(cache_file_path):
-            logging.info("Processing log data for today...")
-            data = create_dictionary_of_logs()
-
-            with open(cache_file_path, 'w') as cache_file:
-                json.dump(data, cache_file, indent=4, default=str)
-            logging.info(f"Log data cached successfully at {cache_file_path}")
-        else:
-            logging.info(f"Cache file for today already exists: {cache_file_path}")
+        # the view may read the cache file meanwhile, so it is replaced atomically
+        with open(f'{cache_file_path}.tmp', 'w') as cache_file:
+            json.dump(data, cache_file, indent=4, default=str)
+        os.replace(f'{cache_file_path}.tmp', cache_file_path)
+        logging.info(f"Log data cached successfully at {cache_file_path}")
 
-        next_run = datetime.combine(today + timedelta(days=1), datetime.min.time())
-        sleep_seconds = (next_run - datetime.now()).total_seconds()
-        logging.info(f"Sleeping until next day: {next_run}")
+        next_day = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        next_run = min(next_day, datetime.now() + REFRESH_INTERVAL)
+        sleep_seconds = max(0.0, (next_run - datetime.now()).total_seconds())
+        logging.info(f"Sleeping until next run: {next_run}")
         time.sleep(sleep_seconds)
 
 
@@ -1,109 +1,223 @@
+import argparse
 import json
 import logging
 
-from sqlalchemy import insert, delete
+from sqlalchemy import insert, delete, and_
 from sqlalchemy.sql.functions import func
 
 from narraint.backend.database import SessionExtended
-from narraint.backend.models import Document, Tag, Predication, ContentData
-
-
-def compute_publications_per_document_collection(session):
+from narraint.backend.models import Document, Tag, Predication, ContentData, DatabaseUpdate
+
+# entity types with fewer detected entities are not shown on the help page
+MIN_DETECTED_ENTITIES_PER_ENTITY_TYPE = 10000
+
+
+def _group_by_date_inserted(query, document_id, document_collection, inserted_since):
+    # counts are grouped by the insertion date of their documents, so that an incremental update can replace the
+    # counts of all documents that have been inserted since the last update
+    query = query.join(Document, and_(Document.id == document_id, Document.collection == document_collection))
+    if inserted_since is not None:
+        query = query.filter(Document.date_inserted >= inserted_since)
+    return query.group_by(Document.date_inserted)
+
+
+def _to_date2counts(query) -> dict:
+    # converts rows (date_inserted, key1, ..., keyN, count) into nested dictionaries date -> key1 -> ... -> count
+    date2counts = dict()
+    for row in query:
+        *keys, count = row
+        counts = date2counts
+        # dates are stored in ISO format, so they can be compared as strings (empty for unknown dates)
+        keys[0] = str(keys[0]) if keys[0] else ""
+        for key in keys[:-1]:
+            if key not in counts:
+                counts[key] = dict()
+            counts = counts[key]
+        counts[keys[-1]] = count
+    return date2counts
+
+
+def compute_publications_per_document_collection(session, inserted_since=None) -> dict:
     # number of publications per document_collection
-    # SELECT collection, count(*)
+    # SELECT date_inserted, collection, count(*)
     # FROM document
-    # GROUP BY collection;
-    # ORDER BY count(*) DESC
-    query = session.query(Document.collection, func.count())
-    query = query.group_by(Document.collection)
-    query = query.order_by(func.count().desc())
+    # GROUP BY date_inserted, collection;
+    query = session.query(Document.date_inserted, Document.collection, func.count())
+    if inserted_since is not None:
+        query = query.filter(Document.date_inserted >= inserted_since)
+    query = query.group_by(Document.date_inserted, Document.collection)
+    return _to_date2counts(query)
 
-    collection2count = dict()
-    for collection, count in query:
-        collection2count[collection] = count
-    return json.dumps(collection2count)
 
-
-def compute_detected_entities_per_entity_type(session):
+def compute_detected_entities_per_entity_type(session, inserted_since=None) -> dict:
     # number of detected entities per entity type
-    # SELECT ent_type, count(*)
-    # FROM tag
-    # WHERE count(*) >= 10000
-    # GROUP BY ent_type;
-    # ORDER BY count(*) DESC
-    query = session.query(Tag.ent_type, func.count())
+    # SELECT date_inserted, ent_type, count(*)
+    # FROM tag JOIN document
+    # GROUP BY date_inserted, ent_type;
+    # the counts are stored for all entity types (small types might grow above the threshold by later updates)
+    query = session.query(Document.date_inserted, Tag.ent_type, func.count())
+    query = _group_by_date_inserted(query, Tag.document_id, Tag.document_collection, inserted_since)
     query = query.group_by(Tag.ent_type)
-    query = query.having(func.count() >= 10000)
-    query = query.order_by(func.count().desc())
-
-    entity_type2count = dict()
-    for entity_type, count in query:
-        entity_type2count[entity_type] = count
-    return json.dumps(entity_type2count)
+    return _to_date2counts(query)
 
 
-def compute_extracted_statements_per_relation(session):
+def compute_extracted_statements_per_relation(session, inserted_since=None) -> dict:
     # number of extracted statements per relation
-    # SELECT relation, count(*)
-    # FROM predication
+    # SELECT date_inserted, relation, count(*)
+    # FROM predication JOIN document
     # WHERE relation <> NULL
-    # GROUP BY relation;
-    # ORDER BY count(*) DESC
-    session = SessionExtended.get()
-    query = session.query(Predication.relation, func.count())
+    # GROUP BY date_inserted, relation;
+    query = session.query(Document.date_inserted, Predication.relation, func.count())
+    query = _group_by_date_inserted(query, Predication.document_id, Predication.document_collection, inserted_since)
     query = query.filter(Predication.relation.is_not(None))
     query = query.group_by(Predication.relation)
-    query = query.order_by(func.count().desc())
+    return _to_date2counts(query)
+
+
+def compute_extracted_statements_per_relation_and_extraction_type(session, inserted_since=None) -> dict:
+    # number of extracted statements per relation and extraction type (stats page)
+    # SELECT date_inserted, relation, extraction_type, count(*)
+    # FROM predication JOIN document
+    # WHERE relation <> NULL
+    # GROUP BY date_inserted, relation, extraction_type;
+    query = session.query(Document.date_inserted, Predication.relation, Predication.extraction_type, func.count())
+    query = _group_by_date_inserted(query, Predication.document_id, Predication.document_collection, inserted_since)
+    query = query.filter(Predication.relation.is_not(None))
+    query = query.group_by(Predication.relation, Predication.extraction_type)
+    return _to_date2counts(query)
+
+
+CONTENT_DATA_COMPUTATIONS = {
+    "collections": compute_publications_per_document_collection,
+    "entity_types": compute_detected_entities_per_entity_type,
+    "relations": compute_extracted_statements_per_relation,
+    "relation_extraction_types": compute_extracted_statements_per_relation_and_extraction_type
+}
+
+
+def merge_counts(counts: dict, delta: dict) -> dict:
+    """
+    Adds counts to other counts (nested dictionaries are merged recursively)
+    :param counts: the counts that are updated
+    :param delta: the counts that are added
+    :return: the merged counts
+    """
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            counts[key] = merge_counts(counts.get(key, dict()), value)
+        else:
+            counts[key] = counts.get(key, 0) + value
+    return counts
+
+
+def sort_counts(counts: dict) -> dict:
+    return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
 
-    relation2count = dict()
-    for relation, count in query:
-        relation2count[relation] = count
 
-    return json.dumps(relation2count)
+def load_content_data(session, name):
+    data = session.query(ContentData.data).filter(ContentData.name == name).first()
+    if data is None:
+        return None
+    return json.loads(data[0])
 
 
 def update_content_data(session, name, data):
+    # the caller commits, so that all entries are updated in a single transaction
     session.execute(delete(ContentData).where(ContentData.name == name))
-    session.execute(insert(ContentData).values(name=name, data=data))
+    session.execute(insert(ContentData).values(name=name, data=json.dumps(data)))
+
+
+def compute_content_data(newer_documents=False):
+    """
+    Computes the statistics of the help and stats pages and stores them in the content data table
+    The counts are stored per insertion date of the documents (name_per_date) together with their totals (name).
+    An incremental update only recounts documents that have been inserted since the last database update and
+    replaces the counts of these dates. Hence, it can be repeated and must run before the database update date is
+    set (deleted documents are only reflected by a full update). If no counts per date have been stored yet, all
+    documents are counted.
+    :param newer_documents: only count documents that have been inserted since the last database update
+    """
+    session = SessionExtended.get()
+    inserted_since = None
+    if newer_documents:
+        inserted_since = DatabaseUpdate.get_latest_update(session)
+        logging.info(f'Only counting documents inserted since {inserted_since}')
+
+    for name, compute in CONTENT_DATA_COMPUTATIONS.items():
+        logging.info(f"Compute content data for {name}")
+        stored_date2counts = None
+        if newer_documents:
+            stored_date2counts = load_content_data(session, f"{name}_per_date")
+            if stored_date2counts is None:
+                logging.info(f'No counts per date stored for {name} - counting all documents')
+
+        if stored_date2counts is None:
+            date2counts = compute(session, inserted_since=None)
+        else:
+            date2counts = compute(session, inserted_since=inserted_since)
+            for date_inserted, counts in stored_date2counts.items():
+                if date_inserted < str(inserted_since):
+                    date2counts[date_inserted] = counts
+
+        counts = dict()
+        for date_counts in date2counts.values():
+            counts = merge_counts(counts, date_counts)
+        update_content_data(session, f"{name}_per_date", date2counts)
+        update_content_data(session, name, counts)
+
     session.commit()
+    session.remove()
+    logging.info("finished update")
 
 
-def get_content_data(name, force_update=False):
+def get_content_data(name):
     session = SessionExtended.get()
-    query = session.query(ContentData.data).filter(ContentData.name == name)
-    if force_update:
-        logging.info(f"Compute content data for {name}")
-
-        if name == "collections":
-            data = compute_publications_per_document_collection(session)
-        elif name == "entity_types":
-            data = compute_detected_entities_per_entity_type(session)
-        elif name == "relations":
-            data = compute_extracted_statements_per_relation(session)
-        else:
-            raise NotImplementedError(f"Unknown content data type: {name}")
-
-        update_content_data(session, name, data)
-        logging.info("finished update")
-    elif query.count() > 0:
-        data = json.loads(query.first()[0])
-    else:
-        data = dict()
+    data = load_content_data(session, name)
     session.remove()
+    if data is None:
+        return dict()
+    if name == "entity_types":
+        data = {entity_type: count for entity_type, count in data.items()
+                if count >= MIN_DETECTED_ENTITIES_PER_ENTITY_TYPE}
+    if name in ["collections", "entity_types", "relations"]:
+        data = sort_counts(data)
     return data
 
 
+def get_predication_stats() -> list:
+    """
+    Reads the number of extracted statements per relation and extraction type
+    :return: a list of tuples (relation, extraction_type, count)
+    """
+    results = list()
+    for relation, extraction_type2count in get_content_data("relation_extraction_types").items():
+        for extraction_type, count in extraction_type2count.items():
+            results.append((relation, extraction_type, count))
+    return results
+
+
 def update_content_information(force_update=False):
+    if force_update:
+        compute_content_data()
     content = dict()
-    content["collections"] = get_content_data("collections", force_update=force_update)
-    content["entity_types"] = get_content_data("entity_types", force_update=force_update)
-    content["relations"] = get_content_data("relations", force_update=force_update)
+    content["collections"] = get_content_data("collections")
+    content["entity_types"] = get_content_data("entity_types")
+    content["relations"] = get_content_data("relations")
     return content
 
 
-if __name__ == '__main__':
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--newer-documents", action="store_true",
+                        help="only count documents that have been inserted since the last database update")
+    args = parser.parse_args()
+
     logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
                         datefmt='%Y-%m-%d:%H:%M:%S',
                         level=logging.INFO)
 
-    update_content_information(force_update=True)
+    compute_content_data(newer_documents=args.newer_documents)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,21 +4,23 @@ import json
 import logging
 import os
 import sys
+import time
 import traceback
 from collections import defaultdict
 from datetime import datetime
 from json import JSONDecodeError
 
-from django.http import JsonResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.gzip import gzip_page
 from django.views.generic import TemplateView
-from sqlalchemy import func
 from sqlalchemy.exc import OperationalError
 
-from kgextractiontoolbox.backend.retrieve import retrieve_narrative_documents_from_database
 from narraint.backend.database import SessionExtended
-from narraint.backend.models import Predication, TagInvertedIndex, EntityKeywords, DrugDiseaseTrialPhase, \
-    DatabaseUpdate, Sentence
+from narraint.backend.document_cache import NARRATIVE_DOCUMENT_CACHE
+from narraint.backend.models import Predication, TagInvertedIndex, EntityKeywords, DatabaseUpdate, Sentence
+from narraint.backend.retrieve import iter_narrative_documents, NARRATIVE_DOCUMENT_CHUNK_SIZE
+from narraint.clinicaltrials.drug_indications import DrugIndicationIndex
 from narraint.config import FEEDBACK_REPORT_DIR, CHEMBL_ATC_TREE_FILE, MESH_DISEASE_TREE_JSON, FEEDBACK_PREDICATION_DIR, \
     FEEDBACK_SUBGROUP_DIR, LOG_DIR, FEEDBACK_CLASSIFICATION
 from narraint.frontend.entity.autocompletion import AutocompletionUtil
@@ -30,7 +32,7 @@ from narraint.frontend.filter.data_sources_filter import DataSourcesFilter
 from narraint.frontend.filter.time_filter import TimeFilter
 from narraint.frontend.filter.title_filter import TitleFilter
 from narraint.frontend.ui.search_cache import SearchCache
-from narraint.frontend.ui.service_content import update_content_information
+from narraint.frontend.ui.service_content import update_content_information, get_predication_stats
 from narraint.keywords2graph.translation import Keyword2GraphTranslation
 from narraint.queryengine.aggregation.ontology import ResultAggregationByOntology
 from narraint.queryengine.aggregation.substitution_tree import ResultTreeAggregationBySubstitution
@@ -38,7 +40,9 @@ from narraint.queryengine.engine import QueryEngine
 from narraint.queryengine.logger import QueryLogger
 from narraint.queryengine.optimizer import QueryOptimizer
 from narraint.queryengine.query import GraphQuery
-from narraint.queryengine.result import QueryDocumentResult, QueryDocumentResultList
+from narraint.queryengine.result import QueryDocumentResult, QueryDocumentResultList, QueryResultBase, \
+    iter_json_response
+from narraint.queryengine.tracing import start_trace, stop_trace, trace_span
 from narraint.ranking.corpus import DocumentCorpus
 from narraint.ranking.indexed_document import IndexedDocument
 from narraint.recommender.recommendation import RecommendationSystem
@@ -49,6 +53,12 @@ logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 DO_CACHING = True
+# per stage timings of get_query are logged and sent as Server-Timing header
+DO_TRACING = True
+# responses with at least that many document results are streamed
+STREAMING_RESPONSE_MIN_RESULTS = 10000
+# simple overview queries are answered by the precomputed substitution count table
+DO_PRECOMPUTED_SUB_COUNTS = True
 
 
 def log_stack_trace(message: str, error: Exception) -> None:
@@ -93,25 +103,22 @@ def get_document_graph(request):
         try:
             start_time = datetime.now()
             document_id = int(document_id)
-            session = SessionExtended.get()
-
-            # retrieve all document information from DB
-            narrative_documents = retrieve_narrative_documents_from_database(session, document_ids={document_id},
-                                                                             document_collection=document_collection)
+            # retrieve the indexed document (index the document to compute frequency and coverage)
+            indexed_documents = NARRATIVE_DOCUMENT_CACHE.get_documents({document_id}, document_collection,
+                                                                       kind="indexed", derive=IndexedDocument)
 
-            if len(narrative_documents) != 1:
+            if len(indexed_documents) != 1:
                 View().query_logger.write_api_call(False, "get_document_graph", str(request))
                 return JsonResponse(status=500, data=dict(reason="No document data available", nodes=[], facts=[]))
 
-            # index the document to compute frequency and coverage
-            indexed_document = IndexedDocument(narrative_documents[0])
+            indexed_document = indexed_documents[0]
             # score all edge and sort them
             sorted_extracted_statements = [(s, View().corpus.score_edge_by_tf_and_concept_idf(s, indexed_document))
                                            for s in indexed_document.extracted_statements]
             sorted_extracted_statements.sort(key=lambda x: x[1], reverse=True)
 
             sentence_ids = set(s.sentence_id for (s, _) in sorted_extracted_statements)
-            sentence_id2text = QueryEngine.query_sentences_for_sent_ids(sentence_ids)
+            sentence_id2text = QueryEngine.query_sentences_for_sent_ids(sentence_ids, document_collection)
 
             facts = defaultdict(set)
             facts2text = dict()
@@ -256,6 +263,105 @@ def get_term_to_entity(request):
         return JsonResponse(status=500, data=dict(reason="Internal server error"))
 
 
+def iter_traced_response_chunks(first_chunk: bytes, chunks, trace=None):
+    """
+    Yields the chunks of a streamed response. The chunks are encoded while the response is sent, i.e., after the
+    view has returned. Hence, the encoding time is added to the json stage of the trace here and the trace is logged
+    when the response has been sent.
+    :param first_chunk: the already encoded first chunk
+    :param chunks: an iterator over the remaining chunks
+    :param trace: the trace of the request (None if tracing is disabled)
+    :return: a generator of byte chunks
+    """
+    try:
+        yield first_chunk
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            if trace:
+                trace.add_duration("json", time.perf_counter() - start)
+            if chunk is None:
+                break
+            yield chunk
+    except Exception as e:
+        # the status and the first chunk have already been sent, so the client receives an incomplete response
+        logger.error(f'Error while streaming a response: {e}')
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        if trace:
+            View().query_logger.write_trace_log(trace)
+
+
+def create_query_result_response(data: dict, trace=None):
+    """
+    Creates a JSON response in which query results are directly encoded to bytes (without to_dict()).
+    Large results are streamed (and compressed chunk-wise by gzip_page). Their first chunk is encoded eagerly,
+    so that encoding errors are raised in the view and can still be answered by an error response.
+    :param data: the response dictionary which may contain QueryResultBase values
+    :param trace: the trace of the request (None if tracing is disabled)
+    :return: a HttpResponse or a StreamingHttpResponse
+    """
+    result_size = sum(v.get_result_size() for v in data.values() if isinstance(v, QueryResultBase))
+    chunks = iter_json_response(data)
+    if result_size >= STREAMING_RESPONSE_MIN_RESULTS:
+        first_chunk = next(chunks, b'')
+        return StreamingHttpResponse(iter_traced_response_chunks(first_chunk, chunks, trace),
+                                     content_type="application/json")
+    return HttpResponse(b''.join(chunks), content_type="application/json")
+
+
+def iter_narrative_documents_json(narrative_documents, chunk_size=65536):
+    """
+    Encodes narrative documents like JsonResponse(dict(results=[nd.to_dict(), ...])) without keeping all
+    converted documents in memory
+    :param narrative_documents: an iterable of narrative documents
+    :param chunk_size: minimum number of characters per yielded chunk
+    :return: a generator of byte chunks
+    """
+    encoder = DjangoJSONEncoder()
+    buffer, buffer_size = ['{"results": ['], 0
+    for idx, narrative_document in enumerate(narrative_documents):
+        encoded = encoder.encode(narrative_document.to_dict())
+        buffer.append(f', {encoded}' if idx > 0 else encoded)
+        buffer_size += len(encoded)
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer).encode()
+            buffer, buffer_size = [], 0
+    buffer.append(']}')
+    yield ''.join(buffer).encode()
+
+
+def create_narrative_documents_response(document_ids: set, document_collection: str):
+    """
+    Retrieves narrative documents and creates a JSON response. Small requests are served by the document cache.
+    Responses with more than a single chunk of documents bypass the cache and are streamed while the next chunks
+    are retrieved.
+    :param document_ids: a set of document ids
+    :param document_collection: the document collection
+    :return: a JsonResponse or a StreamingHttpResponse
+    """
+    if len(document_ids) <= NARRATIVE_DOCUMENT_CHUNK_SIZE:
+        narrative_documents = NARRATIVE_DOCUMENT_CACHE.get_documents(document_ids, document_collection)
+        return JsonResponse(dict(results=list([nd.to_dict() for nd in narrative_documents])))
+    narrative_documents = iter_narrative_documents(document_ids, document_collection)
+    return StreamingHttpResponse(iter_narrative_documents_json(narrative_documents), content_type="application/json")
+
+
+def finish_trace(trace, response):
+    """
+    Logs a request trace and attaches its stage durations as Server-Timing header.
+    Streamed responses are logged after they have been sent (see iter_traced_response_chunks), their header only
+    covers the time until the first chunk.
+    :param trace: the trace of the request (None if tracing is disabled)
+    :param response: the http response
+    """
+    if not trace:
+        return
+    response["Server-Timing"] = trace.to_server_timing()
+    if not response.streaming:
+        View().query_logger.write_trace_log(trace)
+
+
 def do_query_processing_with_caching(graph_query: GraphQuery, document_collections: set):
     cache_hit = False
     cached_results = None
@@ -263,7 +369,8 @@ def do_query_processing_with_caching(graph_query: GraphQuery, document_collectio
     collection_string = "-".join(sorted(document_collections))
     if DO_CACHING:
         try:
-            cached_results = View().cache.load_result_from_cache(collection_string, graph_query)
+            with trace_span("cache_load"):
+                cached_results = View().cache.load_result_from_cache(collection_string, graph_query)
             cache_hit = True
         except Exception as e:
             message = 'Cannot load query result from cache...'
@@ -275,13 +382,14 @@ def do_query_processing_with_caching(graph_query: GraphQuery, document_collectio
         results = cached_results
     else:
         # run query
-        results = QueryEngine.process_query_with_expansion(graph_query,
-                                                           document_collection_filter=document_collections)
+        with trace_span("engine"):
+            results = QueryEngine.process_query_with_expansion(graph_query,
+                                                               document_collection_filter=document_collections)
         cache_hit = False
         if DO_CACHING:
             try:
-
-                View().cache.add_result_to_cache(collection_string, graph_query, results)
+                with trace_span("cache_store"):
+                    View().cache.add_result_to_cache(collection_string, graph_query, results)
             except Exception as e:
                 message = 'Cannot store query result to cache...'
                 log_stack_trace(message, e)
@@ -316,13 +424,11 @@ def get_query_narrative_documents(request):
         results, _, _ = do_query_processing_with_caching(graph_query, {document_collection})
         result_ids = {r.document_id for r in results}
         # get narrative documents
-        session = SessionExtended.get()
-        narrative_documents = retrieve_narrative_documents_from_database(session, document_ids=result_ids,
-                                                                         document_collection=document_collection)
+        response = create_narrative_documents_response(result_ids, document_collection)
 
         View().query_logger.write_api_call(True, "get_query_narrative_documents", str(request),
                                            time_needed=datetime.now() - time_start)
-        return JsonResponse(dict(results=list([nd.to_dict() for nd in narrative_documents])))
+        return response
     except Exception:
         View().query_logger.write_api_call(False, "get_query_narrative_documents", str(request))
         return JsonResponse(status=500, data=dict(answer="Internal server error"))
@@ -390,13 +496,11 @@ def get_narrative_documents(request):
     try:
         time_start = datetime.now()
         # get narrative documents
-        session = SessionExtended.get()
-        narrative_documents = retrieve_narrative_documents_from_database(session, document_ids=document_ids,
-                                                                         document_collection=document_collection)
+        response = create_narrative_documents_response(document_ids, document_collection)
 
         View().query_logger.write_api_call(True, "get_narrative_document", str(request),
                                            time_needed=datetime.now() - time_start)
-        return JsonResponse(dict(results=list([nd.to_dict() for nd in narrative_documents])))
+        return response
     except Exception as e:
         logger.error(f"get_narrative_document: {e}")
         traceback.print_exc()
@@ -426,26 +530,38 @@ def get_query_sub_count_with_caching(graph_query: GraphQuery, document_collectio
             message  = 'Cannot load query result from cache...'
             log_stack_trace(message, e)
     if not cached_sub_count_list:
-        # run query
-        # compute the query and do not load metadata (not required)
-        results = QueryEngine.process_query_with_expansion(graph_query,
-                                                           document_collection_filter={document_collection},
-                                                           load_document_metadata=False)
-
-        # next get the aggregation by var names
-        substitution_aggregation = ResultTreeAggregationBySubstitution()
-        results_ranked, is_aggregate = substitution_aggregation.rank_results(results, freq_sort_desc=True)
-
-        # generate a list of [(ent_id, ent_name, doc_count), ...]
-        sub_count_list = list()
-        # go through all aggregated results
-        for aggregate in results_ranked.results:
-            var2sub = aggregate.var2substitution
-            # get the first substitution
-            var_name, sub = next(iter(var2sub.items()))
-            sub_count_list.append(dict(id=sub.entity_id,
-                                       name=sub.entity_name,
-                                       count=aggregate.get_result_size()))
+        sub_counts = None
+        if DO_PRECOMPUTED_SUB_COUNTS:
+            try:
+                sub_counts = QueryEngine.query_substitution_counts(graph_query, document_collection)
+            except Exception as e:
+                message = 'Cannot load precomputed substitution counts...'
+                log_stack_trace(message, e)
+
+        if sub_counts is not None:
+            logging.info(f'Sub Count loaded from precomputed counts - {len(sub_counts)} results')
+            sub_count_list = [dict(id=sub.entity_id, name=sub.entity_name, count=count) for sub, count in sub_counts]
+        else:
+            # run query
+            # compute the query and do not load metadata (not required)
+            results = QueryEngine.process_query_with_expansion(graph_query,
+                                                               document_collection_filter={document_collection},
+                                                               load_document_metadata=False)
+
+            # next get the aggregation by var names
+            substitution_aggregation = ResultTreeAggregationBySubstitution()
+            results_ranked, is_aggregate = substitution_aggregation.rank_results(results, freq_sort_desc=True)
+
+            # generate a list of [(ent_id, ent_name, doc_count), ...]
+            sub_count_list = list()
+            # go through all aggregated results
+            for aggregate in results_ranked.results:
+                var2sub = aggregate.var2substitution
+                # get the first substitution
+                var_name, sub = next(iter(var2sub.items()))
+                sub_count_list.append(dict(id=sub.entity_id,
+                                           name=sub.entity_name,
+                                           count=aggregate.get_result_size()))
 
         if DO_CACHING:
             try:
@@ -561,6 +677,7 @@ def get_query(request):
         View().query_logger.write_api_call(False, "get_query", str(request))
         return JsonResponse(status=500, data=dict(reason="data_source parameter is missing"))
 
+    trace = start_trace("get_query") if DO_TRACING else None
     try:
         query = str(request.GET.get("query", "").strip())
         data_source_str = str(request.GET.get("data_source", "").strip())
@@ -639,8 +756,9 @@ def get_query(request):
         logging.info('Strategy for outer ranking: {}'.format(outer_ranking))
         # logging.info('Strategy for inner ranking: {}'.format(inner_ranking))
         time_start = datetime.now()
-        graph_query, query_trans_string = View().translation.convert_query_text_to_fact_patterns(
-            query)
+        with trace_span("translation"):
+            graph_query, query_trans_string = View().translation.convert_query_text_to_fact_patterns(
+                query)
         year_aggregation = {}
 
         if not all(ds in DataSourcesFilter.get_available_db_collections() for ds in document_collections):
@@ -670,36 +788,44 @@ def get_query(request):
                                                 len(result_ids),
                                                 query, opt_query)
 
-            results = TitleFilter.filter_documents(results, title_filter)
+            with trace_span("filters"):
+                results = TitleFilter.filter_documents(results, title_filter)
 
-            if classification_filter:
-                logging.debug(f'Filtering document classifications with {classification_filter}...')
-                results = ClassificationFilter.filter_documents(results, document_classes=classification_filter)
+                if classification_filter:
+                    logging.debug(f'Filtering document classifications with {classification_filter}...')
+                    results = ClassificationFilter.filter_documents(results, document_classes=classification_filter)
 
-            year_aggregation = TimeFilter.aggregate_years(results)
-            results = TimeFilter.filter_documents_by_year(results, year_start, year_end)
+                year_aggregation = TimeFilter.aggregate_years(results)
+                results = TimeFilter.filter_documents_by_year(results, year_start, year_end)
 
             results_converted = []
             if outer_ranking == 'outer_ranking_substitution':
                 substitution_aggregation = ResultTreeAggregationBySubstitution()
                 sorted_var_names = graph_query.get_var_names_in_order()
-                results_ranked, is_aggregate = substitution_aggregation.rank_results(results, sorted_var_names,
-                                                                                     freq_sort_desc, year_sort_desc,
-                                                                                     start_pos, end_pos)
-                results_converted = results_ranked.to_dict()
+                with trace_span("aggregation"):
+                    results_ranked, is_aggregate = substitution_aggregation.rank_results(results, sorted_var_names,
+                                                                                         freq_sort_desc,
+                                                                                         year_sort_desc,
+                                                                                         start_pos, end_pos)
+                # results are directly encoded to json bytes (see create_query_result_response)
+                results_converted = results_ranked
             elif outer_ranking == 'outer_ranking_ontology':
                 substitution_ontology = ResultAggregationByOntology()
-                results_ranked, is_aggregate = substitution_ontology.rank_results(results, freq_sort_desc,
-                                                                                  year_sort_desc)
-                results_converted = results_ranked.to_dict()
+                with trace_span("aggregation"):
+                    results_ranked, is_aggregate = substitution_ontology.rank_results(results, freq_sort_desc,
+                                                                                      year_sort_desc)
+                results_converted = results_ranked
 
         View().query_logger.write_api_call(True, "get_query", str(request),
                                            time_needed=datetime.now() - time_start)
 
-        return JsonResponse(
-            dict(valid_query=valid_query, is_aggregate=is_aggregate, results=results_converted,
-                 query_translation=query_trans_string, year_aggregation=year_aggregation,
-                 query_limit_hit="False"))
+        with trace_span("json"):
+            response = create_query_result_response(
+                dict(valid_query=valid_query, is_aggregate=is_aggregate, results=results_converted,
+                     query_translation=query_trans_string, year_aggregation=year_aggregation,
+                     query_limit_hit="False"), trace)
+        finish_trace(trace, response)
+        return response
     except Exception:
         View().query_logger.write_api_call(False, "get_query", str(request))
         query_trans_string = "keyword query cannot be converted (syntax error)"
@@ -707,6 +833,8 @@ def get_query(request):
         return JsonResponse(
             dict(valid_query="", results=[], query_translation=query_trans_string, year_aggregation="",
                  query_limit_hit="False"))
+    finally:
+        stop_trace()
 
 
 def get_provenance(request):
@@ -1252,28 +1380,19 @@ def get_logs_data(request):
 
 class StatsView(TemplateView):
     template_name = "ui/stats.html"
-    stats_query_results = None
 
     def get(self, request, *args, **kwargs):
         View().query_logger.write_page_view_log(StatsView.template_name)
         if request.is_ajax():
             if "query" in request.GET:
-                if not StatsView.stats_query_results:
-                    session = SessionExtended.get()
-                    try:
-                        logging.info('Processing database statistics...')
-                        query = session.query(Predication.relation, Predication.extraction_type,
-                                              func.count(Predication.relation)). \
-                            group_by(Predication.relation).group_by(Predication.extraction_type).all()
-                        results = list()
-                        for r in query:
-                            results.append((r[0], r[1], r[2]))
-                        StatsView.stats_query_results = results
-                    except:
-                        traceback.print_exc(file=sys.stdout)
-                    session.close()
+                # the statistics are precomputed by the update pipeline (see service_content)
+                try:
+                    results = get_predication_stats()
+                except Exception:
+                    results = None
+                    traceback.print_exc(file=sys.stdout)
                 return JsonResponse(
-                    dict(results=StatsView.stats_query_results)
+                    dict(results=results)
                 )
         return super().get(request, *args, **kwargs)
 
@@ -1383,16 +1502,8 @@ def get_clinical_trial_phases(request):
             return HttpResponse(status=500)
 
         time_start = datetime.now()
-        session = SessionExtended.get()
         try:
-            q = session.query(DrugDiseaseTrialPhase)
-            q = q.filter(DrugDiseaseTrialPhase.drug == chembl_id)
-
-            drug_indications = []
-
-            for row in q:
-                drug_indications.append(dict(mesh_id=row.disease, max_phase_for_ind=row.phase))
-
+            drug_indications = DrugIndicationIndex().get_indications(chembl_id)
             View().query_logger.write_api_call(True, "clinical_trial_phases", str(request),
                                                time_needed=datetime.now() - time_start)
             return JsonResponse(status=200, data=dict(drug_indications=drug_indications))
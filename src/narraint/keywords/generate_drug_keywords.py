@@ -1,126 +1,9 @@
-import ast
+import argparse
 import logging
-import random
-from typing import List, Dict
 
-import sqlalchemy
-from nltk.stem.porter import PorterStemmer
-from sqlalchemy import and_
-from yake import KeywordExtractor
-
-from kgextractiontoolbox.backend.models import Document
-from kgextractiontoolbox.progress import Progress
-from narraint.backend.database import SessionExtended
-from narraint.backend.models import TagInvertedIndex, EntityKeywords
-from narraint.config import DRUG_KEYWORD_STOPWORD_LIST
-from narrant.entity.entityresolver import EntityResolver
-
-# used to switch between table access and debugging console logging.infos
+from narraint.keywords.generate_keywords import generate_entity_keywords, KEYWORD_SAMPLE_SIZE
 from narrant.entitylinking.enttypes import DRUG
 
-ACCESS_ENTITY_KEYWORDS_TABLE = True
-
-MAX_NGRAM_WORD_SIZE = 1
-NUM_KEYWORDS = 25
-
-extractor = KeywordExtractor(n=MAX_NGRAM_WORD_SIZE, top=NUM_KEYWORDS, dedupLim=0.9, dedupFunc="jaro")
-stemmer = PorterStemmer()
-
-
-def generate_stem_dict(text: str) -> Dict[str, str]:
-    """
-    Generates a dict containing a pair of the word stem and the shortest word
-    which results the corresponding stem.
-
-    :param text: string to evaluate
-    :return: dict with stem - word combination
-    """
-    stem_dict = dict()
-
-    # remove all unwanted chars
-    mapping = text.maketrans('', '', ',.!?":\'*+')
-    text = text.translate(mapping)
-
-    for word in set(text.split(' ')):
-        temp = stemmer.stem(word)
-        if temp in stem_dict.keys():
-            if len(stem_dict[temp]) > len(word):
-                stem_dict[temp] = word
-            continue
-        stem_dict[temp] = word
-
-    return stem_dict
-
-
-def generate_keywords(text: str, entity_name: str, stem_dict: dict) -> str:
-    """
-    Generates a list of keywords and normalizes the score to a value between 1
-    and 8 for HTML style purposes.
-
-    :param text: string from which the keywords are extracted
-    :param entity_name: name of the current entity to ignore it as a key
-    :param stem_dict: dictionary word stem with the shortest stemmed word
-    :return: JSON-style list as a string containing 20 keywords
-    """
-    # raw_keywords [(ngram: str, score: float)]
-    raw_keywords = extractor.extract_keywords(text)
-    keyword_map = list()
-    keywords = set()
-    normalized_keywords = list()
-    try:
-        for keyword, score in raw_keywords:
-            # ignore already known keywords
-            if keyword in keywords:
-                continue
-            # ignore the key if it is part of the entity_name
-            if entity_name.lower().find(keyword.lower()) >= 0 \
-                    or entity_name.lower() == keyword.lower():
-                continue
-            # replace keywords with the most likely stem
-            stem = stemmer.stem(keyword)
-            if stem in stem_dict.keys():
-                if len(stem) + 1 == len(stem_dict[stem]) \
-                        and stem_dict[stem][-1] == 's' \
-                        and stem not in keywords:
-                    keyword_map.append((stem, score))
-                    keywords.add(stem)
-                elif stem_dict[stem] not in keywords:
-                    keyword_map.append((stem_dict[stem], score))
-                    keywords.add(stem_dict[stem])
-            else:
-                keyword_map.append((keyword, score))
-                keywords.add(keyword)
-
-        # use the 20 first highest valued keys
-        if len(keyword_map) > 20:
-            keyword_map = keyword_map[:20]
-
-        # normalize data for better html visualizations
-        minimum = keyword_map[0][1]
-        denominator = keyword_map[-1][1] - keyword_map[0][1]  # max - min
-
-        for obj in keyword_map:
-            #  inverted normalized scores (1-8) for text size
-            #  lower value means higher relevance (-> inverted)
-            normalized_keywords.append({obj[0]: 8 - int(((obj[1] - minimum) /
-                                                         denominator) * 7)})
-
-    finally:
-        return str(normalized_keywords)
-
-
-def set_stopword_list():
-    try:
-        with open(DRUG_KEYWORD_STOPWORD_LIST, "r") as file:
-            stopwords = set([word.strip() for word in file.readlines()])
-            # add all lower case versions
-            stopwords.update(set(w.lower() for w in stopwords))
-            extractor.stopword_set.update(stopwords)
-            file.close()
-            logging.info(f"Created stopword list with {len(stopwords)} entries")
-    except IOError as e:
-        logging.warning("Could not read stopword list. Using YAKE's default wordlist.")
-
 
 def main():
     """
@@ -134,83 +17,11 @@ def main():
     logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
                         datefmt='%Y-%m-%d:%H:%M:%S',
                         level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
 
-    entity_type = DRUG
-    document_collection = "PubMed"
-
-    set_stopword_list()
-
-    session = SessionExtended.get()
-
-    if ACCESS_ENTITY_KEYWORDS_TABLE:
-        # remove all previously stored drug keywords
-        q = session.query(EntityKeywords)
-        q = q.filter(EntityKeywords.entity_type == DRUG)
-        q = q.delete()
-        logging.info(f"{q} previously stored DRUG keywords deleted")
-        session.commit()
-
-    # query all existing drug entities
-    q = session.query(TagInvertedIndex.entity_id)
-    q = q.filter(TagInvertedIndex.entity_type == entity_type)
-    q = q.distinct()
-
-    drugs: List[sqlalchemy.engine.row.Row] = q.all()  # first()#
-    if drugs:
-        logging.info(f"Creating keywords for {len(drugs)} drugs")
-    else:
-        logging.info("Could not retrieve drug ids. Exiting.")
-        return
-
-    p = Progress(total=len(drugs))
-    p.start_time()
-
-    skipped_drugs = 0
-    for i in range(len(drugs)):  # range(10):#
-        # retrieve all document_ids for one drug
-        entity_id = dict(drugs[i])["entity_id"]
-        q = session.query(TagInvertedIndex.document_ids)
-        q = q.filter(TagInvertedIndex.document_collection == document_collection)
-        q = q.filter(TagInvertedIndex.entity_id == entity_id)
-        q = q.filter(TagInvertedIndex.entity_type == entity_type)
-        doc_ids = q.first()
-
-        # choose up to 100 random document_ids out of all available documents to prepare the sample text
-        if doc_ids:
-            document_ids = ast.literal_eval(doc_ids[0])
-            num_abstracts = 100 if len(document_ids) >= 100 else len(document_ids)
-
-            document_ids = set(random.sample(document_ids, num_abstracts))  # random num_abstracts elements
-        else:
-            skipped_drugs += 1
-            continue
-
-        # query document abstract
-        doc_query = session.query(Document.abstract).filter(and_(Document.id.in_(document_ids),
-                                                                 Document.collection == document_collection))
-        text = []
-
-        for res in doc_query:
-            text.append(res[0])
-
-        text = " ".join([t for t in text])
-        entity_name = EntityResolver().get_name_for_var_ent_id(entity_id, entity_type)
-        stem_dict = generate_stem_dict(text)
-        keywords = generate_keywords(text, entity_name, stem_dict)
-        if keywords == "[]":
-            skipped_drugs += 1
-            continue
-
-        if ACCESS_ENTITY_KEYWORDS_TABLE:
-            EntityKeywords.insert_entity_keyword_data(session, entity_id, entity_type, str(keywords))
-        else:
-            logging.info("\n", i, entity_name, keywords)
-
-        p.print_progress(i + 1)
-
-    session.remove()
-    p.done()
-    logging.info(f"Skipped {skipped_drugs} drugs.")
+    generate_entity_keywords(DRUG, sample_size=KEYWORD_SAMPLE_SIZE, workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,311 @@
+import argparse
+import logging
+import multiprocessing
+import random
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from nltk.stem.porter import PorterStemmer
+from yake import KeywordExtractor
+
+from kgextractiontoolbox.backend.models import Document
+from kgextractiontoolbox.progress import Progress
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import TagInvertedIndex, EntityKeywords
+from narraint.backend.posting_list import sample_document_ids
+from narraint.config import DRUG_KEYWORD_STOPWORD_LIST, BULK_INSERT_AFTER_K
+from narrant.entity.entityresolver import EntityResolver
+
+MAX_NGRAM_WORD_SIZE = 1
+NUM_KEYWORDS = 25
+
+extractor = KeywordExtractor(n=MAX_NGRAM_WORD_SIZE, top=NUM_KEYWORDS, dedupLim=0.9, dedupFunc="jaro")
+stemmer = PorterStemmer()
+
+
+def generate_stem_dict(text: str) -> Dict[str, str]:
+    """
+    Generates a dict containing a pair of the word stem and the shortest word
+    which results the corresponding stem.
+
+    :param text: string to evaluate
+    :return: dict with stem - word combination
+    """
+    stem_dict = dict()
+
+    # remove all unwanted chars
+    mapping = text.maketrans('', '', ',.!?":\'*+')
+    text = text.translate(mapping)
+
+    for word in set(text.split(' ')):
+        temp = stemmer.stem(word)
+        if temp in stem_dict.keys():
+            if len(stem_dict[temp]) > len(word):
+                stem_dict[temp] = word
+            continue
+        stem_dict[temp] = word
+
+    return stem_dict
+
+
+def generate_keywords(text: str, entity_name: str, stem_dict: dict) -> str:
+    """
+    Generates a list of keywords and normalizes the score to a value between 1
+    and 8 for HTML style purposes.
+
+    :param text: string from which the keywords are extracted
+    :param entity_name: name of the current entity to ignore it as a key
+    :param stem_dict: dictionary word stem with the shortest stemmed word
+    :return: JSON-style list as a string containing 20 keywords
+    """
+    # raw_keywords [(ngram: str, score: float)]
+    raw_keywords = extractor.extract_keywords(text)
+    keyword_map = list()
+    keywords = set()
+    normalized_keywords = list()
+    try:
+        for keyword, score in raw_keywords:
+            # ignore already known keywords
+            if keyword in keywords:
+                continue
+            # ignore the key if it is part of the entity_name
+            if entity_name.lower().find(keyword.lower()) >= 0 \
+                    or entity_name.lower() == keyword.lower():
+                continue
+            # replace keywords with the most likely stem
+            stem = stemmer.stem(keyword)
+            if stem in stem_dict.keys():
+                if len(stem) + 1 == len(stem_dict[stem]) \
+                        and stem_dict[stem][-1] == 's' \
+                        and stem not in keywords:
+                    keyword_map.append((stem, score))
+                    keywords.add(stem)
+                elif stem_dict[stem] not in keywords:
+                    keyword_map.append((stem_dict[stem], score))
+                    keywords.add(stem_dict[stem])
+            else:
+                keyword_map.append((keyword, score))
+                keywords.add(keyword)
+
+        # use the 20 first highest valued keys
+        if len(keyword_map) > 20:
+            keyword_map = keyword_map[:20]
+
+        # normalize data for better html visualizations
+        minimum = keyword_map[0][1]
+        denominator = keyword_map[-1][1] - keyword_map[0][1]  # max - min
+
+        for obj in keyword_map:
+            #  inverted normalized scores (1-8) for text size
+            #  lower value means higher relevance (-> inverted)
+            normalized_keywords.append({obj[0]: 8 - int(((obj[1] - minimum) /
+                                                         denominator) * 7)})
+
+    finally:
+        return str(normalized_keywords)
+
+
+def set_stopword_list():
+    try:
+        with open(DRUG_KEYWORD_STOPWORD_LIST, "r") as file:
+            stopwords = set([word.strip() for word in file.readlines()])
+            # add all lower case versions
+            stopwords.update(set(w.lower() for w in stopwords))
+            extractor.stopword_set.update(stopwords)
+            file.close()
+            logging.info(f"Created stopword list with {len(stopwords)} entries")
+    except IOError as e:
+        logging.warning("Could not read stopword list. Using YAKE's default wordlist.")
+
+
+# number of abstracts that are sampled per entity
+KEYWORD_SAMPLE_SIZE = 100
+# seed for the sampling of abstracts (each entity derives its own random generator from it)
+KEYWORD_SAMPLE_SEED = 42
+# number of entities whose abstracts are retrieved at once
+KEYWORD_ENTITY_BATCH_SIZE = 200
+# number of document ids per abstract query
+KEYWORD_DOCUMENT_QUERY_CHUNK_SIZE = 10000
+
+
+def get_entity_random(seed: int, entity_type: str, entity_id: str) -> random.Random:
+    """
+    Creates a random generator per entity, so that the sample of an entity does not depend on the order
+    in which entities are processed
+    :param seed: the sampling seed
+    :param entity_type: the entity type
+    :param entity_id: the entity id
+    :return: a seeded random generator
+    """
+    return random.Random(f'{seed}:{entity_type}:{entity_id}')
+
+
+def query_entity_ids(session, entity_type: str, document_collection: str) -> List[str]:
+    q = session.query(TagInvertedIndex.entity_id)
+    q = q.filter(TagInvertedIndex.entity_type == entity_type)
+    q = q.filter(TagInvertedIndex.document_collection == document_collection)
+    return sorted(r[0] for r in q.distinct())
+
+
+def load_sample_texts(session, entity_ids: List[str], entity_type: str, document_collection: str,
+                      sample_size: int, seed: int) -> Dict[str, str]:
+    """
+    Retrieves the posting lists of several entities and the abstracts of their sampled documents in bulk
+    :param session: the database session
+    :param entity_ids: a list of entity ids
+    :param entity_type: the entity type
+    :param document_collection: the document collection
+    :param sample_size: the number of sampled abstracts per entity
+    :param seed: the sampling seed
+    :return: a dict mapping each entity id (with documents) to the concatenated sampled abstracts
+    """
+    q = session.query(TagInvertedIndex.entity_id, TagInvertedIndex.document_ids)
+    q = q.filter(TagInvertedIndex.entity_type == entity_type)
+    q = q.filter(TagInvertedIndex.document_collection == document_collection)
+    q = q.filter(TagInvertedIndex.entity_id.in_(entity_ids))
+    entity2document_ids = {}
+    for entity_id, document_ids_str in q:
+        rng = get_entity_random(seed, entity_type, entity_id)
+        entity2document_ids[entity_id] = sample_document_ids(document_ids_str, sample_size, rng)
+
+    document_ids = sorted(set().union(*entity2document_ids.values()))
+    id2abstract = {}
+    for idx in range(0, len(document_ids), KEYWORD_DOCUMENT_QUERY_CHUNK_SIZE):
+        chunk = document_ids[idx:idx + KEYWORD_DOCUMENT_QUERY_CHUNK_SIZE]
+        q = session.query(Document.id, Document.abstract)
+        q = q.filter(Document.collection == document_collection)
+        q = q.filter(Document.id.in_(chunk))
+        for document_id, abstract in q:
+            if abstract:
+                id2abstract[document_id] = abstract
+
+    return {entity_id: " ".join(id2abstract[d] for d in doc_ids if d in id2abstract)
+            for entity_id, doc_ids in entity2document_ids.items()}
+
+
+def extract_entity_keywords(task: Tuple[str, str, str]) -> Tuple[str, str]:
+    """
+    Extracts the keywords of a single entity (executed by worker processes)
+    :param task: a tuple (entity id, entity name, text)
+    :return: a tuple (entity id, keywords)
+    """
+    entity_id, entity_name, text = task
+    return entity_id, generate_keywords(text, entity_name, generate_stem_dict(text))
+
+
+def generate_entity_keywords(entity_type: str, entity_ids: List[str] = None, document_collection: str = "PubMed",
+                             sample_size: int = KEYWORD_SAMPLE_SIZE, seed: int = KEYWORD_SAMPLE_SEED,
+                             workers: int = 1, batch_size: int = KEYWORD_ENTITY_BATCH_SIZE):
+    """
+    Generates the keyword clouds of entities and replaces their stored keywords.
+    Posting lists and abstracts are retrieved in batches of entities. The keyword extraction of a batch runs in
+    worker processes while the abstracts of the next batch are retrieved.
+    :param entity_type: the entity type
+    :param entity_ids: only generate keywords for these entities (all entities of the type if None)
+    :param document_collection: the document collection from which abstracts are sampled
+    :param sample_size: the number of sampled abstracts per entity
+    :param seed: the sampling seed
+    :param workers: the number of worker processes
+    :param batch_size: the number of entities per batch
+    :return: None
+    """
+    start_time = datetime.now()
+    set_stopword_list()
+    session = SessionExtended.get()
+
+    # remove all previously stored keywords
+    q = session.query(EntityKeywords)
+    q = q.filter(EntityKeywords.entity_type == entity_type)
+    if entity_ids:
+        q = q.filter(EntityKeywords.entity_id.in_(entity_ids))
+    q = q.delete(synchronize_session=False)
+    logging.info(f"{q} previously stored {entity_type} keywords deleted")
+    session.commit()
+
+    if not entity_ids:
+        entity_ids = query_entity_ids(session, entity_type, document_collection)
+    if not entity_ids:
+        logging.info(f"Could not retrieve {entity_type} ids. Exiting.")
+        return
+    logging.info(f"Creating keywords for {len(entity_ids)} entities ({entity_type}) with {workers} workers")
+
+    entity_resolver = EntityResolver()
+    batches = [entity_ids[i:i + batch_size] for i in range(0, len(entity_ids), batch_size)]
+
+    def load_tasks(batch):
+        entity2text = load_sample_texts(session, batch, entity_type, document_collection, sample_size, seed)
+        return [(entity_id, entity_resolver.get_name_for_var_ent_id(entity_id, entity_type), text)
+                for entity_id, text in entity2text.items()]
+
+    insert_list = []
+    stats = dict(processed=0, inserted=0)
+    p = Progress(total=len(entity_ids), text="Generating keyword clouds...")
+    p.start_time()
+
+    def store_results(batch, results):
+        for entity_id, keywords in results:
+            if keywords == "[]":
+                continue
+            insert_list.append(dict(entity_id=entity_id, entity_type=entity_type, keyword_data=keywords))
+        if len(insert_list) >= BULK_INSERT_AFTER_K:
+            stats["inserted"] += len(insert_list)
+            EntityKeywords.bulk_insert_values_into_table(session, insert_list, check_constraints=False, commit=False)
+            insert_list.clear()
+        stats["processed"] += len(batch)
+        p.print_progress(stats["processed"])
+
+    if workers > 1:
+        # forked workers must not share pooled connections of the parent process
+        session.remove()
+        session.get_bind().dispose()
+        with multiprocessing.Pool(workers, initializer=set_stopword_list) as pool:
+            pending_batch, pending_results = None, None
+            for batch in batches:
+                # abstracts of this batch are retrieved while the workers process the previous batch
+                tasks = load_tasks(batch)
+                if pending_batch:
+                    store_results(pending_batch, pending_results.get())
+                pending_batch, pending_results = batch, pool.map_async(extract_entity_keywords, tasks)
+            if pending_batch:
+                store_results(pending_batch, pending_results.get())
+    else:
+        for batch in batches:
+            store_results(batch, map(extract_entity_keywords, load_tasks(batch)))
+
+    if insert_list:
+        stats["inserted"] += len(insert_list)
+        EntityKeywords.bulk_insert_values_into_table(session, insert_list, check_constraints=False, commit=False)
+    session.commit()
+    session.remove()
+    p.done()
+    logging.info(f"Stored keywords for {stats['inserted']} entities "
+                 f"(skipped {len(entity_ids) - stats['inserted']}). Took me {datetime.now() - start_time}")
+
+
+def main():
+    """
+    Generates for each entity of a type a JSON list of keywords stored as a string in the corresponding table
+    (entity_keywords). Up to --sample-size random abstracts are concatenated to create a pseudo random information
+    base about each entity.
+
+    :return: None
+    """
+    logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("entity_type", help="The entity type (e.g. Drug or Disease)")
+    parser.add_argument("--ids", nargs="*", default=None, help="Only generate keywords for these entity ids")
+    parser.add_argument("--collection", default="PubMed", help="The document collection to sample abstracts from")
+    parser.add_argument("--sample-size", type=int, default=KEYWORD_SAMPLE_SIZE,
+                        help="Number of sampled abstracts per entity")
+    parser.add_argument("--seed", type=int, default=KEYWORD_SAMPLE_SEED, help="Seed for the sampling of abstracts")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+
+    generate_entity_keywords(args.entity_type, entity_ids=args.ids, document_collection=args.collection,
+                             sample_size=args.sample_size, seed=args.seed, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
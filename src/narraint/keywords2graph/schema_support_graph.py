@@ -1,13 +1,16 @@
 import argparse
 import itertools
 import logging
-from typing import Dict, Tuple, Any
+import multiprocessing
+from collections import defaultdict
+from typing import Dict
 
 from sqlalchemy import delete
 
-from kgextractiontoolbox.progress import Progress
 from narraint.backend.database import SessionExtended
-from narraint.backend.models import Predication, Tag, SchemaSupportGraphInfo, BULK_QUERY_CURSOR_COUNT_DEFAULT
+from narraint.backend.models import Predication, Tag, SchemaSupportGraphInfo, BULK_QUERY_CURSOR_COUNT_DEFAULT, \
+    Document
+from narraint.config import QUERY_YIELD_PER_K
 
 CO_OCCURRENCE_RELATION = 'co_occurred'
 
@@ -19,6 +22,7 @@ class SchemaSupportGraph:
         if cls.__instance is None:
             cls.__instance = super().__new__(cls)
             cls.__instance.spo2support = {}
+            cls.__instance.so2relations = {}
             cls.__instance.relations = set()
             cls.__instance.entity_types = set()
             cls.__instance.load_schema_graph_from_db()
@@ -31,12 +35,21 @@ class SchemaSupportGraph:
         """
         logging.info('Loading schema graph info from DB...')
         session = SessionExtended.get()
+        self.spo2support.clear()
+        self.so2relations.clear()
+        self.relations.clear()
+        self.entity_types.clear()
 
         query = session.query(SchemaSupportGraphInfo)
         for row in query:
             key = (row.subject_type, row.relation, row.object_type)
             self.spo2support[key] = row.support
-            self.relations = row.relation
+            # index relations by (s, o) to avoid scanning all spo entries per lookup
+            so_key = (row.subject_type, row.object_type)
+            if so_key not in self.so2relations:
+                self.so2relations[so_key] = {}
+            self.so2relations[so_key][row.relation] = row.support
+            self.relations.add(row.relation)
             self.entity_types.add(row.subject_type)
             self.entity_types.add(row.object_type)
 
@@ -62,137 +75,133 @@ class SchemaSupportGraph:
         :param object_type: the object entity type
         :return: a dict mapping possible relations between (s, o) to their support values
         """
-        relation2frequency = {}
-        for (s, p, o), support in self.spo2support.items():
-            if s == subject_type and o == object_type:
-                relation2frequency[p] = support
-        return relation2frequency
+        # return a copy because callers are allowed to modify the dict
+        return dict(self.so2relations.get((subject_type, object_type), {}))
 
     @staticmethod
-    def compute_graph_for_predications():
+    def compute_graph_for_predications(document_collection: str):
         """
-        Computes the graph schema info based on the Predication table
-        Iterates over (collection, docid, subject_type, relation, object_type) tuples
+        Computes the graph schema info based on the Predication table of a document collection
+        Streams over (docid, subject_type, relation, object_type) tuples ordered by document in a single pass
         Counts how many documents support a certain (s, p, o) tuple
+        :param document_collection: the document collection
         :return: a dict mapping (s, p, o) tuples to their support values (int)
         """
         session = SessionExtended.get()
-        logging.info('Counting predication entries...')
-        p_count_query = session.query(Predication.document_collection, Predication.document_id,
-                                      Predication.subject_type, Predication.relation, Predication.object_type)
-
-        p_count_query = p_count_query.distinct()
-        p_count = p_count_query.count()
-        logging.info(f'Iterating over {p_count} predication table entries...')
-        pred_query = session.query(Predication.document_collection, Predication.document_id,
+        logging.info(f'Iterating over predications of collection {document_collection}...')
+        pred_query = session.query(Predication.document_id,
                                    Predication.subject_type, Predication.relation, Predication.object_type)
-
-        # Sort is important here to support the work with a buffer
-        pred_query = pred_query.order_by(Predication.subject_type, Predication.relation, Predication.object_type)
-
-        # Distinct to minimize the overhead
-        pred_query = pred_query.distinct()
-
+        pred_query = pred_query.filter(Predication.document_collection == document_collection)
+        # Sort is important here: all spo tuples of a document are processed together
+        pred_query = pred_query.order_by(Predication.document_id)
         pred_query = pred_query.yield_per(BULK_QUERY_CURSOR_COUNT_DEFAULT * 10)
 
-        progress = Progress(total=p_count, print_every=1000, text="Iterating over predications")
-        progress.start_time()
-
-        # Find the support for every spo combination
-        spo2support = {}
-        # Buffer things
-        doc_buffer = set()
-        last_spo_key = None
+        # Each document supports each of its spo tuples exactly once
+        spo2support = defaultdict(int)
+        doc_spo_keys = set()
+        last_doc_id = None
         for idx, r in enumerate(pred_query):
-            progress.print_progress(idx)
+            if idx > 0 and idx % QUERY_YIELD_PER_K == 0:
+                logging.info(f'{idx} predications of collection {document_collection} processed')
 
-            spo_key = (r.subject_type, r.relation, r.object_type)
-            if idx == 0:
-                last_spo_key = spo_key
+            if r.document_id != last_doc_id:
+                for spo_key in doc_spo_keys:
+                    spo2support[spo_key] += 1
+                doc_spo_keys.clear()
+                last_doc_id = r.document_id
 
-            if spo_key != last_spo_key:
-                # We found a new spo key, so store the old one
-                spo2support[last_spo_key] = len(doc_buffer)
-                doc_buffer.clear()
+            doc_spo_keys.add((r.subject_type, r.relation, r.object_type))
 
-            # Add the current document to the next buffer
-            last_spo_key = spo_key
-            doc_key = (r.document_collection, r.document_id)
-            doc_buffer.add(doc_key)
-
-        # Insert last values
-        if len(doc_buffer) > 0:
-            spo2support[last_spo_key] = len(doc_buffer)
+        # Add last remaining values
+        for spo_key in doc_spo_keys:
+            spo2support[spo_key] += 1
 
-        progress.done()
-
-        return spo2support
+        return dict(spo2support)
 
     @staticmethod
-    def compute_graph_for_tags():
+    def compute_graph_for_tags(document_collection: str):
         """
         Computes the support values of entity type co-occurrences in documents via the
-        Tag table. Iterates over the Tab table and then computes the cross-product
-        between entity types co-occurring in the same document
-        :return:
+        Tag table of a document collection. Streams over the Tag table ordered by document in a single pass
+        and then computes the cross-product between entity types co-occurring in the same document
+        :param document_collection: the document collection
+        :return: a dict mapping (s, co-occurrence, o) tuples to their support values (int)
         """
         session = SessionExtended.get()
-        logging.info('Count tag entries...')
-        t_count_query = session.query(Tag.document_collection, Tag.document_id, Tag.ent_type)
-        t_count_query = t_count_query.distinct()
-
-        t_count = t_count_query.count()
-        logging.info(f'Iterating over {t_count} tag table entries...')
-        tag_query = session.query(Tag.document_collection, Tag.document_id, Tag.ent_type)
-        tag_query = tag_query.order_by(Tag.document_collection, Tag.document_id)
-        tag_query = tag_query.distinct()
-
+        logging.info(f'Iterating over tags of collection {document_collection}...')
+        tag_query = session.query(Tag.document_id, Tag.ent_type)
+        tag_query = tag_query.filter(Tag.document_collection == document_collection)
+        tag_query = tag_query.order_by(Tag.document_id)
         tag_query = tag_query.yield_per(BULK_QUERY_CURSOR_COUNT_DEFAULT * 100)
 
-        progress = Progress(total=t_count, print_every=1000, text="Iterating over tags")
-        progress.start_time()
-        spo2docs = {}
-        last_doc = None
-        last_doc_entity_types = set()
+        spo2support = defaultdict(int)
+        doc_entity_types = set()
+        last_doc_id = None
         for idx, r in enumerate(tag_query):
-            progress.print_progress(idx)
-            doc_key = (r.document_collection, r.document_id)
-            if idx == 0:
-                last_doc = doc_key
+            if idx > 0 and idx % QUERY_YIELD_PER_K == 0:
+                logging.info(f'{idx} tags of collection {document_collection} processed')
 
-            # Find all entity types for a document
-            if doc_key != last_doc:
+            if r.document_id != last_doc_id:
                 # There is a new document incoming
-                # Compute cross product between entity types
-                # add co-occurrence relation between these types
-                for et1, et2 in itertools.product(last_doc_entity_types, last_doc_entity_types):
-                    spo = (et1, CO_OCCURRENCE_RELATION, et2)
-                    if spo not in spo2docs:
-                        spo2docs[spo] = set()
+                # Compute cross product between entity types of the last document
+                for et1, et2 in itertools.product(doc_entity_types, doc_entity_types):
+                    spo2support[(et1, CO_OCCURRENCE_RELATION, et2)] += 1
+                doc_entity_types.clear()
+                last_doc_id = r.document_id
 
-                    spo2docs[spo].add(doc_key)
-
-                # New document does not have any types yet
-                last_doc_entity_types.clear()
-
-            # We found our new document
-            last_doc_entity_types.add(r.ent_type)
-            last_doc = doc_key
+            doc_entity_types.add(r.ent_type)
 
         # Add last remaining values
-        if len(last_doc_entity_types) > 0:
-            # add co-occurrence relation between these types
-            for et1, et2 in itertools.product(last_doc_entity_types, last_doc_entity_types):
-                spo = (et1, CO_OCCURRENCE_RELATION, et2)
-                if spo not in spo2docs:
-                    spo2docs[spo] = set()
+        for et1, et2 in itertools.product(doc_entity_types, doc_entity_types):
+            spo2support[(et1, CO_OCCURRENCE_RELATION, et2)] += 1
 
-                spo2docs[spo].add(last_doc)
+        return dict(spo2support)
 
-        # convert document ids to a support number (just count)
-        spo2support = {k: len(v) for k, v in spo2docs.items()}
+    @staticmethod
+    def _compute_supports_for_collection(args):
+        """
+        Computes all support values of a single document collection (executed by worker processes)
+        :param args: a tuple (document collection, whether tag co-occurrences should be computed)
+        :return: a dict mapping (s, p, o) tuples to their support values (int)
+        """
+        document_collection, with_co_occurrences = args
+        spo2support = SchemaSupportGraph.compute_graph_for_predications(document_collection)
+        if with_co_occurrences:
+            spo2support.update(SchemaSupportGraph.compute_graph_for_tags(document_collection))
         return spo2support
 
+    @staticmethod
+    def compute_supports(with_co_occurrences: bool = False, workers: int = 1):
+        """
+        Computes the support values of all document collections
+        Documents of different collections are distinct, so the supports of collections can be summed up.
+        Collections are processed in parallel by worker processes.
+        :param with_co_occurrences: should entity type co-occurrences (Tag table) be computed
+        :param workers: the number of worker processes
+        :return: a dict mapping (s, p, o) tuples to their support values (int)
+        """
+        session = SessionExtended.get()
+        collections = sorted(r[0] for r in session.query(Document.collection).distinct())
+        logging.info(f'Computing supports for {len(collections)} collections with {workers} workers...')
+        tasks = [(c, with_co_occurrences) for c in collections]
+
+        spo2support = defaultdict(int)
+        if workers > 1 and len(collections) > 1:
+            # forked workers must not share pooled connections of the parent process
+            session.remove()
+            session.get_bind().dispose()
+            with multiprocessing.Pool(min(workers, len(collections))) as pool:
+                for collection_spo2support in pool.imap_unordered(SchemaSupportGraph._compute_supports_for_collection,
+                                                                  tasks):
+                    for spo, support in collection_spo2support.items():
+                        spo2support[spo] += support
+        else:
+            for task in tasks:
+                for spo, support in SchemaSupportGraph._compute_supports_for_collection(task).items():
+                    spo2support[spo] += support
+
+        return dict(spo2support)
+
     @staticmethod
     def insert_spo2support_values(spo2support):
         """
@@ -213,11 +222,15 @@ class SchemaSupportGraph:
         SchemaSupportGraphInfo.bulk_insert_values_into_table(session, values)
 
     @staticmethod
-    def compute_schema_graph():
+    def compute_schema_graph(with_co_occurrences: bool = False, workers: int = 1):
         """
         Computes the schema graph
+        :param with_co_occurrences: should entity type co-occurrences (Tag table) be included
+        :param workers: the number of worker processes
         :return: None
         """
+        spo2support = SchemaSupportGraph.compute_supports(with_co_occurrences=with_co_occurrences, workers=workers)
+
         logging.info('Deleting SchemaSupportGraphInfo database table...')
         session = SessionExtended.get()
         session.execute(delete(SchemaSupportGraphInfo))
@@ -226,8 +239,7 @@ class SchemaSupportGraph:
         session.commit()
         logging.info('Committed.')
 
-        #  SchemaSupportGraph.insert_spo2support_values(SchemaSupportGraph.compute_graph_for_tags())
-        SchemaSupportGraph.insert_spo2support_values(SchemaSupportGraph.compute_graph_for_predications())
+        SchemaSupportGraph.insert_spo2support_values(spo2support)
 
 
 def main():
@@ -235,9 +247,13 @@ def main():
                         datefmt='%Y-%m-%d:%H:%M:%S',
                         level=logging.DEBUG)
     parser = argparse.ArgumentParser()
+    parser.add_argument("--co-occurrences", action="store_true", default=False, required=False,
+                        help="Include entity type co-occurrences computed from the Tag table")
+    parser.add_argument("-w", "--workers", default=1, type=int, required=False,
+                        help="Number of worker processes (collections are processed in parallel)")
     args = parser.parse_args()
 
-    SchemaSupportGraph.compute_schema_graph()
+    SchemaSupportGraph.compute_schema_graph(with_co_occurrences=args.co_occurrences, workers=args.workers)
 
 
 if __name__ == "__main__":
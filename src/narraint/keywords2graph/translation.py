@@ -1,16 +1,15 @@
 import argparse
 import copy
+import heapq
 import itertools
 import logging
-from collections import defaultdict
 from datetime import datetime
 from typing import List
 
-from narraint.backend.database import SessionExtended
-from narraint.backend.models import TagInvertedIndex
 from narraint.frontend.entity.query_translation import QueryTranslation
 from narraint.keywords2graph.schema_support_graph import SchemaSupportGraph
 from narraint.queryengine.query_hints import PREDICATE_ASSOCIATED, ENTITY_TYPE_VARIABLE, VAR_TYPE
+from narraint.ranking.corpus import DocumentCorpus
 from narrant.entity.entity import Entity
 from narrant.entitylinking.enttypes import ALL, DOSAGE_FORM
 
@@ -27,21 +26,14 @@ class SupportedFactPattern:
         self.entity_type2 = entity_type2
         self.support = support
 
-    def is_equal(self, other):
-        if not isinstance(other, SupportedFactPattern):
-            return False
-        s = self.keyword1 == other.keyword1 and self.entity_type1 == other.entity_type1
-        r = self.relation == other.relation
-        o = self.keyword2 == other.keyword2 and self.entity_type2 == other.entity_type2
-        return s and r and o
-
-    def is_flipped_equal(self, other):
-        if not isinstance(other, SupportedFactPattern):
-            return False
-        s = self.keyword1 == other.keyword2 and self.entity_type1 == other.entity_type2
-        r = self.relation == other.relation
-        o = self.keyword2 == other.keyword1 and self.entity_type2 == other.entity_type1
-        return s and r and o
+    def get_canonical_key(self):
+        """
+        Computes a key that is equal for this fact pattern and its flipped version (o, p, s)
+        :return: a hashable key
+        """
+        spo = (self.keyword1, self.entity_type1, self.relation, self.keyword2, self.entity_type2)
+        ops = (self.keyword2, self.entity_type2, self.relation, self.keyword1, self.entity_type1)
+        return min(spo, ops)
 
     def __str__(self):
         return f'<{self.support}: {self.keyword1}, {self.relation}, {self.keyword2}>'
@@ -80,23 +72,12 @@ class SupportedGraphPattern:
         relations = self.get_relations()
         return len(relations) == 1 and ASSOCIATED in relations
 
-    def is_flipped_equal_to_other(self, other):
-        if not isinstance(other, SupportedGraphPattern):
-            return False
-        if len(self.fact_patterns) != len(other.fact_patterns):
-            return False
-        # Iterate over all fact patterns
-        # Check whether each fp has an equal pattern in other or is flipped equal to a pattern in other
-        # Only if every pattern has a match, the pattern is equal
-        for fp1 in self.fact_patterns:
-            match = False
-            for fp2 in other.fact_patterns:
-                if fp1.is_equal(fp2) or fp1.is_flipped_equal(fp2):
-                    match = True
-                    break
-            if not match:
-                return False
-        return True
+    def get_canonical_key(self):
+        """
+        Computes a key that is equal for all patterns that are equal or flipped equal to this pattern
+        :return: a hashable key
+        """
+        return frozenset(fp.get_canonical_key() for fp in self.fact_patterns)
 
     def to_json_data(self):
         data = []
@@ -110,39 +91,54 @@ class Keyword2GraphTranslation:
     def __init__(self):
         self.graph: SchemaSupportGraph = SchemaSupportGraph()
         self.translation: QueryTranslation = QueryTranslation()
+        self.corpus: DocumentCorpus = DocumentCorpus()
 
     @staticmethod
-    def greedy_find_most_supported_entity_type(entities: [Entity]):
+    def get_entity_support_keys(entities: [Entity]) -> set:
+        """
+        Computes the (entity type, entity id) keys whose supports are considered for a keyword
+        All entity ids are combined with all entity types of the keyword's entities
+        :param entities: the entities of a keyword
+        :return: a set of (entity type, entity id) tuples
+        """
         entity_ids = {e.entity_id for e in entities}
         entity_types = {e.entity_type for e in entities}
+        return set(itertools.product(entity_types, entity_ids))
 
-        session = SessionExtended.get()
-        query = session.query(TagInvertedIndex.entity_id, TagInvertedIndex.entity_type, TagInvertedIndex.support)
-        query = query.filter(TagInvertedIndex.entity_id.in_(entity_ids))
-        query = query.filter(TagInvertedIndex.entity_type.in_(entity_types))
-
+    @staticmethod
+    def greedy_find_most_supported_entity_type(entities: [Entity], entity2support: dict):
+        """
+        Finds the entity type of the entity that is contained in the most documents
+        :param entities: the entities of a keyword
+        :param entity2support: a dict mapping (entity type, entity id) to its support (see DocumentCorpus)
+        :return: the entity type
+        """
         # we can control the preference if entity types have the same support
         preference_dict = dict()
         preference_dict[DOSAGE_FORM] = 10
 
-        entity2support = defaultdict(lambda: [0, 0])  # [support, preference]
-
-        for row in query:
-            entity_key = (row.entity_type, row.entity_id)
-            if entity_key not in entity2support:
-                entity2support[entity_key][1] = preference_dict.get(row.entity_type, 1)
-
-            entity2support[entity_key][0] += row.support
+        entity_support_list = []  # [(type, id, support, preference)]
+        for entity_key in Keyword2GraphTranslation.get_entity_support_keys(entities):
+            if entity_key in entity2support:
+                entity_type, entity_id = entity_key
+                entity_support_list.append((entity_type, entity_id, entity2support[entity_key],
+                                            preference_dict.get(entity_type, 1)))
 
-        # Compute a sorted list
-        entity_support_list = [(et, e, supp, pref) for (et, e), (supp, pref) in entity2support.items()]
-        entity_support_list.sort(key=lambda x: (x[2], x[3]), reverse=True)
+        # Compute a sorted list (type and id make the order deterministic)
+        entity_support_list.sort(key=lambda x: (-x[2], -x[3], x[0], x[1]))
         logging.debug(f"{entity_support_list}")
 
         # Get the type of the first element
         return entity_support_list[0][0]
 
     def find_all_possible_query_patterns(self, keywords_with_types) -> [SupportedGraphPattern]:
+        """
+        Enumerates all possible query patterns (every keyword order and every relation combination)
+        This is the exhaustive reference for find_most_supported_query_patterns. It is only used as a fallback
+        if the schema graph contains edges without support (see find_most_supported_query_patterns).
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :return: a list of all distinct patterns sorted by their minimum support
+        """
         # Suppose types: A, B, C
         # We can build the following graphs:
         # ('A', 'B', 'C')
@@ -155,6 +151,7 @@ class Keyword2GraphTranslation:
         # Go through each combination and compute all possible relations between each entity types
         # Then find the minimum support of the whole pattern (less supported edge)
         final_possible_patterns = []
+        known_pattern_keys = set()
         for comb in itertools.permutations(keywords_with_types, r=len(keywords_with_types)):
             # Add the first empty pattern to this list of possible patterns
             possible_patterns_per_comb = []
@@ -185,30 +182,187 @@ class Keyword2GraphTranslation:
             # a flipped pattern (s, p, o) == (o, p, s) is not a new pattern because they will
             # result in the same visualization for the user. The query engine will order s, p, o based on r
             # automatically. So we don't need to generated flipped versions here
-            # So for each new pattern check whether an existing pattern already contains the flipped version
+            # Flipped versions share the same canonical key
             for new_candidate in possible_patterns_per_comb:
-                match = False
-                for existing_pattern in final_possible_patterns:
-                    if new_candidate.is_flipped_equal_to_other(existing_pattern):
-                        match = True
-                        break
-                if not match:
+                candidate_key = new_candidate.get_canonical_key()
+                if candidate_key not in known_pattern_keys:
+                    known_pattern_keys.add(candidate_key)
                     final_possible_patterns.append(new_candidate)
 
         # Now support the query patterns by their minimum support
         final_possible_patterns.sort(key=lambda x: x.minimum_support, reverse=True)
         return final_possible_patterns
 
+    def _get_relation_candidates(self, keywords_with_types, associated: bool):
+        """
+        Computes the relation candidates for all ordered pairs of keyword types
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :param associated: only the associated relation (True) or only specific relations (False)
+        :return: a dict mapping (t1, t2) to a dict mapping relations to (enumeration index, support)
+        """
+        so2relations = {}
+        for (_, t1), (_, t2) in itertools.permutations(keywords_with_types, r=2):
+            if (t1, t2) in so2relations:
+                continue
+            relation2support = self.graph.get_relations_between(t1, t2)
+            if associated:
+                # there is exactly one associated edge per type pair (support 0 if it is not in the graph)
+                so2relations[(t1, t2)] = {ASSOCIATED: (0, relation2support.get(ASSOCIATED, 0))}
+            else:
+                # the index reflects the enumeration order of find_all_possible_query_patterns
+                so2relations[(t1, t2)] = {relation: (idx, support)
+                                          for idx, (relation, support) in enumerate(relation2support.items())
+                                          if relation != ASSOCIATED}
+        return so2relations
+
+    @staticmethod
+    def _has_edges_without_support(so2relations) -> bool:
+        return any(support <= 0 for relations in so2relations.values() for _, support in relations.values())
+
+    @staticmethod
+    def _best_first_search_patterns(keywords_with_types, so2relations, k) -> [SupportedGraphPattern]:
+        """
+        Finds the k patterns with the highest minimum support via a best-first search over partial keyword chains
+        The minimum support of a chain can only decrease if the chain is extended (all supports must be positive).
+        Hence, the first complete chains taken from the queue are the most supported ones and the search
+        stops after k distinct patterns. Ties are broken by the enumeration order of
+        find_all_possible_query_patterns (keyword order first, then relation order).
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :param so2relations: the relation candidates computed by _get_relation_candidates
+        :param k: the number of patterns to find
+        :return: a list of at most k patterns sorted by their minimum support
+        """
+        # queue entries: (-minimum support, keyword indexes, relation indexes, fact patterns)
+        # the first three components are unique for a partial chain, so fact patterns are never compared
+        queue = [(float('-inf'), (i,), (), ()) for i in range(len(keywords_with_types))]
+        heapq.heapify(queue)
+
+        results = []
+        known_pattern_keys = set()
+        while queue and len(results) < k:
+            neg_support, keyword_idxs, relation_idxs, fact_patterns = heapq.heappop(queue)
+            if len(keyword_idxs) == len(keywords_with_types):
+                # A flipped chain results in the same pattern. Only the first enumerated chain represents
+                # the pattern (and its support), so skip this chain if its reversed version comes first
+                reversed_idxs = keyword_idxs[::-1]
+                if reversed_idxs < keyword_idxs and all(fp.relation in so2relations[(fp.entity_type2,
+                                                                                      fp.entity_type1)]
+                                                        for fp in fact_patterns):
+                    continue
+
+                pattern = SupportedGraphPattern()
+                for fp in fact_patterns:
+                    pattern.add_supported_fact_patterns(fp)
+                pattern_key = pattern.get_canonical_key()
+                if pattern_key not in known_pattern_keys:
+                    known_pattern_keys.add(pattern_key)
+                    results.append(pattern)
+                continue
+
+            kw1, t1 = keywords_with_types[keyword_idxs[-1]]
+            for next_idx, (kw2, t2) in enumerate(keywords_with_types):
+                if next_idx in keyword_idxs:
+                    continue
+                for relation, (relation_idx, support) in so2relations[(t1, t2)].items():
+                    fp = SupportedFactPattern(kw1, t1, relation, kw2, t2, support)
+                    heapq.heappush(queue, (max(neg_support, -support), keyword_idxs + (next_idx,),
+                                           relation_idxs + (relation_idx,), fact_patterns + (fp,)))
+
+        return results
+
+    def _enumerate_associated_patterns(self, keywords_with_types, so2relations) -> [SupportedGraphPattern]:
+        """
+        Enumerates all distinct associated patterns in the order of find_all_possible_query_patterns
+        Only one relation per type pair is possible, so only the keyword orders must be enumerated
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :param so2relations: the associated relation candidates computed by _get_relation_candidates
+        :return: a list of all distinct associated patterns sorted by their minimum support
+        """
+        patterns = []
+        known_pattern_keys = set()
+        for comb in itertools.permutations(keywords_with_types, r=len(keywords_with_types)):
+            pattern = SupportedGraphPattern()
+            for (kw1, t1), (kw2, t2) in zip(comb, comb[1:]):
+                _, support = so2relations[(t1, t2)][ASSOCIATED]
+                pattern.add_supported_fact_patterns(SupportedFactPattern(kw1, t1, ASSOCIATED, kw2, t2, support))
+
+            pattern_key = pattern.get_canonical_key()
+            if pattern_key not in known_pattern_keys:
+                known_pattern_keys.add(pattern_key)
+                patterns.append(pattern)
+
+        patterns.sort(key=lambda x: x.minimum_support, reverse=True)
+        return patterns
+
+    def find_most_supported_specific_patterns(self, keywords_with_types, k=2) -> [SupportedGraphPattern]:
+        """
+        Finds the k specific patterns (patterns without an associated edge) with the highest minimum support
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :param k: the number of patterns to find
+        :return: a list of at most k patterns sorted by their minimum support
+        """
+        so2relations = self._get_relation_candidates(keywords_with_types, associated=False)
+        if Keyword2GraphTranslation._has_edges_without_support(so2relations):
+            # see find_most_supported_query_patterns
+            patterns = self.find_all_possible_query_patterns(keywords_with_types)
+            return [p for p in patterns if p.is_specific()][:k]
+        return Keyword2GraphTranslation._best_first_search_patterns(keywords_with_types, so2relations, k)
+
+    def find_most_supported_associated_pattern(self, keywords_with_types) -> SupportedGraphPattern:
+        """
+        Finds the pattern that connects all keywords via associated edges and has the highest minimum support
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :return: the most supported associated pattern or None if there are less than two keywords
+        """
+        if len(keywords_with_types) < 2:
+            return None
+        so2relations = self._get_relation_candidates(keywords_with_types, associated=True)
+        if Keyword2GraphTranslation._has_edges_without_support(so2relations):
+            # see find_most_supported_query_patterns
+            return self._enumerate_associated_patterns(keywords_with_types, so2relations)[0]
+        return Keyword2GraphTranslation._best_first_search_patterns(keywords_with_types, so2relations, k=1)[0]
+
+    def find_most_supported_query_patterns(self, keywords_with_types) -> [SupportedGraphPattern]:
+        """
+        Computes the two most supported specific patterns and the most supported associated pattern
+        The result is the same as filtering find_all_possible_query_patterns, but the patterns are found
+        by a best-first search that does not enumerate all relation combinations.
+        Limitation: SupportedGraphPattern.add_supported_fact_patterns treats a minimum support of 0 as unset,
+        so the minimum support of a chain is not monotone if an edge has no support. The best-first search
+        relies on monotone supports. Hence, we fall back to the exhaustive enumeration if any candidate edge has
+        no support. This always happens for associated patterns if the schema graph lacks an associated edge
+        between two keyword types (only n! keyword orders are enumerated then).
+        :param keywords_with_types: a list of (keyword, entity type) tuples
+        :return: a list of patterns
+        """
+        # Add the most specific and highly supported pattern and an alternative if there is one
+        results = self.find_most_supported_specific_patterns(keywords_with_types, k=2)
+
+        # Find the associated pattern
+        associated_pattern = self.find_most_supported_associated_pattern(keywords_with_types)
+        if associated_pattern:
+            results.append(associated_pattern)
+        return results
+
     def translate_keywords(self, keyword_lists: List[str]) -> [SupportedGraphPattern]:
         # The first step is to transform keywords into entities
         # Then for each set of possible entities the most supported translation is searched
         # Most supported means to have the highest support (be detected in the most documents)
         # Force to be a list (must have the same order across the following script
         keyword_lists = list(keyword_lists)
-        keywords_with_types = list()
+        keywords_with_entities = list()
+        support_keys = set()
         for keywords in keyword_lists:
             entities = self.translation.convert_text_to_entity(keywords)
             logging.debug(f'Found entities: {entities}')
+            keywords_with_entities.append((keywords, entities))
+            support_keys.update(Keyword2GraphTranslation.get_entity_support_keys(entities))
+
+        # Supports of all keywords are retrieved in a single batch from memory
+        entity2support = self.corpus.get_entity_supports(support_keys)
+
+        keywords_with_types = list()
+        for keywords, entities in keywords_with_entities:
             # What is a variable?
             if len(entities) == 1 and list(entities)[0].entity_type == ENTITY_TYPE_VARIABLE:
                 # ID should be something like this f'?{var_type}({var_type})'
@@ -220,32 +374,13 @@ class Keyword2GraphTranslation:
                     ms_type = "All"
             else:
                 # Get type from most supported entity
-                ms_type = Keyword2GraphTranslation.greedy_find_most_supported_entity_type(entities)
+                ms_type = Keyword2GraphTranslation.greedy_find_most_supported_entity_type(entities, entity2support)
 
             keywords_with_types.append((keywords, ms_type))
 
-        logging.debug(f'Generating possible query patterns for: {keywords_with_types}')
-        # Next find all possible query patterns
-        patterns = self.find_all_possible_query_patterns(keywords_with_types)
-
-        logging.debug(f'{len(patterns)} patterns have been generated.')
-        # Compose the result
-        results = []
-
-        # Filter for specific patterns
-        specific_patterns = list([p for p in patterns if p.is_specific()])
-        # Add the most specific and highly supported pattern
-        if len(specific_patterns) > 0:
-            results.append(specific_patterns[0])
-        if len(specific_patterns) > 1:
-            # If there is an alternative add it
-            results.append(specific_patterns[1])
-
-        # Find the associated pattern
-        associated_patterns = list([p for p in patterns if p.is_associated()])
-        if len(associated_patterns) > 0:
-            results.append(associated_patterns[0])
-
+        logging.debug(f'Searching the most supported query patterns for: {keywords_with_types}')
+        results = self.find_most_supported_query_patterns(keywords_with_types)
+        logging.debug(f'{len(results)} patterns have been generated.')
         return results
 
 
@@ -112,11 +112,15 @@ class ResultAggregationByOntology(QueryResultAggregationStrategy):
                         misc_aggregation.add_query_result(misc_aggregation_list)
                         ent_type_aggregation.append((ent_type, misc_aggregation))
 
+                # the trees are complete now - sizes are computed once instead of at every level of the sorting
+                for _, aggregation in ent_type_aggregation:
+                    aggregation.freeze()
                 resulting_tree = QueryResultAggregateList()
                 for _, aggregation in sorted(ent_type_aggregation, key=lambda x: x[1].get_result_size(),
                                              reverse=self.freq_sort_desc):
                     self._sort_node_result_list(aggregation)
                     resulting_tree.add_query_result(aggregation)
+                resulting_tree.freeze()
                 return resulting_tree, is_aggregate
             else:
                 # no variable is used
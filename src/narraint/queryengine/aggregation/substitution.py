@@ -51,6 +51,7 @@ class ResultAggregationBySubstitution(QueryResultAggregationStrategy):
 
             if start_pos and end_pos:
                 query_result.set_slice(start_pos, end_pos)
+            query_result.freeze()
             return query_result, is_aggregate
 
         else:
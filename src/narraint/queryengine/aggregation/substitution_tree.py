@@ -9,35 +9,16 @@ from narraint.queryengine.result import QueryDocumentResult, QueryDocumentResult
 class ResultTreeAggregationBySubstitution(QueryResultAggregationStrategy):
     """
     Ranks a list of query results by putting all documents sharing the same variable substitution into a group
+    Substitutions are encoded as integers per variable and documents are grouped by the tuple of these integers.
+    Group sizes of all tree levels are computed on these tuples, so that tree nodes are only built for the
+    requested page.
     """
 
     def __init__(self):
         self.var_names = []
-        self.aggregation = {}
-        self.__doc_ids_per_aggregation = defaultdict(set)
-        self.results = []
-        self.doc_ids = set()
-        self.root = QueryResultAggregateList()
-        self.generated_tree_aggregates = {}
-        self.varsubs2documents = defaultdict(list)
-        self.level1_var_sub_count = defaultdict(int)
-        self.level1_key_contained_in = defaultdict(set)
-
-    def _clear_state(self):
-        self.var_names.clear()
-        self.aggregation.clear()
-        self.__doc_ids_per_aggregation.clear()
-        self.results.clear()
-        self.doc_ids.clear()
-        self.root = QueryResultAggregateList()
-        self.generated_tree_aggregates.clear()
-        self.varsubs2documents.clear()
-        self.level1_var_sub_count.clear()
-        self.level1_key_contained_in.clear()
 
     def rank_results(self, results: List[QueryDocumentResult], ordered_var_names: List[str] = None, freq_sort_desc=True,
                      year_sort_desc=True, start_pos=None, end_pos=None) -> [QueryDocumentResultList, bool]:
-        self._clear_state()
         # retrieve the var names if not given
         if results and not ordered_var_names:
             self.var_names = sorted(list(results[0].var2substitution.keys()))
@@ -47,16 +28,9 @@ class ResultTreeAggregationBySubstitution(QueryResultAggregationStrategy):
         results.sort(key=lambda x: (x.publication_year, x.publication_month), reverse=year_sort_desc)
         # variable is used
         if self.var_names:
-            for r in results:
-                self._add_query_result_in_aggregation(r)
-
-            self._populate_tree_structure(freq_sort_desc, start_pos, end_pos)
-
-            # self.root.sort_results_by_substitutions(freq_sort_desc)
-            if start_pos and end_pos:
-                self.root.set_slice(start_pos, end_pos)
-
-            return self.root, True
+            key2documents, level2substitutions = self._group_results(results)
+            root = self._build_tree(key2documents, level2substitutions, freq_sort_desc, start_pos, end_pos)
+            return root, True
         else:
             # no variable is used
             query_result = QueryDocumentResultList()
@@ -64,69 +38,76 @@ class ResultTreeAggregationBySubstitution(QueryResultAggregationStrategy):
                 query_result.add_query_result(res)
             return query_result, False
 
-    def _generate_tree_structure(self):
-
-        query_aggregate_lists = {1: self.root}
-
-        # Go through all aggregated keys
-        for var_sub_key in self.varsubs2documents.keys():
-            # build all levels for the tree structure
-            for level in range(1, len(self.var_names) + 1):
-                # construct the current possible substitution on that level
-                # e.g. X = A
-                current_parent_key = var_sub_key[0:(level * 2 - 2)]
-                current_sub = var_sub_key[0:level * 2]
-
-                if not current_parent_key:
-                    parent = self.root
-                elif current_parent_key in query_aggregate_lists:
-                    parent = query_aggregate_lists[current_parent_key]
-                else:
-                    parent = QueryResultAggregateList()
-                    # we must put it under the corresponding aggregate node
-                    parent_of_parent = self.generated_tree_aggregates[current_parent_key]
-                    parent_of_parent.add_query_result(parent)
-                    query_aggregate_lists[current_parent_key] = parent
-
-                # Either we have already generated a tree node on that level
-                # or we must do it now
-                if current_sub not in self.generated_tree_aggregates:
-                    var2sub = {}
-                    for j in range((level-1)*2, len(current_sub), 2):
-                        var2sub[current_sub[j]] = current_sub[j + 1]
-                    node = QueryResultAggregate(var2sub)
-                    parent.add_query_result(node)
-                    self.generated_tree_aggregates[current_sub] = node
-
-    def _populate_tree_structure(self, freq_sort_desc, start_pos, end_pos):
-        all_result_lists = []
-
-        # consider only substitutions that are on level 1 between start pos and end pos
-        for key, results in self.varsubs2documents.items():
-            all_result_lists.append((results, len(results)))
-        all_result_lists.sort(key=lambda x: x[1], reverse=freq_sort_desc)
-
-        # generate tree structure for all results
-        self._generate_tree_structure()
-
-        # populate the structure
-        for key, results in self.varsubs2documents.items():
-            self.generated_tree_aggregates[key].results = results
-
-        # sort also all subtrees
-        todo = [self.root]
-        while todo:
-            current_tree_node = todo.pop()
-            current_tree_node.results.sort(key=lambda x: x.get_result_size(), reverse=freq_sort_desc)
-            for res in current_tree_node.results:
-                if isinstance(res, QueryResultAggregateList) or isinstance(res, QueryResultAggregate):
-                    todo.append(res)
-
-    def _add_query_result_in_aggregation(self, result: QueryDocumentResult):
-        var_subs = list()
-        for var_name in self.var_names:
-            sub = result.var2substitution[var_name]
-            var_subs.append(var_name)
-            var_subs.append(sub)
-        key = tuple(var_subs)
-        self.varsubs2documents[key].append(result)
+    def _group_results(self, results: List[QueryDocumentResult]):
+        """
+        Groups the results by their substitutions
+        :param results: a list of document results
+        :return: a dict mapping integer-encoded substitution keys to documents (in order of the first occurrence),
+                 a list mapping each level to its substitutions (index = encoded integer)
+        """
+        level2sub_idx = [dict() for _ in self.var_names]
+        level2substitutions = [list() for _ in self.var_names]
+        # the engine shares substitution mappings between documents, so each mapping is encoded only once
+        var2sub_id2key = {}
+        key2documents = defaultdict(list)
+        for r in results:
+            var2sub_id = id(r.var2substitution)
+            if var2sub_id in var2sub_id2key:
+                key = var2sub_id2key[var2sub_id]
+            else:
+                key = []
+                for level, var_name in enumerate(self.var_names):
+                    sub = r.var2substitution[var_name]
+                    sub2idx = level2sub_idx[level]
+                    if sub not in sub2idx:
+                        sub2idx[sub] = len(level2substitutions[level])
+                        level2substitutions[level].append(sub)
+                    key.append(sub2idx[sub])
+                key = tuple(key)
+                var2sub_id2key[var2sub_id] = key
+            key2documents[key].append(r)
+        return key2documents, level2substitutions
+
+    def _build_tree(self, key2documents, level2substitutions, freq_sort_desc, start_pos, end_pos):
+        """
+        Computes the sizes of all tree nodes on the grouped keys and builds the nodes of the requested page
+        :return: the root of the tree
+        """
+        # prefixes of the keys (one per tree node) in order of their first occurrence
+        prefix2size = defaultdict(int)
+        prefix2children = defaultdict(list)
+        for key, documents in key2documents.items():
+            for level in range(1, len(key) + 1):
+                prefix = key[:level]
+                if prefix not in prefix2size:
+                    prefix2children[key[:level - 1]].append(prefix)
+                prefix2size[prefix] += len(documents)
+
+        # nodes with the same size keep the order of their first occurrence
+        level1_prefixes = sorted(prefix2children[()], key=lambda p: prefix2size[p], reverse=freq_sort_desc)
+        # a page behind the last substitution keeps all substitutions (like QueryResultAggregateList.set_slice)
+        if start_pos is not None and end_pos is not None and start_pos < len(level1_prefixes):
+            level1_prefixes = level1_prefixes[start_pos:end_pos]
+
+        root = QueryResultAggregateList()
+        for prefix in level1_prefixes:
+            root.add_query_result(self._build_node(prefix, prefix2size, prefix2children, key2documents,
+                                                   level2substitutions, freq_sort_desc))
+        # the number of substitutions is shown for paging, so it counts all substitutions and not only the page
+        root.count_substitutions = len(prefix2children[()])
+        root.freeze()
+        return root
+
+    def _build_node(self, prefix, prefix2size, prefix2children, key2documents, level2substitutions,
+                    freq_sort_desc) -> QueryResultAggregate:
+        level = len(prefix) - 1
+        node = QueryResultAggregate({self.var_names[level]: level2substitutions[level][prefix[level]]})
+        if len(prefix) == len(self.var_names):
+            node.results = key2documents[prefix]
+        else:
+            children = QueryResultAggregateList()
+            for child in sorted(prefix2children[prefix], key=lambda p: prefix2size[p], reverse=freq_sort_desc):
+                children.add_query_result(self._build_node(child, prefix2size, prefix2children, key2documents,
+                                                           level2substitutions, freq_sort_desc))
+            node.add_query_result(children)
+        return node
@@ -0,0 +1,392 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import tracemalloc
+from datetime import datetime
+from typing import List, Dict
+
+from sqlalchemy import event
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import DatabaseUpdate
+from narraint.config import LOG_DIR
+from narraint.dummy.generate_dummy_data import ZipfSampler, get_entity, NUMBER_OF_ENTITIES, NUMBER_OF_RELATIONS
+from narraint.frontend.filter.time_filter import TimeFilter
+from narraint.queryengine.aggregation.substitution_tree import ResultTreeAggregationBySubstitution
+from narraint.queryengine.engine import QueryEngine
+from narraint.queryengine.query import GraphQuery, FactPattern
+from narraint.queryengine.query_hints import ENTITY_TYPE_VARIABLE
+from narraint.queryengine.result import iter_json_response
+from narraint.queryengine.tracing import start_trace, stop_trace, trace_span, trace_count
+from narrant.entity.entity import Entity
+
+# benchmark stages and the traced stages they consist of (see the trace spans of the engine and the query view)
+BENCHMARK_STAGES = {
+    "translation": ["translation"],
+    "index_fetch": ["engine.inverted_index"],
+    "intersection": ["engine.intersection", "engine.term_entity_filter", "engine.results"],
+    "enrichment": ["engine.metadata"],
+    "aggregation": ["filters", "aggregation"],
+    "serialization": ["json"]
+}
+BENCHMARK_PERCENTILES = [50, 90, 99]
+# relative increases that are reported as regressions
+BENCHMARK_THRESHOLDS = dict(latency=0.2, memory=0.2, rows=0.1)
+# latency increases below this value (in ms) are considered as noise
+BENCHMARK_MIN_LATENCY_DIFFERENCE_MS = 5.0
+
+
+class BenchmarkQuery:
+    """
+    A query of a benchmark workload, given either as a query string (translated during the benchmark) or as an
+    already translated graph query (e.g. for synthetic corpora whose entities are unknown to the translation)
+    """
+
+    def __init__(self, name: str, collections: List[str], query: str = None, graph_query: GraphQuery = None):
+        if not query and not graph_query:
+            raise ValueError('Either a query string or a graph query must be given')
+        self.name = name
+        self.collections = collections
+        self.query = query
+        self.graph_query = graph_query
+
+    def to_dict(self):
+        return dict(name=self.name, collections=self.collections, query=self.query or str(self.graph_query))
+
+
+def load_common_queries_workload(collections: List[str]) -> List[BenchmarkQuery]:
+    """
+    Creates a workload of the common queries that are cached for the service
+    :param collections: the document collections that are queried
+    :return: a list of benchmark queries
+    """
+    from narraint.frontend.ui.execute_common_queries import COMMON_QUERIES
+    return [BenchmarkQuery(query, collections, query=query) for query in COMMON_QUERIES]
+
+
+def load_query_log_workload(log_dir: str = os.path.join(LOG_DIR, "queries"), limit: int = None) \
+        -> List[BenchmarkQuery]:
+    """
+    Creates a workload of the queries recorded by the query logger (in the recorded order)
+    :param log_dir: the directory of the query logs
+    :param limit: the maximum number of queries (the most recent queries are used)
+    :return: a list of benchmark queries
+    """
+    workload = []
+    for log_file in sorted(f for f in os.listdir(log_dir) if f.endswith("-queries.log")):
+        with open(os.path.join(log_dir, log_file), 'rt', errors='replace') as f:
+            header = f.readline().rstrip('\n').split('\t')
+            for line in f:
+                entry = dict(zip(header, line.rstrip('\n').split('\t')))
+                if not entry.get("query string") or not entry.get("collection"):
+                    continue
+                # collections are logged as a sorted and joined string (e.g. LitCovid-PubMed)
+                workload.append((entry["query string"], entry["collection"].split("-")))
+    if limit:
+        workload = workload[-limit:]
+    return [BenchmarkQuery(f"log_{idx}", collections, query=query)
+            for idx, (query, collections) in enumerate(workload)]
+
+
+def generate_synthetic_workload(collections: List[str], number_of_queries: int = 100, seed: int = 0,
+                                entities: int = NUMBER_OF_ENTITIES, relations: int = NUMBER_OF_RELATIONS,
+                                entity_skew: float = 1.0) -> List[BenchmarkQuery]:
+    """
+    Creates graph queries for a synthetic corpus (see narraint.dummy.generate_dummy_data)
+    Entities are drawn from the same skewed distribution as in the corpus, so the workload contains a few queries
+    with huge posting lists and many queries with small ones. Queries are either entity-entity patterns,
+    entity-variable patterns or a conjunction of an entity-variable and a variable-entity pattern.
+    :param collections: the document collections that are queried
+    :param number_of_queries: the number of queries
+    :param seed: the random seed
+    :param entities: number of entities of the corpus
+    :param relations: number of relations of the corpus
+    :param entity_skew: skew of the entity frequencies of the corpus
+    :return: a list of benchmark queries
+    """
+    rng = random.Random(seed)
+    entity_sampler = ZipfSampler(entities, entity_skew)
+    relation_sampler = ZipfSampler(relations, 1.0)
+
+    def create_entity(rank):
+        entity_id, entity_type, _ = get_entity(rank)
+        return Entity(entity_id, entity_type)
+
+    def create_variable(rank):
+        _, entity_type, _ = get_entity(rank)
+        return Entity(f"?X({entity_type})", ENTITY_TYPE_VARIABLE)
+
+    workload = []
+    for idx in range(number_of_queries):
+        subject_rank, object_rank = entity_sampler.sample(rng, 2)
+        relation, relation2 = (f"relation_{r}" for r in relation_sampler.sample(rng, 2))
+        kind = rng.choice(["entity_entity", "entity_variable", "conjunction"])
+        if kind == "entity_entity":
+            fact_patterns = [FactPattern([create_entity(subject_rank)], relation, [create_entity(object_rank)])]
+        elif kind == "entity_variable":
+            fact_patterns = [FactPattern([create_entity(subject_rank)], relation, [create_variable(object_rank)])]
+        else:
+            third_rank = entity_sampler.sample(rng, 1)[0]
+            fact_patterns = [FactPattern([create_entity(subject_rank)], relation, [create_variable(object_rank)]),
+                             FactPattern([create_variable(object_rank)], relation2, [create_entity(third_rank)])]
+        workload.append(BenchmarkQuery(f"synthetic_{idx}_{kind}", collections, graph_query=GraphQuery(fact_patterns)))
+    return workload
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    trace_count("sql_statements")
+
+
+def run_query(benchmark_query: BenchmarkQuery, translation=None) -> dict:
+    """
+    Executes a query like the query view (translation, engine, filters, aggregation and serialization) and traces
+    its stages
+    :param benchmark_query: the query
+    :param translation: a QueryTranslation (required for query strings)
+    :return: the trace of the execution (as a dict) extended by the number of results and response bytes
+    """
+    trace = start_trace(benchmark_query.name)
+    try:
+        graph_query = benchmark_query.graph_query
+        if not graph_query:
+            with trace_span("translation"):
+                graph_query, _ = translation.convert_query_text_to_fact_patterns(benchmark_query.query)
+        results = []
+        if graph_query and graph_query.fact_patterns:
+            results = QueryEngine.process_query_with_expansion(graph_query,
+                                                               document_collection_filter=set(
+                                                                   benchmark_query.collections))
+        with trace_span("filters"):
+            year_aggregation = TimeFilter.aggregate_years(results)
+        with trace_span("aggregation"):
+            var_names = graph_query.get_var_names_in_order() if graph_query else []
+            results_ranked, is_aggregate = ResultTreeAggregationBySubstitution().rank_results(results, var_names)
+        with trace_span("json"):
+            response = b''.join(iter_json_response(
+                dict(valid_query=True, is_aggregate=is_aggregate, results=results_ranked,
+                     query_translation=str(graph_query), year_aggregation=year_aggregation,
+                     query_limit_hit="False")))
+        execution = trace.to_dict()
+        execution.update(documents=len(results), response_bytes=len(response))
+        return execution
+    finally:
+        stop_trace()
+
+
+def get_stage_durations(execution: dict) -> Dict[str, float]:
+    stage2ms = {stage: sum(execution["stages"].get(s, 0.0) for s in traced_stages)
+                for stage, traced_stages in BENCHMARK_STAGES.items()}
+    stage2ms["total"] = execution["total_ms"]
+    return stage2ms
+
+
+def compute_percentile(values: List[float], percentile: int) -> float:
+    # nearest-rank percentile
+    values = sorted(values)
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+def summarize_durations(executions: List[dict]) -> Dict[str, Dict[str, float]]:
+    """
+    Computes the latency percentiles of each stage
+    :param executions: a list of traced executions
+    :return: a dict mapping stages to dicts mapping percentiles (e.g. p50) to milliseconds
+    """
+    if not executions:
+        return {}
+    durations = [get_stage_durations(e) for e in executions]
+    return {stage: {f"p{p}": round(compute_percentile([d[stage] for d in durations], p), 2)
+                    for p in BENCHMARK_PERCENTILES}
+            for stage in durations[0]}
+
+
+def run_benchmark(workload: List[BenchmarkQuery], runs: int = 5, measure_memory: bool = True) -> dict:
+    """
+    Replays a workload and measures the latency of each stage, the peak memory and the rows scanned per query
+    The first pass over the workload measures cold executions (the process has not executed the query before,
+    database and OS caches are not dropped). The following passes measure warm executions. Peak memory is measured
+    in an additional pass, because tracing allocations slows down the execution.
+    :param workload: a list of benchmark queries
+    :param runs: number of executions per query (including the cold execution)
+    :param measure_memory: should the peak memory of each query be measured
+    :return: the benchmark results (JSON serializable)
+    """
+    if runs < 1:
+        raise ValueError('At least a single run is required')
+    translation = None
+    if any(q.query for q in workload):
+        from narraint.frontend.entity.query_translation import QueryTranslation
+        translation = QueryTranslation()
+
+    session = SessionExtended.get()
+    try:
+        database_update = str(DatabaseUpdate.get_latest_update(session))
+    except ValueError:
+        database_update = None
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", _count_statement)
+    try:
+        query2executions = {q.name: [] for q in workload}
+        for run in range(runs):
+            logging.info(f'Benchmark run {run + 1}/{runs} ({"cold" if run == 0 else "warm"})...')
+            for benchmark_query in workload:
+                query2executions[benchmark_query.name].append(run_query(benchmark_query, translation))
+
+        query2memory = {}
+        if measure_memory:
+            logging.info('Measuring peak memory...')
+            for benchmark_query in workload:
+                tracemalloc.start()
+                try:
+                    run_query(benchmark_query, translation)
+                    query2memory[benchmark_query.name] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+    finally:
+        event.remove(engine, "before_cursor_execute", _count_statement)
+
+    query_results = []
+    for benchmark_query in workload:
+        cold, *warm = query2executions[benchmark_query.name]
+        query_result = benchmark_query.to_dict()
+        query_result.update(documents=cold["documents"], response_bytes=cold["response_bytes"],
+                            cold_ms={stage: round(ms, 2) for stage, ms in get_stage_durations(cold).items()},
+                            warm=summarize_durations(warm), rows=cold["counters"],
+                            peak_memory_bytes=query2memory.get(benchmark_query.name))
+        query_results.append(query_result)
+
+    all_executions = list(query2executions.values())
+    rows = {}
+    for query_result in query_results:
+        for counter, value in query_result["rows"].items():
+            rows[counter] = rows.get(counter, 0) + value
+    summary = dict(cold=summarize_durations([e[0] for e in all_executions]),
+                   warm=summarize_durations([e for executions in all_executions for e in executions[1:]]),
+                   rows=rows,
+                   peak_memory_bytes=max(query2memory.values()) if query2memory else None,
+                   max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    meta = dict(timestamp=datetime.now().isoformat(timespec="seconds"), database=repr(engine.url),
+                database_update=database_update, queries=len(workload), runs=runs,
+                python=sys.version.split()[0])
+    return dict(meta=meta, summary=summary, queries=query_results)
+
+
+def _is_regression(old, new, threshold: float, min_difference: float = 0.0) -> bool:
+    if old is None or new is None:
+        return False
+    return new > old * (1 + threshold) and new - old > min_difference
+
+
+def compare_with_baseline(results: dict, baseline: dict, thresholds: Dict[str, float] = None,
+                          min_latency_difference_ms: float = BENCHMARK_MIN_LATENCY_DIFFERENCE_MS) -> List[str]:
+    """
+    Compares benchmark results with a baseline
+    Latency percentiles of each stage are compared in the summary, the warm median latency, the peak memory and the
+    rows scanned are compared per query (queries are matched by their names).
+    :param results: the current benchmark results
+    :param baseline: the benchmark results of the baseline
+    :param thresholds: relative increases (latency, memory and rows) that are reported as regressions
+    :param min_latency_difference_ms: latency increases below this value are ignored
+    :return: a list of regression descriptions (empty if there is none)
+    """
+    thresholds = {**BENCHMARK_THRESHOLDS, **(thresholds or {})}
+    if results["meta"].get("database_update") != baseline["meta"].get("database_update"):
+        logging.warning(f'Database snapshots differ (baseline: {baseline["meta"].get("database_update")} / '
+                        f'current: {results["meta"].get("database_update")}) - results might not be comparable')
+
+    regressions = []
+    for temperature in ["cold", "warm"]:
+        for stage, percentiles in results["summary"][temperature].items():
+            for percentile, ms in percentiles.items():
+                old = baseline["summary"].get(temperature, {}).get(stage, {}).get(percentile)
+                if _is_regression(old, ms, thresholds["latency"], min_latency_difference_ms):
+                    regressions.append(f'{temperature} {stage} {percentile}: {old} ms -> {ms} ms')
+
+    name2baseline = {q["name"]: q for q in baseline["queries"]}
+    for query_result in results["queries"]:
+        old = name2baseline.get(query_result["name"])
+        if not old:
+            continue
+        name = query_result["name"]
+        old_ms = old["warm"].get("total", {}).get("p50")
+        new_ms = query_result["warm"].get("total", {}).get("p50")
+        if _is_regression(old_ms, new_ms, thresholds["latency"], min_latency_difference_ms):
+            regressions.append(f'{name} warm total p50: {old_ms} ms -> {new_ms} ms')
+        if _is_regression(old["peak_memory_bytes"], query_result["peak_memory_bytes"], thresholds["memory"]):
+            regressions.append(f'{name} peak memory: {old["peak_memory_bytes"]} -> '
+                               f'{query_result["peak_memory_bytes"]} bytes')
+        for counter, value in query_result["rows"].items():
+            if _is_regression(old["rows"].get(counter), value, thresholds["rows"]):
+                regressions.append(f'{name} {counter}: {old["rows"][counter]} -> {value}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the query engine with a workload and compares the '
+                                                 'results with a baseline')
+    parser.add_argument('result_file', help='Path to the result .json file')
+    parser.add_argument('--workload', choices=["common", "log", "synthetic"], default="common",
+                        help='common queries, recorded queries (query logs) or queries for a synthetic corpus')
+    parser.add_argument('--collections', nargs="+", default=["PubMed"], help='The queried document collections')
+    parser.add_argument('--runs', type=int, default=5, help='Executions per query (the first one is cold)')
+    parser.add_argument('--log-dir', default=os.path.join(LOG_DIR, "queries"), help='Directory of the query logs')
+    parser.add_argument('--limit', type=int, default=None, help='Use only the latest queries of the query logs')
+    parser.add_argument('--queries', type=int, default=100, help='Number of synthetic queries')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic queries')
+    parser.add_argument('--entities', type=int, default=NUMBER_OF_ENTITIES,
+                        help='Number of entities of the synthetic corpus')
+    parser.add_argument('--relations', type=int, default=NUMBER_OF_RELATIONS,
+                        help='Number of relations of the synthetic corpus')
+    parser.add_argument('--no-memory', action="store_true", help='Do not measure the peak memory')
+    parser.add_argument('--baseline', help='Compare the results with this result file')
+    parser.add_argument('--threshold', action="append", default=[], metavar="KIND=VALUE",
+                        help='Relative increase that is a regression (latency, memory or rows, e.g. latency=0.1)')
+    parser.add_argument('--min-latency-ms', type=float, default=BENCHMARK_MIN_LATENCY_DIFFERENCE_MS,
+                        help='Latency increases below this value are ignored')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        level=logging.INFO)
+
+    thresholds = {}
+    for threshold in args.threshold:
+        kind, value = threshold.split("=", 1)
+        if kind not in BENCHMARK_THRESHOLDS:
+            parser.error(f'Unknown threshold kind: {kind}')
+        thresholds[kind] = float(value)
+
+    if args.workload == "common":
+        workload = load_common_queries_workload(args.collections)
+    elif args.workload == "log":
+        workload = load_query_log_workload(args.log_dir, args.limit)
+    else:
+        workload = generate_synthetic_workload(args.collections, args.queries, args.seed, args.entities,
+                                               args.relations)
+    logging.info(f'Benchmarking {len(workload)} queries with {args.runs} runs...')
+
+    results = run_benchmark(workload, runs=args.runs, measure_memory=not args.no_memory)
+    results["meta"]["workload"] = args.workload
+    with open(args.result_file, 'wt') as f:
+        json.dump(results, f, indent=1)
+    logging.info(f'Cold latency: {results["summary"]["cold"].get("total")} / '
+                 f'warm latency: {results["summary"]["warm"].get("total")}')
+
+    if args.baseline:
+        with open(args.baseline, 'rt') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, thresholds, args.min_latency_ms)
+        for regression in regressions:
+            logging.error(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+        logging.info('No regressions compared to the baseline')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,23 @@
 import ast
 import itertools
 import logging
+import time
 from collections import defaultdict
 from datetime import datetime
-from typing import Set, Dict, List
+from typing import Set, Dict, List, Tuple
+
+from sqlalchemy import and_
 
 from narraint.backend.database import SessionExtended
 from narraint.backend.models import Predication, Sentence, \
-    PredicationInvertedIndex, DocumentMetadataService, TagInvertedIndex, TermInvertedIndex
+    PredicationInvertedIndex, DocumentMetadataService, TagInvertedIndex, TermInvertedIndex, SubstitutionCount
 from narraint.queryengine.expander import QueryExpander
 from narraint.queryengine.optimizer import QueryOptimizer
 from narraint.queryengine.query import GraphQuery, FactPattern
 from narraint.queryengine.query_hints import DO_NOT_CARE_PREDICATE, VAR_NAME, VAR_TYPE, ENTITY_TYPE_VARIABLE
 from narraint.queryengine.result import QueryFactExplanation, QueryEntitySubstitution, QueryExplanation, \
     QueryDocumentResult
+from narraint.queryengine.tracing import trace_span, trace_count, trace_duration
 from narrant.entity.entity import Entity
 
 QUERY_DOCUMENT_LIMIT = 1500000
@@ -65,9 +69,13 @@ class QueryEngine:
             predication_ids.update(pred_ids)
 
         session = SessionExtended.get()
+        # predications and their sentences are retrieved by a single query
         query = session.query(Predication.id,
                               Predication.sentence_id, Predication.predicate, Predication.relation,
-                              Predication.subject_str, Predication.object_str, Predication.confidence) \
+                              Predication.subject_str, Predication.object_str, Predication.confidence,
+                              Sentence.text) \
+            .join(Sentence, and_(Sentence.id == Predication.sentence_id,
+                                 Sentence.document_collection == Predication.document_collection)) \
             .filter(Predication.id.in_(predication_ids))
 
         prov_id2fp_idx = defaultdict(set)
@@ -75,18 +83,17 @@ class QueryEngine:
             for p_id in prov_ids:
                 prov_id2fp_idx[p_id].add(fact_idx)
 
-        sentence_ids = set()
+        id2sentence = {}
         query_explanation = QueryExplanation()
         for r in query:
-            sentence_ids.add(r[1])
+            id2sentence[r[1]] = r[7]
             for fp_idx in prov_id2fp_idx[r[0]]:
                 query_explanation.integrate_explanation(
                     QueryFactExplanation(fp_idx, r[1], r[2], r[3], r[4], r[5], r[6], r[0]))
 
         # replace all sentence ids by sentence str
-        id2sentence = QueryEngine.query_sentences_for_sent_ids(sentence_ids)
         for e in query_explanation.explanations:
-            e.sentence = id2sentence[e.sentence]
+            e.sentence = QueryEngine.shorten_sentence(e.sentence, id2sentence[e.sentence])
 
         return query_explanation
 
@@ -137,23 +144,9 @@ class QueryEngine:
 
         logging.debug("Query provenance information for doc {} ({})".format(document_id, document_collection))
 
-        # retrieve all predications for the provided document
-        session = SessionExtended.get()
-        query = session.query(Predication.id, Predication.sentence_id, Predication.predicate, Predication.relation,
-                              Predication.subject_str, Predication.subject_id, Predication.subject_type,
-                              Predication.object_str, Predication.object_id, Predication.object_type,
-                              Predication.confidence)
-        query = query.filter(Predication.document_id == document_id)
-        query = query.filter(Predication.document_collection == document_collection)
-
-        if query.count() == 0:
-            logging.error('No predications for the document exist')
-            return query_explanation
-
-        sentence_ids = set()
-
-        # query for each fact pattern
-        for index, fp in enumerate(graph_query.fact_patterns):
+        # compute the expanded subjects, predicates and objects for each fact pattern
+        fact_pattern_constraints = []
+        for fp in graph_query.fact_patterns:
             subject_ids = set(s.entity_id for s in fp.subjects)
             subject_types = set(s.entity_type for s in fp.subjects)
             predicates = {fp.predicate}
@@ -169,21 +162,47 @@ class QueryEngine:
 
             # ignore predicate when type equals "associated"
             ignore_predicate = (len(predicates) == 1 and list(predicates)[0] == DO_NOT_CARE_PREDICATE)
+            fact_pattern_constraints.append((subject_ids, subject_types, predicates, object_ids, object_types,
+                                             ignore_predicate))
+
+        # retrieve the predications of the provided document that might match any fact pattern (with sentences)
+        session = SessionExtended.get()
+        query = session.query(Predication.id, Predication.sentence_id, Predication.predicate, Predication.relation,
+                              Predication.subject_str, Predication.subject_id, Predication.subject_type,
+                              Predication.object_str, Predication.object_id, Predication.object_type,
+                              Predication.confidence, Sentence.text)
+        query = query.join(Sentence, and_(Sentence.id == Predication.sentence_id,
+                                          Sentence.document_collection == Predication.document_collection))
+        query = query.filter(Predication.document_id == document_id)
+        query = query.filter(Predication.document_collection == document_collection)
+        query = query.filter(Predication.subject_id.in_(set().union(*(c[0] for c in fact_pattern_constraints))))
+        query = query.filter(Predication.subject_type.in_(set().union(*(c[1] for c in fact_pattern_constraints))))
+        query = query.filter(Predication.object_id.in_(set().union(*(c[3] for c in fact_pattern_constraints))))
+        query = query.filter(Predication.object_type.in_(set().union(*(c[4] for c in fact_pattern_constraints))))
+        if not any(c[5] for c in fact_pattern_constraints):
+            query = query.filter(Predication.relation.in_(set().union(*(c[2] for c in fact_pattern_constraints))))
+        rows = query.all()
+
+        if len(rows) == 0:
+            logging.error('No matching predications for the document exist')
+            return query_explanation
 
-            # match fact patterns against predications
-            for r in query:
+        # match fact patterns against the retrieved predications
+        id2sentence = {}
+        for index, (subject_ids, subject_types, predicates, object_ids, object_types, ignore_predicate) \
+                in enumerate(fact_pattern_constraints):
+            for r in rows:
                 if (r.subject_id in subject_ids and r.subject_type in subject_types
                         and r.object_id in object_ids and r.object_type in object_types
                         and (ignore_predicate or r.relation in predicates)):
                     fact_explanation = QueryFactExplanation(str(index), r.sentence_id, r.predicate, r.relation,
                                                             r.subject_str, r.object_str, r.confidence, r.id)
                     query_explanation.integrate_explanation(fact_explanation)
-                    sentence_ids.add(r.sentence_id)
+                    id2sentence[r.sentence_id] = r.text
 
         # replace all sentence ids by sentence str
-        id2sentence = QueryEngine.query_sentences_for_sent_ids(sentence_ids)
         for e in query_explanation.explanations:
-            e.sentence = id2sentence[e.sentence]
+            e.sentence = QueryEngine.shorten_sentence(e.sentence, id2sentence[e.sentence])
         return query_explanation
 
     @staticmethod
@@ -213,28 +232,35 @@ class QueryEngine:
                 title = title[0:500]
             doc2metadata[int(r.document_id)] = (title, authors, journals, year, month, doi, org_id, doc_classes)
 
+        trace_count("metadata_rows", len(doc2metadata))
         return doc2metadata
 
     @staticmethod
-    def query_sentences_for_sent_ids(sentence_ids: Set[int]):
+    def query_sentences_for_sent_ids(sentence_ids: Set[int], document_collection: str):
         """
-        Query the sentences for a set of doc ids and sentence ids
+        Query the sentences for a set of sentence ids (used by the document graph, provenance queries retrieve
+        their sentences together with the predications)
         :param sentence_ids: a set of sentence ids
-        :return: dict mapping docids to titles, dict mapping sentence ids to sentence texts
+        :param document_collection: the collection of the sentences (sentence ids are only unique per collection)
+        :return: dict mapping sentence ids to sentence texts
         """
         session = SessionExtended.get()
         # Query the sentences
-        q_sentences = session.query(Sentence.id, Sentence.text).filter(Sentence.id.in_(sentence_ids))
+        q_sentences = session.query(Sentence.id, Sentence.text).filter(Sentence.id.in_(sentence_ids)) \
+            .filter(Sentence.document_collection == document_collection)
         id2sentences = {}
         for r in q_sentences:
-            sent = r[1]
-            if len(sent) > 1500:
-                logging.debug('long sentence detected for: {}'.format(r[0]))
-                sent = '{}[...]'.format(sent[0:1500])
-            id2sentences[int(r[0])] = sent
+            id2sentences[int(r[0])] = QueryEngine.shorten_sentence(r[0], r[1])
 
         return id2sentences
 
+    @staticmethod
+    def shorten_sentence(sentence_id: int, sentence: str) -> str:
+        if len(sentence) > 1500:
+            logging.debug('long sentence detected for: {}'.format(sentence_id))
+            sentence = '{}[...]'.format(sentence[0:1500])
+        return sentence
+
     @staticmethod
     def query_inverted_index_for_fact_pattern(fact_pattern: FactPattern, document_collection_filter: Set[str] = None):
         """
@@ -328,8 +354,11 @@ class QueryEngine:
         collection2doc_ids = dict()
         # compute the list of substitutions for the variables
         var2subs = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+        rows_fetched, ids_decoded = 0, 0
         for result in query:
             document_ids = set(PredicationInvertedIndex.prepare_document_ids(result.document_ids))
+            rows_fetched += 1
+            ids_decoded += len(document_ids)
             doc_col = result.document_collection
 
             # add the new documents to the existing collection, if existing
@@ -345,6 +374,8 @@ class QueryEngine:
                 elif position == 'object':
                     sub_id, sub_type = result.object_id, result.object_type
                 var2subs[var_name][doc_col][(sub_id, sub_type)].update(document_ids)
+        trace_count("inverted_index_rows", rows_fetched)
+        trace_count("document_ids_decoded", ids_decoded)
         return collection2doc_ids, var2subs
 
     @staticmethod
@@ -506,7 +537,9 @@ class QueryEngine:
                                                          org_document_id=None, doi=None,
                                                          document_collection=d_col, document_classes=None))
         if load_document_metadata:
-            query_results = QueryEngine.enrich_document_results_with_metadata(query_results, collection2valid_doc_ids)
+            with trace_span("engine.metadata"):
+                query_results = QueryEngine.enrich_document_results_with_metadata(query_results,
+                                                                                  collection2valid_doc_ids)
 
         logging.debug(f'{len(query_results)} results computed')
         return query_results
@@ -539,20 +572,24 @@ class QueryEngine:
 
         logging.debug(f'Executing query {graph_query}...')
         for idx, fact_pattern in enumerate(graph_query):
-            collection2doc_ids, var2subs = QueryEngine.query_inverted_index_for_fact_pattern(fact_pattern,
-                                                                                        document_collection_filter=document_collection_filter)
+            with trace_span("engine.inverted_index"):
+                collection2doc_ids, var2subs = QueryEngine.query_inverted_index_for_fact_pattern(fact_pattern,
+                                                                                            document_collection_filter=document_collection_filter)
             # must the fact pattern be expanded?
             for e_fp in QueryExpander.expand_fact_pattern(fact_pattern):
                 logging.debug(f'Expand {fact_pattern} to {e_fp}')
-                collection2docs_expanded, var2subs_ex = QueryEngine.query_inverted_index_for_fact_pattern(e_fp,
-                                                                                       document_collection_filter=document_collection_filter)
+                with trace_span("engine.inverted_index"):
+                    collection2docs_expanded, var2subs_ex = QueryEngine.query_inverted_index_for_fact_pattern(e_fp,
+                                                                                           document_collection_filter=document_collection_filter)
                 QueryEngine.merge_var2subs(var2subs, var2subs_ex)
                 QueryEngine.merge_collection2docs(collection2doc_ids, collection2docs_expanded)
 
             # Next compute the intersection of document ids with prior result sets
+            intersection_start = time.perf_counter()
             if idx == 0:
                 collection2valid_doc_ids = collection2doc_ids
             else:
+                trace_count("intersections")
                 for d_col in collection2valid_doc_ids:
                     if d_col in collection2doc_ids:
                         collection2valid_doc_ids[d_col] = collection2valid_doc_ids[d_col].intersection(collection2doc_ids[d_col])
@@ -595,6 +632,7 @@ class QueryEngine:
                             # now restrict the valid document ids to compatible document ids
                             collection2valid_doc_ids[d_col] = collection2valid_doc_ids[d_col].intersection(
                                 compatible_doc_ids)
+            trace_duration("engine.intersection", time.perf_counter() - intersection_start)
 
         logging.debug(f'Query computed in {datetime.now() - start_time}s')
         # Construct the results
@@ -625,7 +663,9 @@ class QueryEngine:
                 logging.debug(f'After filtering with entities: {len(d_ids)} doc_ids left')
 
         logging.debug(f'Entity and term filter computed in {datetime.now() - et_query_start}s')
+        trace_duration("engine.term_entity_filter", (datetime.now() - et_query_start).total_seconds())
 
+        results_start = time.perf_counter()
         # No variables are used in the query
         if len(collection2valid_subs) == 0:
             for d_col, d_ids in collection2valid_doc_ids.items():
@@ -654,6 +694,9 @@ class QueryEngine:
                                 doc2substitution[d_id][var_name].add((sub[0], sub[1]))
 
                 var_names = list([v for v in collection2valid_subs])
+                # substitutions (and their mappings) are shared by all documents with the same substitution
+                sub_key2substitution = {}
+                shared_sub2var2sub = {}
                 for d_id, var2sub in doc2substitution.items():
                     list_of_substitutions = []
                     for var_name in var_names:
@@ -664,10 +707,17 @@ class QueryEngine:
                     shared_substitutions = itertools.product(*list_of_substitutions)
                     # Easy situation: List of substitutions for a single variable
                     for shared_sub in shared_substitutions:
-                        var2sub_for_doc = {}
-                        for idx, var_name in enumerate(var_names):
-                            var2sub_for_doc[var_name] = QueryEntitySubstitution("", shared_sub[idx][0],
-                                                                                shared_sub[idx][1])
+                        if shared_sub in shared_sub2var2sub:
+                            var2sub_for_doc = shared_sub2var2sub[shared_sub]
+                        else:
+                            var2sub_for_doc = {}
+                            for idx, var_name in enumerate(var_names):
+                                sub_key = shared_sub[idx]
+                                if sub_key not in sub_key2substitution:
+                                    sub_key2substitution[sub_key] = QueryEntitySubstitution("", sub_key[0],
+                                                                                            sub_key[1])
+                                var2sub_for_doc[var_name] = sub_key2substitution[sub_key]
+                            shared_sub2var2sub[shared_sub] = var2sub_for_doc
 
                         query_results.append(QueryDocumentResult(int(d_id), title="", authors="", journals="",
                                                                  publication_year=0, publication_month=0,
@@ -678,13 +728,84 @@ class QueryEngine:
                                                                  document_collection=d_col,
                                                                  document_classes=None))
 
+        trace_duration("engine.results", time.perf_counter() - results_start)
+        trace_count("document_results", len(query_results))
+
         # Apply metadata filter in the end
         if load_document_metadata:
-            query_results = QueryEngine.enrich_document_results_with_metadata(query_results, collection2valid_doc_ids)
+            with trace_span("engine.metadata"):
+                query_results = QueryEngine.enrich_document_results_with_metadata(query_results,
+                                                                                  collection2valid_doc_ids)
 
         query_results.sort(key=lambda x: x.document_id, reverse=True)
         return query_results
 
+    @staticmethod
+    def query_substitution_counts(graph_query: GraphQuery, document_collection: str) \
+            -> List[Tuple[QueryEntitySubstitution, int]]:
+        """
+        Answers a query with a single fact pattern and a single variable (e.g. Metformin treats ?X(Disease))
+        by the precomputed substitution count table (see compute_substitution_counts)
+        :param graph_query: a graph query object
+        :param document_collection: the document collection
+        :return: a list of (substitution, document count) sorted by count descending or None if the query cannot
+                 be answered by the precomputed counts (then the query must be processed by the engine)
+        """
+        if graph_query.has_terms() or graph_query.has_entities():
+            return None
+        graph_query = QueryOptimizer.optimize_query(graph_query)
+        if not graph_query or len(graph_query.fact_patterns) != 1:
+            return None
+        fact_pattern = graph_query.fact_patterns[0]
+        if fact_pattern.predicate == DO_NOT_CARE_PREDICATE or fact_pattern.get_subject_class() \
+                or fact_pattern.get_object_class():
+            return None
+
+        subject_vars = [s for s in fact_pattern.subjects if s.entity_type == ENTITY_TYPE_VARIABLE]
+        object_vars = [o for o in fact_pattern.objects if o.entity_type == ENTITY_TYPE_VARIABLE]
+        if len(subject_vars) == 1 and len(fact_pattern.subjects) == 1 and not object_vars:
+            variable, fixed_entities, variable_position = subject_vars[0], fact_pattern.objects, "subject"
+        elif len(object_vars) == 1 and len(fact_pattern.objects) == 1 and not subject_vars:
+            variable, fixed_entities, variable_position = object_vars[0], fact_pattern.subjects, "object"
+        else:
+            return None
+        # counts of symmetric expansions are only stored for the object position
+        if QueryExpander.is_symmetric_expansion(fact_pattern.predicate):
+            variable_position = "object"
+
+        session = SessionExtended.get()
+        query = session.query(SubstitutionCount.substitution_id, SubstitutionCount.substitution_type,
+                              SubstitutionCount.support, SubstitutionCount.max_document_id)
+        query = query.filter(SubstitutionCount.document_collection == document_collection)
+        query = query.filter(SubstitutionCount.entity_id.in_({e.entity_id for e in fixed_entities}))
+        query = query.filter(SubstitutionCount.entity_type.in_(
+            QueryExpander.expand_entity_types([e.entity_type for e in fixed_entities])))
+        query = query.filter(SubstitutionCount.relation == fact_pattern.predicate)
+        query = query.filter(SubstitutionCount.variable_position == variable_position)
+        var_type = VAR_TYPE.search(variable.entity_id)
+        if var_type:
+            query = query.filter(SubstitutionCount.substitution_type.in_(
+                QueryExpander.expand_entity_types([var_type.group(1)])))
+
+        sub2count = {}
+        for row in query:
+            key = (row.substitution_id, row.substitution_type)
+            if key in sub2count:
+                # substitution is shared by several fixed entities - the documents must be merged by the engine
+                return None
+            sub2count[key] = (row.support, row.max_document_id)
+
+        # no counts might also mean that the collection was not materialized yet
+        if not sub2count:
+            return None
+        if sum(support for support, _ in sub2count.values()) > QUERY_DOCUMENT_LIMIT:
+            return None
+
+        # like the engine: more documents first and the latest document first for equal counts
+        ranked = sorted(sub2count.items(), key=lambda x: x[1], reverse=True)
+        return [(QueryEntitySubstitution("", sub_id, sub_type), support)
+                for (sub_id, sub_type), (support, _) in ranked]
+
     @staticmethod
     def query_predicates(collection=None):
         session = SessionExtended.get()
@@ -1,5 +1,5 @@
 import itertools
-from typing import List
+from typing import List, Set, Tuple
 
 from narraint.queryengine.query import GraphQuery, FactPattern
 from narrant.cleaning.pharmaceutical_vocabulary import ENTITY_TYPE_EXPANSION, PREDICATE_EXPANSION, SYMMETRIC_PREDICATES
@@ -34,6 +34,31 @@ class QueryExpander:
         else:
             return []
 
+    @staticmethod
+    def expand_predicate_directions(predicate: str) -> Set[Tuple[str, bool]]:
+        """
+        Computes the relations that are retrieved for a fact pattern with the given predicate
+        E.g. associated is retrieved in both directions
+        :param predicate: the predicate of a fact pattern
+        :return: a set of (relation, flipped) tuples, flipped is true if subject and object are swapped
+        """
+        subjects, objects = [], []
+        directions = {(predicate, False)}
+        for e_fp in QueryExpander.expand_fact_pattern(FactPattern(subjects, predicate, objects)):
+            directions.add((e_fp.predicate, e_fp.subjects is objects))
+        return directions
+
+    @staticmethod
+    def is_symmetric_expansion(predicate: str) -> bool:
+        """
+        Checks whether a fact pattern with the given predicate retrieves the same relations in both directions
+        (then X predicate Y and Y predicate X yield the same results)
+        :param predicate: the predicate of a fact pattern
+        :return: true if the expansion is symmetric
+        """
+        directions = QueryExpander.expand_predicate_directions(predicate)
+        return directions == {(relation, not flipped) for relation, flipped in directions}
+
     @staticmethod
     def expand_query(graph_query: GraphQuery) -> List[GraphQuery]:
         """
@@ -0,0 +1,170 @@
+import argparse
+import itertools
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, select, union_all
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import PredicationInvertedIndex, SubstitutionCount
+from narraint.config import BULK_INSERT_AFTER_K
+from narraint.queryengine.expander import QueryExpander
+from narrant.cleaning.pharmaceutical_vocabulary import PREDICATE_EXPANSION
+
+"""
+Materializes the number of documents per substitution for fact patterns with a single fixed entity and a single
+variable, e.g. Metformin treats ?X(Disease). Substitutions that are retrieved by several expanded relations
+(e.g. associated is queried in both directions) are counted once per document, like in the query engine.
+Counts of symmetric expansions are stored for the variable position object only.
+"""
+
+
+def get_variable_positions(predicate: str) -> [str]:
+    if QueryExpander.is_symmetric_expansion(predicate):
+        return ["object"]
+    return ["subject", "object"]
+
+
+def get_max_document_id(document_ids_str: str) -> int:
+    # the inverted index stores document ids in descending order
+    return int(document_ids_str.strip("[]").split(",", 1)[0])
+
+
+def count_substitutions(rows):
+    """
+    Counts the documents per substitution of a single fixed entity
+    :param rows: iterable of (substitution_id, substitution_type, support, document_ids) from the inverted index
+    :return: a dict mapping (substitution_id, substitution_type) to (support, max document id)
+    """
+    sub2docs = {}
+    for sub_id, sub_type, support, document_ids in rows:
+        key = (sub_id, sub_type)
+        if key not in sub2docs:
+            sub2docs[key] = (support, document_ids)
+            continue
+        # substitution was retrieved by another relation - documents must be merged
+        known = sub2docs[key]
+        if not isinstance(known, set):
+            known = set(PredicationInvertedIndex.prepare_document_ids(known[1]))
+            sub2docs[key] = known
+        known.update(PredicationInvertedIndex.prepare_document_ids(document_ids))
+
+    sub2count = {}
+    for key, docs in sub2docs.items():
+        if isinstance(docs, set):
+            sub2count[key] = (len(docs), max(docs))
+        else:
+            sub2count[key] = (docs[0], get_max_document_id(docs[1]))
+    return sub2count
+
+
+def query_rows_for_fixed_entities(document_collection: str, predicate: str, variable_position: str):
+    """
+    Builds a statement that retrieves the inverted index rows for the fact pattern 'fixed entity predicate ?X'
+    (or '?X predicate fixed entity' if the variable is the subject) ordered by the fixed entity
+    :param document_collection: the document collection
+    :param predicate: the queried predicate (will be expanded)
+    :param variable_position: subject or object
+    :return: a select statement
+    """
+    fixed_position2relations = {"subject": set(), "object": set()}
+    for relation, flipped in QueryExpander.expand_predicate_directions(predicate):
+        if (variable_position == "object") != flipped:
+            fixed_position2relations["subject"].add(relation)
+        else:
+            fixed_position2relations["object"].add(relation)
+
+    pii = PredicationInvertedIndex
+    statements = []
+    for fixed_position, relations in fixed_position2relations.items():
+        if not relations:
+            continue
+        if fixed_position == "subject":
+            columns = [pii.subject_id, pii.subject_type, pii.object_id, pii.object_type]
+        else:
+            columns = [pii.object_id, pii.object_type, pii.subject_id, pii.subject_type]
+        fixed_id, fixed_type, sub_id, sub_type = columns
+        statements.append(select(fixed_id.label("fixed_id"), fixed_type.label("fixed_type"),
+                                 sub_id.label("sub_id"), sub_type.label("sub_type"),
+                                 pii.support, pii.document_ids)
+                          .where(pii.document_collection == document_collection)
+                          .where(pii.relation.in_(sorted(relations))))
+
+    statement = statements[0] if len(statements) == 1 else union_all(*statements)
+    # rows of the same fixed entity must be adjacent
+    return statement.order_by(statement.selected_columns.fixed_id, statement.selected_columns.fixed_type)
+
+
+def compute_substitution_counts(document_collection: str = None):
+    """
+    Recomputes the substitution count table from the predication inverted index
+    Must be executed after the inverted index was updated
+    :param document_collection: only recompute the counts of this collection (all collections if None)
+    """
+    start_time = datetime.now()
+    session = SessionExtended.get()
+    if document_collection:
+        document_collections = [document_collection]
+    else:
+        document_collections = sorted(r[0] for r in session.query(PredicationInvertedIndex.document_collection)
+                                      .distinct())
+
+    for collection in document_collections:
+        logging.info(f'Deleting old substitution counts for {collection}...')
+        session.execute(delete(SubstitutionCount).where(SubstitutionCount.document_collection == collection))
+        session.commit()
+
+        relations = {r[0] for r in session.query(PredicationInvertedIndex.relation)
+                     .filter(PredicationInvertedIndex.document_collection == collection).distinct()}
+        predicates = sorted(relations.union(PREDICATE_EXPANSION))
+
+        insert_list = []
+        row_count = 0
+        for predicate in predicates:
+            for variable_position in get_variable_positions(predicate):
+                logging.info(f'Counting substitutions for {collection}: {predicate} (variable {variable_position})')
+                statement = query_rows_for_fixed_entities(collection, predicate, variable_position)
+                rows = session.execute(statement.execution_options(stream_results=True))
+                for (fixed_id, fixed_type), fixed_rows in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+                    sub2count = count_substitutions(r[2:] for r in fixed_rows)
+                    for (sub_id, sub_type), (support, max_document_id) in sub2count.items():
+                        insert_list.append(dict(document_collection=collection,
+                                                entity_id=fixed_id,
+                                                entity_type=fixed_type,
+                                                relation=predicate,
+                                                variable_position=variable_position,
+                                                substitution_id=sub_id,
+                                                substitution_type=sub_type,
+                                                support=support,
+                                                max_document_id=max_document_id))
+                    if len(insert_list) >= BULK_INSERT_AFTER_K:
+                        row_count += len(insert_list)
+                        SubstitutionCount.bulk_insert_values_into_table(session, insert_list, check_constraints=False,
+                                                                        commit=False)
+                        insert_list.clear()
+
+        if insert_list:
+            row_count += len(insert_list)
+            SubstitutionCount.bulk_insert_values_into_table(session, insert_list, check_constraints=False,
+                                                            commit=False)
+            insert_list.clear()
+        session.commit()
+        logging.info(f'{row_count} substitution counts stored for {collection}')
+
+    logging.info(f"Substitution count table created. Took me {datetime.now() - start_time} minutes.")
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", required=False, default=None,
+                        help="Only recompute the substitution counts of this document collection")
+    args = parser.parse_args()
+
+    compute_substitution_counts(document_collection=args.collection)
+
+
+if __name__ == "__main__":
+    main()
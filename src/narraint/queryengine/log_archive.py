@@ -0,0 +1,261 @@
+import argparse
+import logging
+import os
+import re
+from datetime import datetime, date
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from narraint.config import LOG_DIR
+
+LOG_ARCHIVE_DIR = os.path.join(LOG_DIR, "archive")
+
+# columns that are not stored as strings in the archive
+LOG_COLUMN_TYPES = {
+    "timestamp": pa.timestamp("s"),
+    "time_needed": pa.float64(),
+    "cache_hit": pa.bool_(),
+    "success": pa.bool_(),
+    "hits": pa.int64(),
+    "facts": pa.int64(),
+}
+
+LOG_FILE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})-.*\.log$")
+TIME_NEEDED_PATTERN = re.compile(r"^(?:(\d+) days?, )?(\d+):(\d{2}):(\d{2}(?:\.\d+)?)$")
+
+
+def get_column_name(header_column: str) -> str:
+    """
+    Translates a log header column (e.g. 'time needed' or '#facts') into an archive column name
+    :param header_column: column of the log header
+    :return: column name in lower snake case
+    """
+    return re.sub(r"\W+", "_", header_column.strip().lower()).strip("_")
+
+
+def parse_time_needed(value: str):
+    """
+    Parses the time needed column which is logged as a timedelta string (e.g. 0:00:01.250000) or in seconds
+    :param value: logged value
+    :return: the time needed in seconds or None
+    """
+    match = TIME_NEEDED_PATTERN.match(value)
+    if match:
+        days, hours, minutes, seconds = match.groups()
+        return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_log_value(column: str, value: str):
+    if column == "timestamp":
+        return datetime.strptime(value, "%Y.%m.%d-%H:%M:%S")
+    if column == "time_needed":
+        return parse_time_needed(value)
+    column_type = LOG_COLUMN_TYPES.get(column)
+    if column_type == pa.bool_():
+        return value == "True"
+    if column_type == pa.int64():
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return value
+
+
+def read_log_file(log_file: str) -> pa.Table:
+    """
+    Reads a TSV log file written by the QueryLogger into a typed table
+    :param log_file: path to the log file
+    :return: a table with one column per header column
+    """
+    with open(log_file, 'rt', errors='replace') as f:
+        header = [get_column_name(c) for c in f.readline().rstrip().split('\t')]
+        columns = {c: [] for c in header}
+        for line in f:
+            details = line.rstrip('\n').split('\t')
+            if len(details) < len(header):
+                continue
+            try:
+                values = [parse_log_value(c, v.strip()) for c, v in zip(header, details)]
+            except ValueError:
+                logging.debug(f'Skipping malformed log line in {log_file}: {line}')
+                continue
+            for c, v in zip(header, values):
+                columns[c].append(v)
+
+    schema = pa.schema([(c, LOG_COLUMN_TYPES.get(c, pa.string())) for c in header])
+    return pa.table(columns, schema=schema)
+
+
+def compact_logs(log_dir=LOG_DIR, archive_dir=LOG_ARCHIVE_DIR, today=None) -> int:
+    """
+    Rolls closed daily TSV log files into a parquet archive which is partitioned by log type and month
+    (archive_dir/log_type=queries/month=2024-01/2024-01-15.parquet). Log files of today are still written and
+    skipped, files that are already archived are skipped as well.
+    :param log_dir: the log directory of the QueryLogger
+    :param archive_dir: the archive directory
+    :param today: files of this and later days are not compacted
+    :return: the number of compacted log files
+    """
+    if not today:
+        today = date.today()
+    compacted = 0
+    for log_type in sorted(os.listdir(log_dir)):
+        log_type_dir = os.path.join(log_dir, log_type)
+        if not os.path.isdir(log_type_dir) or os.path.abspath(log_type_dir) == os.path.abspath(archive_dir):
+            continue
+        for filename in sorted(os.listdir(log_type_dir)):
+            match = LOG_FILE_PATTERN.match(filename)
+            if not match:
+                continue
+            day = match.group(1)
+            if date.fromisoformat(day) >= today:
+                continue
+
+            partition_dir = os.path.join(archive_dir, f'log_type={log_type}', f'month={day[:7]}')
+            archive_file = os.path.join(partition_dir, f'{day}.parquet')
+            if os.path.isfile(archive_file):
+                continue
+
+            table = read_log_file(os.path.join(log_type_dir, filename))
+            os.makedirs(partition_dir, exist_ok=True)
+            pq.write_table(table, f'{archive_file}.tmp')
+            os.replace(f'{archive_file}.tmp', archive_file)
+            compacted += 1
+            logging.debug(f'Compacted {filename} ({table.num_rows} entries) into {archive_file}')
+    return compacted
+
+
+class LogArchive:
+    """
+    Query API for the columnar log archive. Queries only read the requested columns and the month partitions
+    that overlap with the requested time range.
+    """
+
+    def __init__(self, archive_dir=LOG_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+
+    def scan(self, log_type: str, columns=None, start: datetime = None, end: datetime = None,
+             equals: dict = None, min_time_needed: float = None) -> pa.Table:
+        """
+        Scans the archived entries of a log type
+        :param log_type: the log type (e.g. queries or api_calls)
+        :param columns: columns to read (all if None)
+        :param start: only entries logged at or after start
+        :param end: only entries logged before end
+        :param equals: dict mapping columns to required values (e.g. {"cache_hit": True, "route": "subgraph"})
+        :param min_time_needed: only entries that needed more than this many seconds
+        :return: a table with the selected entries
+        """
+        log_type_dir = os.path.join(self.archive_dir, f'log_type={log_type}')
+        if not os.path.isdir(log_type_dir):
+            raise ValueError(f'No archived logs for log type: {log_type}')
+
+        dataset = ds.dataset(log_type_dir, format="parquet", partitioning="hive")
+        expression = None
+        conditions = []
+        if start:
+            conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+            conditions.append(ds.field("timestamp") >= pa.scalar(start, type=pa.timestamp("s")))
+        if end:
+            conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+            conditions.append(ds.field("timestamp") < pa.scalar(end, type=pa.timestamp("s")))
+        if equals:
+            conditions.extend(ds.field(column) == value for column, value in equals.items())
+        if min_time_needed is not None:
+            conditions.append(ds.field("time_needed") > min_time_needed)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def count(self, log_type: str, group_by: [str], start: datetime = None, end: datetime = None,
+              equals: dict = None) -> pa.Table:
+        """
+        Counts archived entries per group
+        :param log_type: the log type
+        :param group_by: the columns to group by
+        :param start: only entries logged at or after start
+        :param end: only entries logged before end
+        :param equals: dict mapping columns to required values
+        :return: a table with the group columns and a count column
+        """
+        table = self.scan(log_type, columns=group_by, start=start, end=end, equals=equals)
+        result = table.group_by(group_by).aggregate([([], "count_all")])
+        return result.rename_columns([c if c != "count_all" else "count" for c in result.column_names])
+
+    def latency_percentiles(self, log_type: str, percentiles=(0.5, 0.9, 0.99), group_by: [str] = None,
+                            start: datetime = None, end: datetime = None, equals: dict = None) -> [dict]:
+        """
+        Computes percentiles of the time needed (in seconds)
+        :param log_type: a log type with a time needed column (e.g. queries or api_calls)
+        :param percentiles: the requested percentiles between 0 and 1
+        :param group_by: the columns to group by (None to compute percentiles over all entries)
+        :param start: only entries logged at or after start
+        :param end: only entries logged before end
+        :param equals: dict mapping columns to required values
+        :return: a list with a dict per group, e.g. [{"month": "2024-01", "percentiles": {0.5: 1.2, 0.9: 3.4}}]
+                 (a single dict with only percentiles if not grouped). Percentiles of groups are approximated by a
+                 t-digest.
+        """
+        columns = ["time_needed"] + (group_by or [])
+        table = self.scan(log_type, columns=columns, start=start, end=end, equals=equals)
+        if not group_by:
+            quantiles = pc.quantile(table["time_needed"], q=list(percentiles))
+            return [dict(percentiles={p: q.as_py() for p, q in zip(percentiles, quantiles)})]
+
+        options = pc.TDigestOptions(q=list(percentiles))
+        result = table.group_by(group_by).aggregate([("time_needed", "tdigest", options)])
+        groups = []
+        for row in result.to_pylist():
+            quantiles = row.pop("time_needed_tdigest")
+            row["percentiles"] = dict(zip(percentiles, quantiles))
+            groups.append(row)
+        return groups
+
+    def slow_entries(self, log_type: str, percentile: float = 0.99, columns=None, start: datetime = None,
+                     end: datetime = None, equals: dict = None) -> pa.Table:
+        """
+        Finds the entries that needed more time than a latency percentile (e.g. to look for slow queries)
+        :param log_type: a log type with a time needed column (e.g. queries or api_calls)
+        :param percentile: the percentile between 0 and 1 that is computed over the selected entries
+        :param columns: columns to read (all if None)
+        :param start: only entries logged at or after start
+        :param end: only entries logged before end
+        :param equals: dict mapping columns to required values
+        :return: a table with the slow entries, sorted by time needed (slowest first)
+        """
+        threshold = self.latency_percentiles(log_type, percentiles=(percentile,), start=start, end=end,
+                                             equals=equals)[0]["percentiles"][percentile]
+        if columns is not None and "time_needed" not in columns:
+            columns = list(columns) + ["time_needed"]
+        if threshold is None:
+            return self.scan(log_type, columns=columns, start=start, end=end, equals=equals).slice(0, 0)
+        table = self.scan(log_type, columns=columns, start=start, end=end, equals=equals,
+                          min_time_needed=threshold)
+        return table.sort_by([("time_needed", "descending")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compacts closed daily log files into a columnar archive')
+    parser.add_argument("--log-dir", default=LOG_DIR, help="log directory of the service")
+    parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR, help="directory of the parquet archive")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        level=logging.INFO)
+
+    logging.info(f'Compacting logs from {args.log_dir} into {args.archive_dir}...')
+    compacted = compact_logs(log_dir=args.log_dir, archive_dir=args.archive_dir)
+    logging.info(f'Finished - {compacted} log files compacted')
+
+
+if __name__ == "__main__":
+    main()
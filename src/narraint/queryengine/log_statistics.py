@@ -1,18 +1,35 @@
+import fcntl
+import heapq
+import json
+import logging
 import os
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, date
 
 from narraint.config import LOG_DIR
 
 narrative_path = os.path.join(LOG_DIR, "queries")
 overview_path = os.path.join(LOG_DIR, "drug_ov_search")
 suggestion_path = os.path.join(LOG_DIR, "drug_suggestion")
+statistics_state_file = os.path.join(LOG_DIR, "daily_logs_cache", "log_statistics_state.json")
+
+GRAPH_TIME_DELTAS = [7, 31, 182, 365]
 
 
 def get_date_of_today():
     return datetime.now().date()
 
 
+def parse_log_line(header_list, line):
+    line = line.lower()
+    details = line.split('\t')
+    details = [x.strip() for x in details]
+    structure = {key: value for key, value in zip(header_list, details)}
+    date_str = structure['timestamp'].split('-')[0]
+    structure["date_object"] = datetime.strptime(date_str, '%Y.%m.%d').date()
+    return structure
+
+
 def get_json_of_log(path):
     data = []
     for filename in os.listdir(path):
@@ -21,13 +38,7 @@ def get_json_of_log(path):
                 headers = f.readline().rstrip()
                 header_list = headers.split('\t')
                 for line in f.readlines():
-                    line = line.lower()
-                    details = line.split('\t')
-                    details = [x.strip() for x in details]
-                    structure = {key: value for key, value in zip(header_list, details)}
-                    date = structure['timestamp'].split('-')[0]
-                    structure["date_object"] = datetime.strptime(date, '%Y.%m.%d').date()
-                    data.append(structure)
+                    data.append(parse_log_line(header_list, line))
         except:
             pass
 
@@ -35,12 +46,8 @@ def get_json_of_log(path):
 
 
 def get_list_of_parameter(json_object, parameter):
-    parameter_list = []
-    for i in json_object:
-        if i.__contains__(parameter) and not i[parameter] in parameter_list:
-            parameter_list.append(i[parameter])
-    parameter_list = sorted(parameter_list)
-    return parameter_list
+    parameter_list = {i[parameter] for i in json_object if parameter in i}
+    return sorted(parameter_list)
 
 
 def get_most_searched_parameter(top_k, json_object_narrative, json_object_overview):
@@ -120,19 +127,18 @@ def get_graph_input_per_time(json_object, time_deltas):
         count_per_day_and_time[time_delta] = defaultdict(int)
 
     for i in json_object:
-        date_object = i["date_object"]
+        days_ago = (today - i["date_object"]).days
         for time_delta in time_deltas:
-            for j in range(0, time_delta + 1):
-                if j == (today - date_object).days:
-                    count_per_day_and_time[time_delta][j] += 1
+            if 0 <= days_ago <= time_delta:
+                count_per_day_and_time[time_delta][days_ago] += 1
 
     return count_per_day_and_time
 
 
 def get_graph_input(json_object_narrative, json_object_overview):
-    result_narrative = get_graph_input_per_time(json_object_narrative, [7, 31, 182, 365])
+    result_narrative = get_graph_input_per_time(json_object_narrative, GRAPH_TIME_DELTAS)
 
-    result_overview = get_graph_input_per_time(json_object_overview, [7, 31, 182, 365])
+    result_overview = get_graph_input_per_time(json_object_overview, GRAPH_TIME_DELTAS)
     return result_narrative, result_overview
 
 
@@ -152,7 +158,206 @@ def get_drug_suggestions():
     return suggestions
 
 
+class LogStatistics:
+    """
+    Incrementally aggregates the narrative query, drug overview and drug suggestion logs.
+    The byte offset of every log file is remembered, so an update only parses the lines that have been appended
+    since the last update. Parsed lines are condensed into counters per day from which all statistics are derived.
+    """
+
+    def __init__(self, state_file=statistics_state_file, log_sources=None):
+        """
+        :param state_file: file in which offsets and counters are kept between runs
+        :param log_sources: dict mapping a log name to its directory and the counted parameter
+        """
+        self.state_file = state_file
+        if log_sources:
+            self.log_sources = log_sources
+        else:
+            self.log_sources = {"narrative": (narrative_path, "query string"),
+                                "overview": (overview_path, "drug"),
+                                "suggestion": (suggestion_path, "drug")}
+        self.file2offset = {}
+        self.file2header = {}
+        # log name -> day (iso format) -> {"total": number of entries, "values": {parameter value: count}}
+        self.day_counters = {name: {} for name in self.log_sources}
+
+    def reset(self):
+        self.file2offset = {}
+        self.file2header = {}
+        self.day_counters = {name: {} for name in self.log_sources}
+
+    def load(self):
+        if not os.path.isfile(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'rt') as f:
+                state = json.load(f)
+            self.file2offset = state["file2offset"]
+            self.file2header = state["file2header"]
+            self.day_counters = {name: state["day_counters"].get(name, {}) for name in self.log_sources}
+        except (IOError, ValueError, KeyError):
+            logging.warning(f'Could not load log statistics from {self.state_file} - rebuilding them')
+            self.reset()
+
+    def save(self):
+        state = dict(file2offset=self.file2offset, file2header=self.file2header, day_counters=self.day_counters)
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'wt') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def update(self) -> int:
+        """
+        Parses all log lines that have been appended since the last update
+        :return: the number of new log entries
+        """
+        if self._log_files_changed():
+            logging.info('Log files have been truncated or removed - rebuilding log statistics')
+            self.reset()
+
+        new_entries = 0
+        for name, (path, parameter) in self.log_sources.items():
+            if not os.path.isdir(path):
+                continue
+            for filename in sorted(os.listdir(path)):
+                new_entries += self._read_new_lines(name, os.path.join(path, filename), parameter)
+        return new_entries
+
+    def _log_files_changed(self) -> bool:
+        for file, offset in self.file2offset.items():
+            if not os.path.isfile(file) or os.path.getsize(file) < offset:
+                return True
+        return False
+
+    def _read_new_lines(self, name, file, parameter) -> int:
+        offset = self.file2offset.get(file, 0)
+        if os.path.getsize(file) == offset:
+            return 0
+
+        with open(file, 'rb') as f:
+            # entries are appended under an exclusive lock, so lines are never read partially
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                f.seek(offset)
+                data = f.read()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.file2offset[file] = offset + len(data)
+
+        if offset == 0:
+            header, _, data = data.partition(b'\n')
+            self.file2header[file] = header.decode().rstrip().split('\t')
+        header_list = self.file2header[file]
+
+        new_entries = 0
+        day2counter = self.day_counters[name]
+        for line in data.decode(errors='replace').split('\n'):
+            if not line.strip():
+                continue
+            try:
+                structure = parse_log_line(header_list, line)
+            except (KeyError, ValueError):
+                continue
+
+            day = structure["date_object"].isoformat()
+            if day not in day2counter:
+                day2counter[day] = {"total": 0, "values": {}}
+            day_counter = day2counter[day]
+            day_counter["total"] += 1
+            if parameter in structure:
+                value = structure[parameter]
+                day_counter["values"][value] = day_counter["values"].get(value, 0) + 1
+            new_entries += 1
+        return new_entries
+
+    def get_most_searched_parameter_per_time(self, name, top_k, today):
+        period2counter = {period: defaultdict(int) for period in ["t", "tw", "tm", "ty", "a"]}
+        for day, day_counter in self.day_counters[name].items():
+            date_object = date.fromisoformat(day)
+            periods = ["a"]
+            if date_object.year == today.year:
+                periods.append("ty")
+                if date_object.month == today.month:
+                    periods.append("tm")
+                # Returns the calendar week
+                if date_object.isocalendar()[1] == today.isocalendar()[1]:
+                    periods.append("tw")
+                if date_object == today:
+                    periods.append("t")
+            for value, count in day_counter["values"].items():
+                for period in periods:
+                    period2counter[period][value] += count
+
+        return {period: dict(heapq.nsmallest(top_k, counter.items(), key=lambda x: (-x[1], x[0])))
+                for period, counter in period2counter.items()}
+
+    def get_amount_of_occurrences(self, name, today):
+        counter = {"t": 0, "tw": 0, "tm": 0, "lm": 0, "ty": 0, "ly": 0}
+        for day, day_counter in self.day_counters[name].items():
+            date_object = date.fromisoformat(day)
+            total = day_counter["total"]
+            if date_object.year == today.year - 1:
+                counter["ly"] += total
+            elif date_object.year == today.year:
+                counter["ty"] += total
+                if date_object.month == today.month - 1:
+                    counter["lm"] += total
+                elif date_object.month == today.month:
+                    counter["tm"] += total
+                # Calendar week can range over a month
+                if date_object.isocalendar()[1] == today.isocalendar()[1]:
+                    counter["tw"] += total
+                    if date_object == today:
+                        counter["t"] += total
+        return counter
+
+    def get_graph_input_per_time(self, name, today, time_deltas=None):
+        if not time_deltas:
+            time_deltas = GRAPH_TIME_DELTAS
+        count_per_day_and_time = {time_delta: defaultdict(int) for time_delta in time_deltas}
+        for day, day_counter in self.day_counters[name].items():
+            days_ago = (today - date.fromisoformat(day)).days
+            for time_delta in time_deltas:
+                if 0 <= days_ago <= time_delta:
+                    count_per_day_and_time[time_delta][days_ago] += day_counter["total"]
+        return count_per_day_and_time
+
+    def get_drug_suggestions(self):
+        suggestions = defaultdict(int)
+        for day_counter in self.day_counters["suggestion"].values():
+            for drug, count in day_counter["values"].items():
+                suggestions[drug] += count
+        # sort by number of suggestions and, if it is not possible, by name
+        return sorted(suggestions.items(), key=lambda x: (-x[1], x[0]))
+
+    def create_dictionary(self, top_k=100, today=None):
+        if not today:
+            today = get_date_of_today()
+        result = dict()
+        for name in ["narrative", "overview"]:
+            result[name] = dict(topQueries=self.get_most_searched_parameter_per_time(name, top_k, today),
+                                amountQueries=self.get_amount_of_occurrences(name, today),
+                                graphInput=self.get_graph_input_per_time(name, today))
+        result['overview']['suggestions'] = self.get_drug_suggestions()
+        result['today'] = today
+        return result
+
+
 def create_dictionary_of_logs():
+    """
+    Updates the persisted log statistics with all new log entries and computes the statistics dictionary
+    """
+    statistics = LogStatistics()
+    statistics.load()
+    new_entries = statistics.update()
+    logging.info(f'{new_entries} new log entries aggregated')
+    statistics.save()
+    return statistics.create_dictionary()
+
+
+def create_dictionary_of_logs_from_scratch():
     narrative_json = get_json_of_log(narrative_path)
     overview_json = get_json_of_log(overview_path)
     result = dict()
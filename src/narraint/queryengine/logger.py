@@ -1,5 +1,9 @@
+import atexit
+import fcntl
 import logging
 import os
+import queue
+import threading
 import time
 from datetime import datetime
 
@@ -7,9 +11,142 @@ from narraint.config import LOG_DIR
 from narraint.queryengine.query import GraphQuery
 
 
+class LogEntryWriter:
+    """
+    Writes log entries asynchronously so that requests do not wait for the file system.
+    Entries are put into a bounded queue and a background thread appends them in batches per file.
+    A batch is written if FLUSH_AFTER_ENTRIES entries are buffered or the oldest buffered entry is older than
+    FLUSH_INTERVAL seconds. If the queue is full, entries are dropped instead of blocking the request.
+    Several processes (gunicorn workers) may append to the same file, so files are locked while writing.
+    """
+    MAX_QUEUED_ENTRIES = 10000
+    FLUSH_AFTER_ENTRIES = 100
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, max_queued_entries=MAX_QUEUED_ENTRIES, flush_after_entries=FLUSH_AFTER_ENTRIES,
+                 flush_interval=FLUSH_INTERVAL):
+        self.max_queued_entries = max_queued_entries
+        self.flush_after_entries = flush_after_entries
+        self.flush_interval = flush_interval
+        self.dropped_entries = 0
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__queue = None
+
+    def _ensure_started(self):
+        # Threads do not survive a fork (gunicorn --preload), so each process starts its own writer thread
+        if self.__pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return
+            self.__queue = queue.Queue(maxsize=self.max_queued_entries)
+            thread = threading.Thread(target=self._run, args=(self.__queue,), name="LogEntryWriter", daemon=True)
+            thread.start()
+            self.__pid = os.getpid()
+            atexit.register(self.flush)
+
+    def submit(self, log_entry: str, log_file_name: str, log_header: str) -> bool:
+        """
+        Enqueues a log entry
+        @param log_entry: the formatted entry (including the leading line break and time tag)
+        @param log_file_name: file in which the entry is logged
+        @param log_header: header that is written if the file is new
+        @return: True if the entry was enqueued, False if it was dropped
+        """
+        self._ensure_started()
+        try:
+            self.__queue.put_nowait((log_file_name, log_header, log_entry))
+            return True
+        except queue.Full:
+            self.dropped_entries += 1
+            if self.dropped_entries % 1000 == 1:
+                logging.warning(f'Log queue is full - {self.dropped_entries} log entries have been dropped')
+            return False
+
+    def flush(self, timeout=5.0) -> bool:
+        """
+        Blocks until all entries that have been submitted before are written
+        @param timeout: maximum seconds to wait
+        @return: True if all entries are written
+        """
+        if self.__pid != os.getpid():
+            return True
+        flushed = threading.Event()
+        try:
+            self.__queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return False
+        return flushed.wait(timeout)
+
+    def _run(self, entry_queue: queue.Queue):
+        file2entries = {}
+        buffered_entries = 0
+        first_buffered_at = None
+        while True:
+            if first_buffered_at is None:
+                timeout = None
+            else:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - first_buffered_at))
+            try:
+                item = entry_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            flush_event = None
+            if isinstance(item, threading.Event):
+                flush_event = item
+            elif item is not None:
+                log_file_name, log_header, log_entry = item
+                if log_file_name not in file2entries:
+                    file2entries[log_file_name] = (log_header, [])
+                file2entries[log_file_name][1].append(log_entry)
+                buffered_entries += 1
+                if first_buffered_at is None:
+                    first_buffered_at = time.monotonic()
+
+            if buffered_entries > 0 and (flush_event or buffered_entries >= self.flush_after_entries
+                                         or time.monotonic() - first_buffered_at >= self.flush_interval):
+                for log_file_name, (log_header, entries) in file2entries.items():
+                    append_entries(log_file_name, log_header, entries)
+                file2entries.clear()
+                buffered_entries = 0
+                first_buffered_at = None
+
+            if flush_event:
+                flush_event.set()
+
+
+def append_entries(log_file_name: str, log_header: str, entries: [str]):
+    """
+    Appends entries to a log file and writes the header first if the file is new or empty
+    @param log_file_name: file in which the entries are logged
+    @param log_header: header which specifies the entry columns
+    @param entries: formatted log entries
+    """
+    try:
+        with open(log_file_name, 'a') as f:
+            # several processes may append to the same file
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    logging.debug(f'creating new log file: {log_file_name}')
+                    f.write(log_header)
+                f.write(''.join(entries))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except IOError:
+        logging.debug(f'Could not write {len(entries)} entries into: {log_file_name}')
+
+
+LOG_ENTRY_WRITER = LogEntryWriter()
+
+
 def write_entry(log_entry: str, log_file_name: str, log_header: str, log_type: str = ""):
     """
-    Open or create log file (log_file_name) and append log entry. A time tag
+    Enqueue a log entry (log_file_name) that is appended asynchronously. A time tag
     is added to the beginning of the entry beforehand.
     @param log_entry: action to be logged
     @param log_file_name: file in which the action is logged
@@ -18,20 +155,8 @@ def write_entry(log_entry: str, log_file_name: str, log_header: str, log_type: s
     """
     timestr = time.strftime("%Y.%m.%d-%H:%M:%S")
     log_entry = f"\n{timestr}\t{log_entry}"
-
-    try:
-        if not os.path.isfile(log_file_name):
-            logging.debug(f'creating new {log_type} log file: {log_file_name}')
-            with open(log_file_name, 'w') as f:
-                f.write(log_header)
-                f.write(log_entry)
-
-        else:
-            logging.debug(f'appending to {log_type} log file: {log_file_name}')
-            with open(log_file_name, 'a') as f:
-                f.write(log_entry)
-    except IOError:
-        logging.debug(f'Could not write entry into: {log_file_name}')
+    logging.debug(f'appending to {log_type} log file: {log_file_name}')
+    LOG_ENTRY_WRITER.submit(log_entry, log_file_name, log_header)
 
 
 class QueryLogger:
@@ -57,6 +182,7 @@ class QueryLogger:
         self.log_dir_drug_ov_chembl_ph = os.path.join(log_dir, 'drug_ov_chembl_phase')
         self.log_dir_entity_ov_search = os.path.join(log_dir, 'entity_ov_search')
         self.log_dir_entity_ov_subst_href = os.path.join(log_dir, 'entity_ov_substance_href')
+        self.log_dir_traces = os.path.join(log_dir, 'traces')
 
         if not os.path.isdir(log_dir):
             raise Exception(f'no provenance log dir available {log_dir}')
@@ -90,6 +216,8 @@ class QueryLogger:
             os.mkdir(self.log_dir_entity_ov_search)
         if not os.path.isdir(self.log_dir_entity_ov_subst_href):
             os.mkdir(self.log_dir_entity_ov_subst_href)
+        if not os.path.isdir(self.log_dir_traces):
+            os.mkdir(self.log_dir_traces)
 
         self.query_header = 'timestamp\ttime needed\tcollection\tcache hit\thits\tquery string\tgraph query'
         self.provenance_header = 'timestamp\ttime needed\tdocument collection\tdocument id\tprovenance ids'
@@ -106,6 +234,16 @@ class QueryLogger:
         self.drug_ov_chembl_phase_header = 'timestamp\tquery\tdrug\tdisease_name\tdisease_id\tphase'
         self.entity_ov_search_header = 'timestamp\tentity'
         self.entity_ov_subst_href_header = 'timestamp\tquery\tentity_from\tentity_to'
+        self.trace_header = 'timestamp\troute\ttime needed ms\ttrace'
+
+    @staticmethod
+    def flush(timeout=5.0) -> bool:
+        """
+        Blocks until all log entries of this process are written (entries are written asynchronously)
+        @param timeout: maximum seconds to wait
+        @return: True if all entries are written
+        """
+        return LOG_ENTRY_WRITER.flush(timeout=timeout)
 
     def write_query_log(self, time_needed, collection, cache_hit: bool, hits_count: int, query_string: str,
                         graph_query: GraphQuery):
@@ -219,4 +357,13 @@ class QueryLogger:
                                      f'{time.strftime("%Y-%m-%d")}-entity_ov_subst_href.log')
         log_entry = f'{query}\t{entity_from}\t{entity_to}'
         write_entry(log_entry, log_file_name, self.entity_ov_subst_href_header,
-                    "entity ov substance href")
\ No newline at end of file
+                    "entity ov substance href")
+
+    def write_trace_log(self, trace):
+        """
+        Logs the stage durations and counters of a traced request
+        @param trace: a QueryTrace
+        """
+        log_file_name = os.path.join(self.log_dir_traces, f'{time.strftime("%Y-%m-%d")}-traces.log')
+        log_entry = f'{trace.name}\t{trace.get_total_seconds() * 1000:.1f}\t{trace.to_log_entry()}'
+        write_entry(log_entry, log_file_name, self.trace_header, "trace")
@@ -1,19 +1,74 @@
 import argparse
+import itertools
 import logging
 
-from sqlalchemy import delete
+from sqlalchemy import delete, and_
 
 from narraint.backend.database import SessionExtended
 from narraint.backend.models import DocumentMetadata, DocumentMetadataService, Document, DocumentClassification
 
-BULK_QUERY_CURSOR_COUNT = 500000
+METADATA_BATCH_SIZE = 50000
+MAX_AUTHORS = 5
 
 
-def compute_document_metadata_service_table(rebuild=False):
+def truncate_authors(authors: str) -> str:
+    # test how many authors are there
+    authors_comps = authors.split(' | ')
+    if len(authors_comps) > MAX_AUTHORS:
+        authors = ' | '.join(authors_comps[:MAX_AUTHORS]) + f' | {len(authors_comps) - MAX_AUTHORS}+'
+    return authors
+
+
+def query_missing_metadata(session, document_collection: str, after_document_id: int, batch_size: int):
+    """
+    Queries the next documents (ordered by id) that have metadata but are not in the DocumentMetadataService table
+    :param session: the database session
+    :param document_collection: the document collection
+    :param after_document_id: only documents with a larger id are queried
+    :param batch_size: the maximum number of documents
+    :return: a list of rows
+    """
+    dms = DocumentMetadataService
+    q = session.query(Document.id, Document.title, DocumentMetadata.authors, DocumentMetadata.journals,
+                      DocumentMetadata.publication_year, DocumentMetadata.publication_month,
+                      DocumentMetadata.document_id_original, DocumentMetadata.publication_doi)
+    q = q.join(DocumentMetadata, and_(DocumentMetadata.document_id == Document.id,
+                                      DocumentMetadata.document_collection == Document.collection))
+    # anti-join: skip documents that have already metadata in the DocumentMetadataService table
+    q = q.outerjoin(dms, and_(dms.document_id == Document.id, dms.document_collection == Document.collection))
+    q = q.filter(Document.collection == document_collection)
+    q = q.filter(Document.id > after_document_id)
+    q = q.filter(dms.document_id.is_(None))
+    q = q.order_by(Document.id).limit(batch_size)
+    return q.all()
+
+
+def query_missing_classifications(session, document_collection: str, first_document_id: int,
+                                  last_document_id: int) -> dict:
+    """
+    Queries the classifications of all documents in an id range that are not in the DocumentMetadataService table
+    :return: a dict mapping document ids to their list of classifications
+    """
+    dms = DocumentMetadataService
+    q = session.query(DocumentClassification.document_id, DocumentClassification.classification)
+    q = q.outerjoin(dms, and_(dms.document_id == DocumentClassification.document_id,
+                              dms.document_collection == DocumentClassification.document_collection))
+    q = q.filter(DocumentClassification.document_collection == document_collection)
+    q = q.filter(DocumentClassification.document_id >= first_document_id)
+    q = q.filter(DocumentClassification.document_id <= last_document_id)
+    q = q.filter(dms.document_id.is_(None))
+    q = q.order_by(DocumentClassification.document_id, DocumentClassification.classification)
+    return {document_id: [r[1] for r in rows] for document_id, rows in itertools.groupby(q, key=lambda r: r[0])}
+
+
+def compute_document_metadata_service_table(rebuild=False, batch_size=METADATA_BATCH_SIZE):
     """
     Computes the DocumentMetadataService table
     Titles and Metadata will be queried from Document and DocumentMetadata
-    And only document ids that have at least a single extraction (Predication) will be considered
+    Documents are processed in batches ordered by their id, so the memory is bounded by the batch size.
+    Documents that already have service metadata are skipped by the database (anti-join).
+    :param rebuild: delete all service metadata first
+    :param batch_size: number of documents per batch
     :return: None
     """
     session = SessionExtended.get()
@@ -31,87 +86,41 @@ def compute_document_metadata_service_table(rebuild=False):
         document_collections.add(r[0])
 
     logging.info(f'Found {len(document_collections)} document collections...')
-    for d_col in document_collections:
-        logging.info(f'Querying relevant document ids from document table for collection: {d_col}')
-        pred_query = session.query(Document.id).filter(Document.collection == d_col).distinct()
-        relevant_doc_ids = set()
-        for row in pred_query:
-            relevant_doc_ids.add(row[0])
-        logging.info(f'Found {len(relevant_doc_ids)} relevant document ids in document table...')
-
-        logging.info('Querying document ids that have metadata in DocumentMetadataService table...')
-        aq = session.query(DocumentMetadataService.document_id)
-        aq = aq.filter(DocumentMetadataService.document_collection == d_col)
-        document_ids_with_metadata = set()
-        for row in aq:
-            document_ids_with_metadata.add(int(row[0]))
-        logging.info(f'{len(document_ids_with_metadata)} have already metadata in DocumentMetadataService table')
-        relevant_doc_ids = relevant_doc_ids - document_ids_with_metadata
-        logging.info(f'{len(relevant_doc_ids)} relevant document ids remaining to insert...')
-
-        logging.info(f'Querying titles for collection: {d_col}')
-        title_query = session.query(Document.id, Document.title).filter(Document.collection == d_col).yield_per(
-            BULK_QUERY_CURSOR_COUNT)
-        doc2titles = {}
-        for r in title_query:
-            doc_id = int(r[0])
-            if doc_id in relevant_doc_ids:
-                doc2titles[doc_id] = r[1]
-        logging.info(f'{len(doc2titles)} document titles were found')
-
-        logging.info(f'Querying metadata for collection: {d_col}')
-        meta_query = session.query(DocumentMetadata).filter(DocumentMetadata.document_collection == d_col).yield_per(
-            BULK_QUERY_CURSOR_COUNT)
-
-        doc2metadata = {}
-        for r in meta_query:
-            if r.document_id in relevant_doc_ids:
-                doc2metadata[r.document_id] = (r.authors, r.journals, r.publication_year, r.publication_month,
-                                               r.document_id_original, r.publication_doi)
-        logging.info(f'{len(doc2metadata)} document metadata were found')
-
-        logging.info(f'Querying classifications for collection: {d_col}')
-        class_query = session.query(DocumentClassification).filter(
-            DocumentClassification.document_collection == d_col).yield_per(
-            BULK_QUERY_CURSOR_COUNT)
-        doc2classes = {}
-        for r in class_query:
-            if r.document_id in relevant_doc_ids:
-                if r.document_id not in doc2classes:
-                    doc2classes[r.document_id] = []
-                doc2classes[r.document_id].append(r.classification)
-        logging.info(f'{len(doc2classes)} document classes were found')
-
-        logging.info('Preparing insert....')
-        # prepare insert
-        insert_values = []
-        for d_id in relevant_doc_ids:
-            title = doc2titles[d_id]
-            if d_id in doc2metadata:
-                authors, journals, publication_year, publication_month, document_id_original, doi = doc2metadata[d_id]
-                # test how many authors are there
-                authors_comps = authors.split(' | ')
-                if len(authors_comps) > 5:
-                    authors = ' | '.join(authors_comps[:5]) + f' | {len(authors_comps) - 5}+'
-
-                if publication_year == 0 or not publication_year:
-                    continue
-
-            else:
+    for d_col in sorted(document_collections):
+        logging.info(f'Inserting missing service metadata for collection: {d_col}')
+        last_document_id = -1
+        inserted, skipped = 0, 0
+        while True:
+            rows = query_missing_metadata(session, d_col, last_document_id, batch_size)
+            if not rows:
+                break
+            first_document_id, last_document_id = rows[0].id, rows[-1].id
+            doc2classes = query_missing_classifications(session, d_col, first_document_id, last_document_id)
+
+            insert_values = []
+            for r in rows:
                 # skip documents that does not have this information available
-                continue
-
-            document_classes = None
-            if d_id in doc2classes:
-                document_classes = str(doc2classes[d_id])
-            insert_values.append(dict(document_id=d_id, document_collection=d_col, title=title,
-                                      authors=authors, journals=journals, publication_year=publication_year,
-                                      publication_month=publication_month, document_id_original=document_id_original,
-                                      publication_doi=doi, document_classifications=document_classes))
-
-        logging.info(f'Inserting {len(insert_values)} into database table DocumentMetadataService...')
-        DocumentMetadataService.bulk_insert_values_into_table(session, insert_values, check_constraints=True)
-        logging.info('Finished')
+                if r.publication_year == 0 or not r.publication_year:
+                    skipped += 1
+                    continue
+                document_classes = None
+                if r.id in doc2classes:
+                    document_classes = str(doc2classes[r.id])
+                authors = truncate_authors(r.authors) if r.authors else r.authors
+                insert_values.append(dict(document_id=r.id, document_collection=d_col, title=r.title,
+                                          authors=authors, journals=r.journals, publication_year=r.publication_year,
+                                          publication_month=r.publication_month,
+                                          document_id_original=r.document_id_original,
+                                          publication_doi=r.publication_doi,
+                                          document_classifications=document_classes))
+
+            if insert_values:
+                DocumentMetadataService.bulk_insert_values_into_table(session, insert_values, check_constraints=True)
+            inserted += len(insert_values)
+            logging.info(f'{inserted} documents inserted into DocumentMetadataService (up to id {last_document_id})')
+
+        logging.info(f'Finished {d_col}: {inserted} documents inserted, {skipped} skipped (no publication year)')
+    logging.info('Finished')
 
 
 def main():
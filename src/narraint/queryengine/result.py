@@ -1,23 +1,49 @@
+import json
 from typing import Dict, Set
 
 from narrant.entity.entityresolver import EntityResolver
 
+# same settings as the encoder of Django's JsonResponse (ensure_ascii and default separators)
+_encode_json = json.JSONEncoder().encode
+# document results are encoded in batches (one call of the C encoder per batch)
+JSON_DOCUMENT_BATCH_SIZE = 1000
+
 
 class QueryEntitySubstitution:
     """
     Represents an entity substitution for a variable
     consists of: a string (inside the sentence), an entity id, an entity type and a name stemming from a vocabulary
     such as MeSH, NCBI Gene Vocabulary and Species Taxonomy
+    The name is resolved lazily when it is accessed for the first time.
     """
+    __slots__ = ("entity_str", "entity_id", "entity_type", "_entity_name")
 
     def __init__(self, entity_str, entity_id, entity_type, entity_name=None):
         self.entity_str = entity_str
         self.entity_id = entity_id
         self.entity_type = entity_type
-        if not entity_name:
-            self.entity_name = self._compute_entity_vocabulary_name()
-        else:
-            self.entity_name = entity_name
+        self._entity_name = entity_name if entity_name else None
+
+    @property
+    def entity_name(self):
+        if self._entity_name is None:
+            self._entity_name = self._compute_entity_vocabulary_name()
+        return self._entity_name
+
+    @entity_name.setter
+    def entity_name(self, entity_name):
+        self._entity_name = entity_name
+
+    def __getstate__(self):
+        return dict(entity_str=self.entity_str, entity_id=self.entity_id, entity_type=self.entity_type,
+                    entity_name=self._entity_name)
+
+    def __setstate__(self, state):
+        # also restores objects that have been pickled before slots were used
+        self.entity_str = state["entity_str"]
+        self.entity_id = state["entity_id"]
+        self.entity_type = state["entity_type"]
+        self._entity_name = state.get("entity_name")
 
     def _compute_entity_vocabulary_name(self):
         """
@@ -126,6 +152,9 @@ class QueryResultBase:
     """
     Abstract class forming the foundation for the resulting structure
     """
+    __slots__ = ()
+    # size of a frozen node (see freeze)
+    _result_size = None
 
     def to_dict(self):
         """
@@ -141,11 +170,50 @@ class QueryResultBase:
         """
         raise NotImplementedError
 
+    def freeze(self):
+        """
+        Computes the result sizes of this node and all of its children in a single bottom-up pass and caches them,
+        so that sorting and serialization look up sizes in constant time
+        Must be called after the tree has been built - adding results afterwards only drops the size of the modified
+        node but not the sizes of its ancestors
+        :return: the result size of this node
+        """
+        self._result_size = sum([r.freeze() for r in self.results])
+        return self._result_size
+
+    def iter_json(self):
+        """
+        Yields the JSON encoding of to_dict() in pieces without building the whole dictionary tree
+        :return: a generator of strings
+        """
+        raise NotImplementedError
+
+    def _iter_json_results(self):
+        first = True
+        for idx in range(0, len(self.results), JSON_DOCUMENT_BATCH_SIZE):
+            batch = self.results[idx:idx + JSON_DOCUMENT_BATCH_SIZE]
+            if all(isinstance(r, QueryDocumentResult) for r in batch):
+                if not first:
+                    yield ', '
+                # only the dictionaries of a single batch exist at the same time
+                yield _encode_json([r.to_dict() for r in batch])[1:-1]
+                first = False
+                continue
+            for r in batch:
+                if not first:
+                    yield ', '
+                yield from r.iter_json()
+                first = False
+
 
 class QueryDocumentResult(QueryResultBase):
     """
     Represents document result
+    The engine creates up to millions of these objects per query, so they do not have an instance dictionary.
     """
+    __slots__ = ("document_id", "title", "journals", "authors", "publication_year", "publication_month",
+                 "var2substitution", "confidence", "position2provenance_ids", "org_document_id", "doi",
+                 "document_collection", "document_classes")
 
     def __init__(self, document_id: int, title: str, authors: str, journals: str, publication_year: int,
                  publication_month: int, var2substitution, confidence, position2provenance_ids: Dict[int, Set[int]],
@@ -165,15 +233,29 @@ class QueryDocumentResult(QueryResultBase):
         self.document_collection = document_collection
         self.document_classes = document_classes
 
+    def __getstate__(self):
+        return {attribute: getattr(self, attribute) for attribute in QueryDocumentResult.__slots__}
+
+    def __setstate__(self, state):
+        # also restores objects that have been pickled before slots were used
+        for attribute in QueryDocumentResult.__slots__:
+            setattr(self, attribute, state.get(attribute))
+
     def to_dict(self):
         return dict(t="doc", docid=self.document_id, title=self.title, authors=self.authors,
                     journals=self.journals, year=self.publication_year, prov=self.position2provenance_ids,
                     month=self.publication_month, org_document_id=self.org_document_id, doi=self.doi,
                     collection=self.document_collection)
 
+    def iter_json(self):
+        yield _encode_json(self.to_dict())
+
     def get_result_size(self):
         return 1
 
+    def freeze(self):
+        return 1
+
     def __eq__(self, other):
         if not isinstance(other, QueryDocumentResult):
             return False
@@ -198,16 +280,25 @@ class QueryDocumentResultList(QueryResultBase):
 
     def add_query_result(self, result: QueryResultBase):
         self.results.append(result)
+        self._result_size = None
 
     def to_dict(self):
         result_dict = [r.to_dict() for r in self.results]
         return dict(t="doc_l", r=result_dict, s=self.get_result_size())
 
+    def iter_json(self):
+        yield '{"t": "doc_l", "r": ['
+        yield from self._iter_json_results()
+        yield f'], "s": {self.get_result_size()}}}'
+
     def get_result_size(self):
+        if self._result_size is not None:
+            return self._result_size
         return sum([r.get_result_size() for r in self.results])
 
     def set_slice(self, end_pos):
         self.results = self.results[:end_pos]
+        self._result_size = None
 
 
 class QueryResultAggregate(QueryResultBase):
@@ -223,6 +314,7 @@ class QueryResultAggregate(QueryResultBase):
 
     def add_query_result(self, result: QueryResultBase):
         self.results.append(result)
+        self._result_size = None
 
     def _serialize_var_substitution(self):
         return {k: v.to_dict() for k, v in self.var2substitution.items()}
@@ -232,7 +324,15 @@ class QueryResultAggregate(QueryResultBase):
         return dict(t="agg", s=self.get_result_size(), v_n=self.variable_names,
                     sub=self._serialize_var_substitution(), r=result_dict)
 
+    def iter_json(self):
+        yield f'{{"t": "agg", "s": {self.get_result_size()}, "v_n": {_encode_json(self.variable_names)}, ' \
+              f'"sub": {_encode_json(self._serialize_var_substitution())}, "r": ['
+        yield from self._iter_json_results()
+        yield ']}'
+
     def get_result_size(self):
+        if self._result_size is not None:
+            return self._result_size
         return sum([r.get_result_size() for r in self.results])
 
     def _sort_results_by_year(self, year_sort_desc):
@@ -251,12 +351,20 @@ class QueryResultAggregateList(QueryResultBase):
     def add_query_result(self, result: QueryResultAggregate):
         self.results.append(result)
         self.count_substitutions += 1
+        self._result_size = None
 
     def to_dict(self):
         result_dict = [r.to_dict() for r in self.results]
         return dict(t="agg_l", r=result_dict, s=self.get_result_size(), no_subs=self.count_substitutions)
 
+    def iter_json(self):
+        yield '{"t": "agg_l", "r": ['
+        yield from self._iter_json_results()
+        yield f'], "s": {self.get_result_size()}, "no_subs": {self.count_substitutions}}}'
+
     def get_result_size(self):
+        if self._result_size is not None:
+            return self._result_size
         return sum([r.get_result_size() for r in self.results])
 
     def set_slice(self, start_pos, end_pos):
@@ -265,3 +373,36 @@ class QueryResultAggregateList(QueryResultBase):
                 self.results = self.results[start_pos:end_pos]
             else:
                 self.results = self.results[start_pos:end_pos]
+            self._result_size = None
+
+
+def iter_json_response(data: dict, chunk_size=65536):
+    """
+    Encodes a response dictionary in which some values may be query results to JSON bytes. The output equals the
+    encoding of the same dictionary with converted results (to_dict()), but the result tree is never converted
+    as a whole.
+    :param data: the response dictionary
+    :param chunk_size: minimum number of characters per yielded chunk
+    :return: a generator of byte chunks
+    """
+    def iter_pieces():
+        yield '{'
+        for idx, (key, value) in enumerate(data.items()):
+            if idx > 0:
+                yield ', '
+            yield f'{_encode_json(key)}: '
+            if isinstance(value, QueryResultBase):
+                yield from value.iter_json()
+            else:
+                yield _encode_json(value)
+        yield '}'
+
+    buffer, buffer_size = [], 0
+    for piece in iter_pieces():
+        buffer.append(piece)
+        buffer_size += len(piece)
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer).encode()
+            buffer, buffer_size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
@@ -0,0 +1,132 @@
+import contextvars
+import json
+import time
+
+_CURRENT_TRACE = contextvars.ContextVar("query_trace", default=None)
+
+
+class QueryTrace:
+    """
+    Collects the time spent in named stages and some counters (e.g. rows fetched) of a single request
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stage2duration = {}
+        self.counters = {}
+
+    def add_duration(self, stage: str, seconds: float):
+        # a stage may be entered several times (e.g. once per fact pattern)
+        self.stage2duration[stage] = self.stage2duration.get(stage, 0.0) + seconds
+
+    def count(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def get_total_seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_dict(self):
+        return dict(name=self.name,
+                    total_ms=round(self.get_total_seconds() * 1000, 1),
+                    stages={s: round(d * 1000, 1) for s, d in self.stage2duration.items()},
+                    counters=self.counters)
+
+    def to_log_entry(self) -> str:
+        """
+        Exports the trace as a single line
+        :return: a json string
+        """
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def to_server_timing(self) -> str:
+        """
+        Exports the stage durations as a value for the Server-Timing http header
+        :return: a header value like "translation;dur=1.2, engine;dur=20.1, total;dur=25.0"
+        """
+        metrics = [f'{s};dur={d * 1000:.1f}' for s, d in self.stage2duration.items()]
+        metrics.append(f'total;dur={self.get_total_seconds() * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+class _TraceSpan:
+    __slots__ = ("trace", "stage", "start")
+
+    def __init__(self, trace: QueryTrace, stage: str):
+        self.trace = trace
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.trace.add_duration(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoTraceSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NO_TRACE_SPAN = _NoTraceSpan()
+
+
+def start_trace(name: str) -> QueryTrace:
+    """
+    Starts a new trace for the current request (thread / context)
+    :param name: name of the traced request (e.g. the route)
+    :return: the trace
+    """
+    trace = QueryTrace(name)
+    _CURRENT_TRACE.set(trace)
+    return trace
+
+
+def stop_trace():
+    _CURRENT_TRACE.set(None)
+
+
+def get_current_trace() -> QueryTrace:
+    return _CURRENT_TRACE.get()
+
+
+def trace_span(stage: str):
+    """
+    Context manager that adds the time spent in the block to the stage of the current trace.
+    If no trace was started, a shared no-op context manager is returned.
+    :param stage: name of the stage
+    """
+    trace = _CURRENT_TRACE.get()
+    if trace is None:
+        return _NO_TRACE_SPAN
+    return _TraceSpan(trace, stage)
+
+
+def trace_duration(stage: str, seconds: float):
+    """
+    Adds a measured duration to a stage of the current trace (does nothing if no trace was started)
+    :param stage: name of the stage
+    :param seconds: the measured duration
+    """
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        trace.add_duration(stage, seconds)
+
+
+def trace_count(counter: str, value: int = 1):
+    """
+    Increases a counter of the current trace (does nothing if no trace was started)
+    :param counter: name of the counter
+    :param value: the increment
+    """
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        trace.count(counter, value)
@@ -28,6 +28,7 @@ class DocumentCorpus:
     Singleton class that can compute tf-idf scores for statements and entities
     """
     __instance = None
+    __initialized = False
 
     def __new__(cls):
         if cls.__instance is None:
@@ -35,6 +36,9 @@ class DocumentCorpus:
         return cls.__instance
 
     def __init__(self):
+        # the corpus is shared (e.g. by the views, the recommender and the keyword translation)
+        if self.__initialized:
+            return
         logging.info('Querying available document collections...')
         session = SessionExtended.get()
         self.collections = set()
@@ -53,6 +57,7 @@ class DocumentCorpus:
         logging.info(f'{self.document_count} documents in corpus')
         self.cache_concept2support = dict()
         self.__load_all_support_into_memory()
+        self.__initialized = True
 
     def __load_all_support_into_memory(self):
         """
@@ -108,6 +113,14 @@ class DocumentCorpus:
         else:
             return 1
 
+    def get_entity_supports(self, entity_keys) -> dict:
+        """
+        Gets the number of documents for several entities at once (no database queries are required)
+        :param entity_keys: an iterable of (entity_type, entity_id) tuples
+        :return: a dict mapping (entity_type, entity_id) tuples to their support (unknown entities are skipped)
+        """
+        return {key: self.cache_concept2support[key] for key in entity_keys if key in self.cache_concept2support}
+
     def score_edge_by_tf_and_concept_idf(self, statement: StatementExtraction, document: IndexedDocument) -> float:
         """
         Computes a statement's score defined as follows:
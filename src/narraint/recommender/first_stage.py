@@ -1,8 +1,12 @@
+import random
+
 from narraint.backend.database import SessionExtended
 from narraint.backend.models import TagInvertedIndex
+from narraint.backend.posting_list import sample_document_ids
 from narraint.recommender.core import NarrativeCoreExtractor, NarrativeConceptCore
 from narraint.recommender.document import RecommenderDocument
-from narraint.recommender.recommender_config import FS_DOCUMENT_CUTOFF, FS_DOCUMENT_CUTOFF_HARD
+from narraint.recommender.recommender_config import FS_DOCUMENT_CUTOFF, FS_DOCUMENT_CUTOFF_HARD, \
+    FS_CONCEPT_DOCUMENT_SAMPLE_SIZE
 
 
 class FirstStage:
@@ -45,7 +49,12 @@ class FirstStage:
             q = q.filter(TagInvertedIndex.document_collection.in_(self.document_collections))
         document_ids = set()
         for row in q:
-            document_ids.update(TagInvertedIndex.prepare_document_ids(row.document_ids))
+            if FS_CONCEPT_DOCUMENT_SAMPLE_SIZE:
+                # the sample of a concept is the same for every request
+                rng = random.Random(f'{concept_type}:{concept}:{row.document_collection}')
+                document_ids.update(sample_document_ids(row.document_ids, FS_CONCEPT_DOCUMENT_SAMPLE_SIZE, rng))
+            else:
+                document_ids.update(TagInvertedIndex.prepare_document_ids(row.document_ids))
 
         return document_ids
 
@@ -1,8 +1,7 @@
 import logging
 from datetime import datetime
 
-from kgextractiontoolbox.backend.retrieve import retrieve_narrative_documents_from_database
-from narraint.backend.database import SessionExtended
+from narraint.backend.document_cache import NARRATIVE_DOCUMENT_CACHE
 from narraint.queryengine.engine import QueryEngine
 from narraint.queryengine.result import QueryDocumentResult
 from narraint.ranking.corpus import DocumentCorpus
@@ -25,19 +24,17 @@ class RecommendationSystem:
         self.resolver = EntityResolver()
 
     def apply_recommendation(self, document_id: int, query_collection: str, document_collections: set):
-        session = SessionExtended.get()
         start = datetime.now()
 
         # Step 1: First stage retrieval
         # print('Step 1: Perform first stage retrieval...')
 
-        input_docs = retrieve_narrative_documents_from_database(session=session,
-                                                                document_ids={document_id},
-                                                                document_collection=query_collection)
+        input_docs = NARRATIVE_DOCUMENT_CACHE.get_documents({document_id}, query_collection,
+                                                            kind="recommender", derive=RecommenderDocument)
         if len(input_docs) != 1:
             return []
 
-        input_doc = RecommenderDocument(input_docs[0])
+        input_doc = input_docs[0]
         input_core = self.core_extractor.extract_narrative_core_from_document(input_doc)
 
         if input_core is None:
@@ -61,8 +58,8 @@ class RecommendationSystem:
         # Step 2: document data retrieval
         # print('Step 2: Query document data...')
         retrieved_doc_ids = {d[0] for d in candidate_document_ids}
-        documents = retrieve_narrative_documents_from_database(session, retrieved_doc_ids, query_collection)
-        documents = [RecommenderDocument(d) for d in documents]
+        documents = NARRATIVE_DOCUMENT_CACHE.get_documents(retrieved_doc_ids, query_collection,
+                                                           kind="recommender", derive=RecommenderDocument)
         docid2doc = {d.id: d for d in documents}
 
         # Step 3: recommendation
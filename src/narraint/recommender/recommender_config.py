@@ -30,6 +30,8 @@ NOT_CONTAINED_COLOUR = "#FFFFFF"
 NOT_CONTAINED_COLOUR_EDGE = "#E5E4E2"
 
 CONCEPT_MAX_SUPPORT = 1000000
+# sample at most this many documents per concept in the first stage (all documents if None)
+FS_CONCEPT_DOCUMENT_SAMPLE_SIZE = None
 
 # Experimental Configuration (because first stage will always find input doc)
 FS_DOCUMENT_CUTOFF = 50
@@ -0,0 +1,84 @@
+import unittest
+
+from sqlalchemy import delete
+
+from kgextractiontoolbox.backend.models import Document
+from narraint.backend.database import SessionExtended
+from narraint.backend.document_cache import NarrativeDocumentCache
+
+COLLECTION = "DOCUMENTCACHETEST"
+
+
+class CachedDocument:
+
+    def __init__(self, document_id, text):
+        self.id = document_id
+        self.text = text
+
+
+class TestNarrativeDocumentCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+        document_values = [dict(id=i, collection=COLLECTION, title=f"Title {i}", abstract=f"Abstract {i}")
+                           for i in range(1, 4)]
+        Document.bulk_insert_values_into_table(session, document_values)
+
+    def test_get_returns_copies(self):
+        cache = NarrativeDocumentCache()
+        cache.put("test", COLLECTION, 1, CachedDocument(1, "a"))
+        document = cache.get("test", COLLECTION, 1)
+        document.text = "b"
+        self.assertEqual("a", cache.get("test", COLLECTION, 1).text)
+        self.assertIsNone(cache.get("test", COLLECTION, 2))
+        self.assertIsNone(cache.get("other", COLLECTION, 1))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_lru_eviction_within_budget(self):
+        cache = NarrativeDocumentCache()
+        cache.put("test", COLLECTION, 1, CachedDocument(1, "a" * 100))
+        entry_size = cache.size_bytes
+        cache.max_bytes = 2 * entry_size
+
+        cache.put("test", COLLECTION, 2, CachedDocument(2, "a" * 100))
+        # 1 was used recently, so 2 is evicted
+        cache.get("test", COLLECTION, 1)
+        cache.put("test", COLLECTION, 3, CachedDocument(3, "a" * 100))
+
+        self.assertIsNotNone(cache.get("test", COLLECTION, 1))
+        self.assertIsNone(cache.get("test", COLLECTION, 2))
+        self.assertIsNotNone(cache.get("test", COLLECTION, 3))
+        self.assertEqual(1, cache.evictions)
+        self.assertLessEqual(cache.size_bytes, cache.max_bytes)
+
+    def test_large_entries_are_not_cached(self):
+        cache = NarrativeDocumentCache(max_entry_bytes=10)
+        cache.put("test", COLLECTION, 1, CachedDocument(1, "abcdefghijklmnopqrstuvwxyz"))
+        self.assertIsNone(cache.get("test", COLLECTION, 1))
+        self.assertEqual(0, cache.size_bytes)
+
+    def test_get_documents(self):
+        cache = NarrativeDocumentCache()
+        documents = cache.get_documents({1, 2, 100}, COLLECTION)
+        self.assertEqual([2, 1], [d.id for d in documents])
+        self.assertEqual(3, cache.misses)
+
+        derived = cache.get_documents({1, 3}, COLLECTION, kind="title", derive=lambda d: CachedDocument(d.id, d.title))
+        self.assertEqual([(3, "Title 3"), (1, "Title 1")], [(d.id, d.text) for d in derived])
+        # the narrative document 1 was cached before
+        self.assertEqual(1, cache.hits)
+
+        derived = cache.get_documents({1, 3}, COLLECTION, kind="title", derive=lambda d: None)
+        self.assertEqual([(3, "Title 3"), (1, "Title 1")], [(d.id, d.text) for d in derived])
+        self.assertEqual(3, cache.hits)
+
+        cache.clear()
+        self.assertEqual(0, cache.size_bytes)
+        self.assertIsNone(cache.get("title", COLLECTION, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
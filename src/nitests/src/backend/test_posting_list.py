@@ -0,0 +1,45 @@
+import json
+import random
+from collections import Counter
+from unittest import TestCase
+
+from narraint.backend.posting_list import count_document_ids, sample_document_ids
+
+
+class PostingListTestCase(TestCase):
+
+    def test_count_document_ids(self):
+        self.assertEqual(0, count_document_ids("[]"))
+        self.assertEqual(1, count_document_ids("[5]"))
+        self.assertEqual(3, count_document_ids("[5, 3, 1]"))
+        self.assertEqual(3, count_document_ids("[5,3,1]"))
+
+    def test_sample_document_ids(self):
+        document_ids = list(range(100000, 0, -1))
+        sample = sample_document_ids(json.dumps(document_ids), 100, random.Random(1))
+        self.assertEqual(100, len(set(sample)))
+        self.assertEqual(sorted(sample), sample)
+        self.assertTrue(all(1 <= d <= 100000 for d in sample))
+
+    def test_small_posting_lists(self):
+        self.assertEqual([], sample_document_ids("[]", 10))
+        self.assertEqual([], sample_document_ids("[5, 3, 1]", 0))
+        self.assertEqual([1, 3, 5], sample_document_ids("[5, 3, 1]", 10))
+        self.assertEqual(2, len(sample_document_ids("[5, 3, 1]", 2)))
+
+    def test_sampling_is_deterministic(self):
+        document_ids_str = json.dumps(list(range(1000, 0, -1)))
+        self.assertEqual(sample_document_ids(document_ids_str, 10, random.Random(42)),
+                         sample_document_ids(document_ids_str, 10, random.Random(42)))
+        self.assertNotEqual(sample_document_ids(document_ids_str, 10, random.Random(42)),
+                            sample_document_ids(document_ids_str, 10, random.Random(7)))
+
+    def test_ids_of_different_lengths_are_equally_likely(self):
+        document_ids = [10 ** 9 + 1, 10 ** 6 + 1, 10 ** 3 + 1, 11, 1]
+        document_ids_str = json.dumps(document_ids)
+        rng = random.Random(0)
+        counts = Counter()
+        for _ in range(20000):
+            counts.update(sample_document_ids(document_ids_str, 2, rng))
+        for document_id in document_ids:
+            self.assertAlmostEqual(8000, counts[document_id], delta=400)
@@ -0,0 +1,44 @@
+import json
+import unittest
+
+from sqlalchemy import delete
+
+from kgextractiontoolbox.backend.models import Document
+from kgextractiontoolbox.backend.retrieve import retrieve_narrative_documents_from_database
+from narraint.backend.database import SessionExtended
+from narraint.backend.retrieve import iter_narrative_documents, retrieve_narrative_documents
+
+COLLECTION = "RETRIEVETEST"
+
+
+class TestRetrieve(unittest.TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+        document_values = [dict(id=i, collection=COLLECTION, title=f"Title {i}", abstract=f"Abstract {i}")
+                           for i in range(1, 8)]
+        Document.bulk_insert_values_into_table(session, document_values)
+
+    def test_chunks_equal_to_single_retrieval(self):
+        document_ids = {1, 2, 3, 4, 5, 6, 7, 100}
+        expected = retrieve_narrative_documents_from_database(SessionExtended.get(), document_ids=document_ids,
+                                                              document_collection=COLLECTION)
+        documents = list(iter_narrative_documents(document_ids, COLLECTION, chunk_size=2, max_workers=2))
+
+        self.assertEqual(7, len(documents))
+        self.assertEqual(sorted(json.dumps(d.to_dict(), sort_keys=True) for d in expected),
+                         sorted(json.dumps(d.to_dict(), sort_keys=True) for d in documents))
+
+    def test_chunks_are_yielded_in_order(self):
+        documents = list(iter_narrative_documents({1, 2, 3, 4, 5, 6, 7}, COLLECTION, chunk_size=1, max_workers=3))
+        self.assertEqual([7, 6, 5, 4, 3, 2, 1], [d.id for d in documents])
+
+    def test_retrieve_narrative_documents(self):
+        self.assertEqual([], retrieve_narrative_documents(set(), COLLECTION))
+        self.assertEqual([3], [d.id for d in retrieve_narrative_documents({3}, COLLECTION)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+from unittest import TestCase, mock
+
+from sqlalchemy import delete
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import DrugDiseaseTrialPhase, TableVersion
+from narraint.clinicaltrials.drug_indications import DrugIndicationIndex
+from narraint.clinicaltrials.extract_trial_phases import ClinicalTrialPhaseExtractor
+
+
+class DrugIndicationTestCase(TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        session.execute(delete(DrugDiseaseTrialPhase))
+        session.execute(delete(TableVersion))
+        session.commit()
+        ClinicalTrialPhaseExtractor.insert_ddp_tuples_into_db([("CHEMBL1", "MESH:D1", 2), ("CHEMBL1", "MESH:D2", 4),
+                                                               ("CHEMBL2", "MESH:D1", 1)])
+
+    @staticmethod
+    def get_rows():
+        session = SessionExtended.get()
+        return {(r.drug, r.disease): r.phase for r in session.query(DrugDiseaseTrialPhase)}
+
+    def test_refresh_only_changes_rows(self):
+        session = SessionExtended.get()
+        self.assertEqual(1, TableVersion.get_version(session, DrugDiseaseTrialPhase.__tablename__))
+
+        ClinicalTrialPhaseExtractor.insert_ddp_tuples_into_db([("CHEMBL1", "MESH:D1", 3), ("CHEMBL1", "MESH:D2", 4),
+                                                               ("CHEMBL3", "MESH:D3", 0)])
+        self.assertEqual({("CHEMBL1", "MESH:D1"): 3, ("CHEMBL1", "MESH:D2"): 4, ("CHEMBL3", "MESH:D3"): 0},
+                         self.get_rows())
+        self.assertEqual(2, TableVersion.get_version(session, DrugDiseaseTrialPhase.__tablename__))
+
+        # unchanged data does not create a new version
+        ClinicalTrialPhaseExtractor.insert_ddp_tuples_into_db([("CHEMBL1", "MESH:D1", 3), ("CHEMBL1", "MESH:D2", 4),
+                                                               ("CHEMBL3", "MESH:D3", 0)])
+        self.assertEqual(2, TableVersion.get_version(session, DrugDiseaseTrialPhase.__tablename__))
+
+    def test_index_reloads_changed_table(self):
+        with mock.patch.object(DrugIndicationIndex, "VERSION_CHECK_INTERVAL", 0):
+            index = DrugIndicationIndex()
+            # the version counter was reset by setUp
+            index.version = None
+            self.assertEqual([dict(mesh_id="MESH:D1", max_phase_for_ind=2),
+                              dict(mesh_id="MESH:D2", max_phase_for_ind=4)], index.get_indications("CHEMBL1"))
+            self.assertEqual([], index.get_indications("CHEMBL3"))
+
+            ClinicalTrialPhaseExtractor.insert_ddp_tuples_into_db([("CHEMBL3", "MESH:D3", 0)])
+            self.assertEqual([], index.get_indications("CHEMBL1"))
+            self.assertEqual([dict(mesh_id="MESH:D3", max_phase_for_ind=0)], index.get_indications("CHEMBL3"))
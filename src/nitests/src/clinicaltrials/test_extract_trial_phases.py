@@ -0,0 +1,37 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from narraint.clinicaltrials.extract_trial_phases import ClinicalTrialPhaseExtractor
+
+HEADER = "NCT Number,Conditions,Interventions,Phases\n"
+
+
+class ClinicalTrialPhaseExtractorTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.clinical_trial_file = os.path.join(self.tmp_dir.name, "clinical_phases.csv")
+        # two fetched pages, each with its own header line
+        with open(self.clinical_trial_file, "w", encoding="utf-8") as f:
+            f.write(HEADER)
+            f.write('NCT1,Diabetes|Obesity,DRUG: Metformin,PHASE2|PHASE3\n')
+            f.write(HEADER)
+            f.write('NCT2,"Diabetes, Type 2",,NA\n')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_iter_trial_rows(self):
+        rows = list(ClinicalTrialPhaseExtractor.iter_trial_rows(self.clinical_trial_file))
+        self.assertEqual(["NCT1", "NCT2"], [r["NCT Number"] for r in rows])
+        self.assertEqual("Diabetes, Type 2", rows[1]["Conditions"])
+
+    def test_split_items(self):
+        self.assertEqual(["Diabetes", "Obesity"], ClinicalTrialPhaseExtractor.split_items("Diabetes|Obesity"))
+        self.assertEqual([], ClinicalTrialPhaseExtractor.split_items(""))
+
+    def test_convert_phase(self):
+        self.assertEqual(3, ClinicalTrialPhaseExtractor.convert_phase("PHASE2|PHASE3"))
+        self.assertEqual(0, ClinicalTrialPhaseExtractor.convert_phase("EARLY_PHASE1"))
+        self.assertEqual(-1, ClinicalTrialPhaseExtractor.convert_phase("NA"))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from narraint.clinicaltrials.fetch_trials import ClinicalTrialPageFetcher
+
+PAGES = {None: ("HEADER\nrow1\n", "t1"), "t1": ("HEADER\nrow2\n", "t2"), "t2": ("HEADER\nrow3\n", None)}
+
+
+class FakeResponse:
+
+    def __init__(self, text, next_token):
+        self.content = text.encode("utf-8")
+        self.headers = {"x-next-page-token": next_token} if next_token else {}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+
+    def __init__(self, fail_at_request=None):
+        self.requested_tokens = []
+        self.fail_at_request = fail_at_request
+
+    def get(self, url, params, timeout):
+        if len(self.requested_tokens) == self.fail_at_request:
+            raise ConnectionError("connection lost")
+        token = params.get("pageToken")
+        self.requested_tokens.append(token)
+        return FakeResponse(*PAGES[token])
+
+
+class ClinicalTrialPageFetcherTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_fetcher(self, session):
+        return ClinicalTrialPageFetcher(cache_dir=self.tmp_dir.name, session=session)
+
+    def test_fetch_and_replay(self):
+        session = FakeSession()
+        snapshot = self.create_fetcher(session).fetch()
+        self.assertEqual([None, "t1", "t2"], session.requested_tokens)
+
+        # offline replay does not send requests
+        offline_session = FakeSession(fail_at_request=0)
+        pages = list(self.create_fetcher(offline_session).iter_pages())
+        self.assertEqual(["HEADER\nrow1\n", "HEADER\nrow2\n", "HEADER\nrow3\n"], pages)
+        self.assertEqual(pages, list(self.create_fetcher(offline_session).iter_pages(snapshot)))
+
+        csv_file = os.path.join(self.tmp_dir.name, "trials.csv")
+        self.create_fetcher(offline_session).write_csv(csv_file)
+        with open(csv_file, "rt", encoding="utf-8") as f:
+            self.assertEqual("".join(pages), f.read())
+
+    def test_resume(self):
+        with self.assertRaises(ConnectionError):
+            self.create_fetcher(FakeSession(fail_at_request=2)).fetch()
+        self.assertEqual(1, len(self.create_fetcher(None).get_snapshots(complete=False)))
+        with self.assertRaises(ValueError):
+            list(self.create_fetcher(None).iter_pages())
+
+        session = FakeSession()
+        self.create_fetcher(session).fetch(resume=True)
+        self.assertEqual(["t2"], session.requested_tokens)
+        self.assertEqual(3, len(list(self.create_fetcher(None).iter_pages())))
+        self.assertEqual([], self.create_fetcher(None).get_snapshots(complete=False))
+
+    def test_corrupted_page(self):
+        fetcher = self.create_fetcher(FakeSession())
+        snapshot = fetcher.fetch()
+        key = ClinicalTrialPageFetcher.get_page_key("t1")
+        with open(os.path.join(self.tmp_dir.name, snapshot, f"{key}.csv"), "wt") as f:
+            f.write("changed")
+        with self.assertRaises(ValueError):
+            list(fetcher.iter_pages())
@@ -0,0 +1,99 @@
+import random
+from collections import Counter
+from datetime import date
+from unittest import TestCase
+
+from sqlalchemy import delete
+
+from kgextractiontoolbox.backend.models import Document, Sentence, Tag, Predication, DocumentMetadata
+from narraint.backend.database import SessionExtended
+from narraint.dummy.generate_dummy_data import ZipfSampler, DummyCorpusConfig, generate_chunk_rows, \
+    generate_dummy_corpus, _init_worker, count_chunk_rows
+
+COLLECTION = "DUMMYTEST"
+
+
+def chunk(first_document_id=0, documents=200, seed=1):
+    return dict(collection=COLLECTION, first_document_id=first_document_id, documents=documents, seed=seed,
+                date_inserted=date(2024, 1, 1), sentence_id=1, tag_id=1, predication_id=1)
+
+
+class GenerateDummyDataTestCase(TestCase):
+
+    def setUp(self) -> None:
+        _init_worker(DummyCorpusConfig(entities=1000, relations=5))
+        self.delete_test_data()
+
+    def tearDown(self) -> None:
+        self.delete_test_data()
+
+    @staticmethod
+    def delete_test_data():
+        session = SessionExtended.get()
+        for table in [Tag, Predication, Sentence, DocumentMetadata]:
+            session.execute(delete(table).where(table.document_collection == COLLECTION))
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+
+    @staticmethod
+    def query_test_data():
+        session = SessionExtended.get()
+        tables = dict()
+        for table in [Tag, Predication]:
+            query = session.query(table).filter(table.document_collection == COLLECTION).order_by(table.id)
+            tables[table] = [(r.document_id, r.id) for r in query]
+        query = session.query(Document).filter(Document.collection == COLLECTION).order_by(Document.id)
+        tables[Document] = [(r.id, r.title) for r in query]
+        return tables
+
+    def test_zipf_sampler(self):
+        counts = Counter(ZipfSampler(100, 1.0).sample(random.Random(0), 100000))
+        self.assertEqual(0, counts.most_common(1)[0][0])
+        # the most frequent rank is about twice as frequent as the second rank
+        self.assertAlmostEqual(2.0, counts[0] / counts[1], delta=0.2)
+
+        counts = Counter(ZipfSampler(10, 0.0).sample(random.Random(0), 100000))
+        self.assertAlmostEqual(1.0, counts[0] / counts[9], delta=0.1)
+
+    def test_chunks_are_reproducible(self):
+        rows = generate_chunk_rows(chunk())
+        self.assertEqual(rows, generate_chunk_rows(chunk()))
+        self.assertNotEqual(rows, generate_chunk_rows(chunk(seed=2)))
+
+        sentences, tags, predications = count_chunk_rows(chunk())
+        self.assertEqual(sentences, len(rows[Sentence]))
+        self.assertEqual(tags, len(rows[Tag]))
+        self.assertEqual(predications, len(rows[Predication]))
+
+    def test_predications_refer_to_document_rows(self):
+        rows = generate_chunk_rows(chunk())
+        sentence_ids = [row[0] for row in rows[Sentence]]
+        self.assertEqual(list(range(1, len(sentence_ids) + 1)), sentence_ids)
+        document_tags = {(row[6], row[4]) for row in rows[Tag]}
+        tags_per_document = Counter(row[6] for row in rows[Tag])
+        for row in rows[Predication]:
+            document_id, subject_id, object_id, sentence_id = row[1], row[3], row[8], row[12]
+            self.assertIn(sentence_id, sentence_ids)
+            if tags_per_document[document_id] >= 2:
+                self.assertIn((document_id, subject_id), document_tags)
+                self.assertIn((document_id, object_id), document_tags)
+
+    def test_generate_corpus_independent_of_workers(self):
+        config = DummyCorpusConfig(entities=1000, relations=5)
+        generate_dummy_corpus({COLLECTION: 250}, config=config, seed=3, chunk_size=100)
+        tables = self.query_test_data()
+        self.assertEqual(list(range(250)), [document_id for document_id, _ in tables[Document]])
+        # ids are assigned densely
+        tag_ids = [tag_id for _, tag_id in tables[Tag]]
+        self.assertEqual(list(range(tag_ids[0], tag_ids[0] + len(tag_ids))), tag_ids)
+
+        self.delete_test_data()
+        generate_dummy_corpus({COLLECTION: 250}, config=config, seed=3, chunk_size=100, workers=2)
+        self.assertEqual(tables, self.query_test_data())
+
+    def test_generate_corpus_incremental(self):
+        config = DummyCorpusConfig(entities=1000, relations=5)
+        generate_dummy_corpus({COLLECTION: 10}, config=config, seed=3)
+        generate_dummy_corpus({COLLECTION: 10}, config=config, seed=3, incremental=True)
+        tables = self.query_test_data()
+        self.assertEqual(list(range(20)), [document_id for document_id, _ in tables[Document]])
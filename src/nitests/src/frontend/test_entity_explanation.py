@@ -1,5 +1,6 @@
 import json
 from unittest import TestCase
+from unittest.mock import patch
 
 import tqdm
 from sqlalchemy import delete
@@ -134,17 +135,21 @@ class EntityExplanationTestCase(TestCase):
                                            synonym=synonyms,
                                            synonym_processed=synonyms))
 
+        # update index data
+        EntityTaggerData.bulk_insert_values_into_table(session, entity_tagger_data)
+        cls.insert_explainer_data()
+
+        cls.entity_explainer = EntityExplainer()
+
+    @staticmethod
+    def insert_explainer_data():
+        session = SessionExtended.get()
         entity_explainer_data = list()
         for ent_id, ent_terms in explanation_entries:
             entry = dict(entity_id=ent_id, entity_terms=ent_terms)
             entity_explainer_data.append(entry)
-
-        # update index data
-        EntityTaggerData.bulk_insert_values_into_table(session, entity_tagger_data)
         EntityExplainerData.bulk_insert_values_into_table(session, entity_explainer_data)
 
-        cls.entity_explainer = EntityExplainer()
-
     def test_chembl_entries(self):
         """
         Tests whether drugbank names and headings can be tagged correctly
@@ -210,6 +215,56 @@ class EntityExplanationTestCase(TestCase):
         self.assertIn('Ace', f_test)
         self.assertIn('Acetabulum', f_test)
 
+    def test_query_terms_for_entity_ids(self):
+        entity_id2terms = self.entity_explainer.query_terms_for_entity_ids({'CHEMBL1431', 'CHEMBL660', 'UNKNOWN'})
+        self.assertEqual(2, len(entity_id2terms))
+        self.assertEqual(['la-6023', 'metformin', 'metformin extended release'], entity_id2terms['CHEMBL1431'])
+        self.assertIn('symmetrel', entity_id2terms['CHEMBL660'])
+        self.assertNotIn('UNKNOWN', entity_id2terms)
+
+        self.assertEqual({}, self.entity_explainer.query_terms_for_entity_ids(set()))
+
+    def test_explanation_memoized(self):
+        self.entity_explainer.clear_explanation_cache()
+        terms_first = self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)
+
+        # the second call must be answered from the cache without querying the database
+        with patch.object(EntityExplainer, 'query_terms_for_entity_ids') as query_mock:
+            terms_second = self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)
+            query_mock.assert_not_called()
+        self.assertEqual(terms_first, terms_second)
+
+        # modifying the returned list must not change the memoized explanation
+        terms_second.append('dummy')
+        self.assertNotIn('dummy', self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000))
+
+    def test_explanation_cache_invalidated_by_database_update(self):
+        self.entity_explainer.clear_explanation_cache()
+        wrapped = EntityExplainer.query_terms_for_entity_ids
+        with patch.object(EntityExplainer, 'CACHE_VALIDATION_INTERVAL', 0), \
+                patch.object(EntityExplainer, 'query_terms_for_entity_ids', side_effect=wrapped) as query_mock, \
+                patch('narraint.frontend.entity.entityexplainer.DatabaseUpdate.get_latest_update',
+                      side_effect=['2024-01-01', '2024-01-01', '2024-02-01']):
+            self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)
+            self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)
+            self.assertEqual(1, query_mock.call_count)
+            # the database has been updated -> the explanation must be computed again
+            self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)
+            self.assertEqual(2, query_mock.call_count)
+
+    def test_store_index_clears_explanation_cache(self):
+        self.assertIn('la-6023', [t.lower() for t in
+                                  self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)])
+        try:
+            # rebuild an empty index
+            with patch.object(EntityExplainer, '_create_index'):
+                self.entity_explainer.store_index()
+            terms = [t.lower() for t in self.entity_explainer.explain_entity_str('Metformin', truncate_at_k=1000)]
+            self.assertNotIn('la-6023', terms)
+        finally:
+            self.insert_explainer_data()
+            self.entity_explainer.clear_explanation_cache()
+
     def test_mesh_supplement_entries(self):
         self.assertIn('Absence of Tibia', [t for t in self.entity_explainer.explain_entity_str('Absence of Tibia')])
 
@@ -0,0 +1,119 @@
+from datetime import date
+from unittest import TestCase
+
+from sqlalchemy import delete
+
+from kgextractiontoolbox.backend.models import Document, Tag, Predication
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import DatabaseUpdate, ContentData
+from narraint.frontend.ui.service_content import compute_content_data, get_content_data, get_predication_stats, \
+    merge_counts, MIN_DETECTED_ENTITIES_PER_ENTITY_TYPE
+
+COLLECTION = "CONTENTTEST"
+LAST_UPDATE = date(2099, 1, 1)
+
+
+def tag(tag_id, document_id, ent_type):
+    return dict(id=tag_id, ent_type=ent_type, start=0, end=5, ent_id="D1", ent_str="test",
+                document_id=document_id, document_collection=COLLECTION)
+
+
+def predication(predication_id, document_id, relation, extraction_type="PathIE"):
+    return dict(id=predication_id, document_id=document_id, document_collection=COLLECTION,
+                subject_id="CHEMBL1", subject_type="Drug", subject_str="metformin", predicate="treat",
+                relation=relation, object_id="D1", object_type="Disease", object_str="diabetes",
+                sentence_id=1, confidence=1.0, extraction_type=extraction_type)
+
+
+class ServiceContentTestCase(TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        self.update_dates = [d.last_update for d in session.query(DatabaseUpdate)]
+        self.delete_test_data()
+        session.execute(delete(DatabaseUpdate))
+        session.commit()
+        DatabaseUpdate.bulk_insert_values_into_table(session, [dict(last_update=LAST_UPDATE)])
+
+    def tearDown(self) -> None:
+        session = SessionExtended.get()
+        self.delete_test_data()
+        session.execute(delete(DatabaseUpdate))
+        session.commit()
+        DatabaseUpdate.bulk_insert_values_into_table(session, [dict(last_update=d) for d in self.update_dates])
+        compute_content_data()
+
+    @staticmethod
+    def delete_test_data():
+        session = SessionExtended.get()
+        for table in [Tag, Predication]:
+            session.execute(delete(table).where(table.document_collection == COLLECTION))
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+
+    @staticmethod
+    def insert_documents(document_ids, date_inserted):
+        session = SessionExtended.get()
+        Document.bulk_insert_values_into_table(session, [
+            dict(id=i, collection=COLLECTION, title=f"Title {i}", abstract="", date_inserted=date_inserted)
+            for i in document_ids])
+        Tag.bulk_insert_values_into_table(session, [tag(700000 + i, i, "ContentTestType") for i in document_ids])
+        Predication.bulk_insert_values_into_table(session, [
+            predication(700000 + i, i, "content_test_relation") for i in document_ids])
+
+    @staticmethod
+    def get_content_counts():
+        return dict(collections=get_content_data("collections"),
+                    entity_types=get_content_data("entity_types"),
+                    relations=get_content_data("relations"),
+                    stats=sorted(get_predication_stats(), key=lambda x: (x[0], str(x[1]))))
+
+    def test_merge_counts(self):
+        counts = dict(a=1, b=dict(x=2))
+        self.assertEqual(dict(a=3, b=dict(x=2, y=1), c=5), merge_counts(counts, dict(a=2, b=dict(y=1), c=5)))
+
+    def test_incremental_update_equals_full_computation(self):
+        self.insert_documents([1, 2, 3], date(2098, 1, 1))
+        compute_content_data()
+        self.assertEqual(3, get_content_data("collections")[COLLECTION])
+
+        self.insert_documents([4, 5], date(2099, 1, 1))
+        compute_content_data(newer_documents=True)
+        incremental_counts = self.get_content_counts()
+        self.assertEqual(5, incremental_counts["collections"][COLLECTION])
+        self.assertEqual(5, incremental_counts["relations"]["content_test_relation"])
+        self.assertIn(("content_test_relation", "PathIE", 5), incremental_counts["stats"])
+
+        # the documents since the last update must not be counted twice
+        compute_content_data(newer_documents=True)
+        self.assertEqual(incremental_counts, self.get_content_counts())
+
+        compute_content_data()
+        self.assertEqual(incremental_counts, self.get_content_counts())
+
+    def test_small_entity_types_are_hidden(self):
+        self.insert_documents([1, 2], date(2098, 1, 1))
+        compute_content_data()
+        self.assertNotIn("ContentTestType", get_content_data("entity_types"))
+
+        session = SessionExtended.get()
+        Tag.bulk_insert_values_into_table(session, [
+            tag(800000 + i, 1, "ContentTestType") for i in range(MIN_DETECTED_ENTITIES_PER_ENTITY_TYPE)])
+        compute_content_data()
+        self.assertEqual(MIN_DETECTED_ENTITIES_PER_ENTITY_TYPE + 2, get_content_data("entity_types")["ContentTestType"])
+
+    def test_incremental_update_without_stored_counts(self):
+        self.insert_documents([1, 2, 3], date(2098, 1, 1))
+        self.insert_documents([4, 5], date(2099, 1, 1))
+        session = SessionExtended.get()
+        session.execute(delete(ContentData))
+        session.commit()
+
+        # without counts per date, the incremental update must count all documents
+        compute_content_data(newer_documents=True)
+        incremental_counts = self.get_content_counts()
+        self.assertEqual(5, incremental_counts["collections"][COLLECTION])
+        self.assertIn(("content_test_relation", "PathIE", 5), incremental_counts["stats"])
+
+        compute_content_data()
+        self.assertEqual(incremental_counts, self.get_content_counts())
@@ -0,0 +1,15 @@
+from unittest import TestCase
+
+from narraint.keywords.generate_keywords import get_entity_random, extract_entity_keywords
+
+
+class GenerateKeywordsTestCase(TestCase):
+
+    def test_entity_random_is_deterministic(self):
+        self.assertEqual(get_entity_random(42, "Drug", "CHEMBL1").random(),
+                         get_entity_random(42, "Drug", "CHEMBL1").random())
+        self.assertNotEqual(get_entity_random(42, "Drug", "CHEMBL1").random(),
+                            get_entity_random(42, "Drug", "CHEMBL2").random())
+
+    def test_extract_entity_keywords_without_text(self):
+        self.assertEqual(("CHEMBL1", "[]"), extract_entity_keywords(("CHEMBL1", "metformin", "")))
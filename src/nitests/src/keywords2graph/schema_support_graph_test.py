@@ -2,70 +2,64 @@ from unittest import TestCase
 
 from sqlalchemy import delete
 
-from kgextractiontoolbox.backend.models import Predication, Sentence
+from kgextractiontoolbox.backend.models import Predication, Sentence, Tag
 from narraint.backend.database import SessionExtended
 from narraint.backend.models import Document
-from narraint.keywords2graph.schema_support_graph import SchemaSupportGraph
+from narraint.keywords2graph.schema_support_graph import SchemaSupportGraph, CO_OCCURRENCE_RELATION
 
 
-class SchemaSupportGraphTest(TestCase):
+def create_test_predication(pred_id, document_id, subject_type, relation, object_type,
+                            document_collection="schemagraph"):
+    return dict(id=pred_id, document_id=document_id, document_collection=document_collection,
+                subject_id="A", subject_type=subject_type, subject_str="A_STR",
+                predicate="t1", relation=relation,
+                object_id="B", object_type=object_type, object_str="B_STR",
+                sentence_id=1, confidence=1.0, extraction_type="Test")
 
-    def setUp(self) -> None:
-        session = SessionExtended.get()
 
-        stmt = delete(Predication)
-        session.execute(stmt)
-        session.commit()
+SCHEMA_GRAPH_DOCUMENTS = [dict(id=doc_id, collection="schemagraph", title="Test", abstract="Test Abstract")
+                          for doc_id in range(1, 9)]
+SCHEMA_GRAPH_SENTENCES = [dict(id=1, document_collection="schemagraph", text="ABC", md5hash="HASH")]
+SCHEMA_GRAPH_PREDICATIONS = [create_test_predication(1000, 1, "AT", "T1", "BT"),
+                             create_test_predication(1001, 1, "AT", "T1", "BT"),
+                             create_test_predication(1002, 2, "AT", "T1", "BT"),
+                             create_test_predication(1003, 3, "AT", "T1", "BT"),
 
-        document_values = [dict(id=1, collection="schemagraph", title="Test", abstract="Test Abstract"),
-                           dict(id=2, collection="schemagraph", title="Test", abstract="Test Abstract"),
-                           dict(id=3, collection="schemagraph", title="Test", abstract="Test Abstract"),
-                           dict(id=4, collection="schemagraph", title="Test", abstract="Test Abstract")]
-        sentences_values = [dict(id=1, document_collection="schemagraph", text="ABC", md5hash="HASH")]
-        pred_values = [dict(id=1000, document_id=1, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T1",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-                       dict(id=1001, document_id=1, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T1",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-                       dict(id=1002, document_id=2, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T1",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-                       dict(id=1003, document_id=3, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T1",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-
-                       dict(id=1004, document_id=2, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T2",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-                       dict(id=1005, document_id=3, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT", subject_str="A_STR",
-                            predicate="t1", relation="T2",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test"),
-
-                       dict(id=1006, document_id=4, document_collection="schemagraph",
-                            subject_id="A", subject_type="AT_X", subject_str="A_STR",
-                            predicate="t1", relation="T5",
-                            object_id="B", object_type="BT", object_str="B_STR",
-                            sentence_id=1, confidence=1.0, extraction_type="Test")
-                       ]
-
-        Document.bulk_insert_values_into_table(session, document_values)
-        Sentence.bulk_insert_values_into_table(session, sentences_values)
-        Predication.bulk_insert_values_into_table(session, pred_values)
+                             create_test_predication(1004, 2, "AT", "T2", "BT"),
+                             create_test_predication(1005, 3, "AT", "T2", "BT"),
 
-        SchemaSupportGraph.compute_schema_graph()
+                             create_test_predication(1006, 4, "AT_X", "T5", "BT")]
+
+
+def insert_schema_graph_test_data(additional_predications=None):
+    """
+    Inserts the schema graph test predications, computes the schema graph and reloads it
+    :param additional_predications: further predication values (documents 1 to 8 are available)
+    :return: None
+    """
+    session = SessionExtended.get()
+
+    stmt = delete(Predication)
+    session.execute(stmt)
+    session.commit()
+
+    pred_values = list(SCHEMA_GRAPH_PREDICATIONS)
+    if additional_predications:
+        pred_values.extend(additional_predications)
+
+    Document.bulk_insert_values_into_table(session, SCHEMA_GRAPH_DOCUMENTS)
+    Sentence.bulk_insert_values_into_table(session, SCHEMA_GRAPH_SENTENCES)
+    Predication.bulk_insert_values_into_table(session, pred_values)
+
+    SchemaSupportGraph.compute_schema_graph()
+    # the graph is a singleton that might have been loaded by a previous test
+    SchemaSupportGraph().load_schema_graph_from_db()
+
+
+class SchemaSupportGraphTest(TestCase):
+
+    def setUp(self) -> None:
+        insert_schema_graph_test_data()
 
     def test_schema_graph_based_on_predications(self):
         sg: SchemaSupportGraph = SchemaSupportGraph()
@@ -100,3 +94,51 @@ class SchemaSupportGraphTest(TestCase):
         self.assertEqual(0, sg.get_support("AT", "T1", "BT_N"))
         self.assertEqual(0, sg.get_support("AT", "T2", "BT_N"))
         self.assertEqual(0, sg.get_support("AT_X", "T5", "BT_N"))
+
+    def test_schema_graph_parallel(self):
+        session = SessionExtended.get()
+        # the same document id in another collection is a different document
+        Document.bulk_insert_values_into_table(session, [dict(id=1, collection="schemagraph_2", title="Test",
+                                                              abstract="Test Abstract")])
+        Sentence.bulk_insert_values_into_table(session, [dict(id=2, document_collection="schemagraph_2",
+                                                              text="ABC", md5hash="HASH")])
+        pred_values = [create_test_predication(1100, 1, "AT", "T1", "BT", document_collection="schemagraph_2")]
+        pred_values[0]["sentence_id"] = 2
+        Predication.bulk_insert_values_into_table(session, pred_values)
+
+        spo2support = SchemaSupportGraph.compute_supports(workers=2)
+        self.assertEqual(4, spo2support[("AT", "T1", "BT")])
+        self.assertEqual(2, spo2support[("AT", "T2", "BT")])
+        self.assertEqual(1, spo2support[("AT_X", "T5", "BT")])
+        self.assertEqual(spo2support, SchemaSupportGraph.compute_supports(workers=1))
+
+    def test_schema_graph_co_occurrences(self):
+        session = SessionExtended.get()
+        session.execute(delete(Tag))
+        session.commit()
+
+        tag_values = [dict(id=100, ent_type="AT", ent_id="A", ent_str="AS", start=0, end=1,
+                           document_id=1, document_collection="schemagraph"),
+                      dict(id=101, ent_type="AT", ent_id="A2", ent_str="AS", start=2, end=3,
+                           document_id=1, document_collection="schemagraph"),
+                      dict(id=102, ent_type="BT", ent_id="B", ent_str="BS", start=4, end=5,
+                           document_id=1, document_collection="schemagraph"),
+                      dict(id=103, ent_type="AT", ent_id="A", ent_str="AS", start=0, end=1,
+                           document_id=2, document_collection="schemagraph")]
+        Tag.bulk_insert_values_into_table(session, tag_values)
+
+        spo2support = SchemaSupportGraph.compute_graph_for_tags("schemagraph")
+        self.assertEqual(2, spo2support[("AT", CO_OCCURRENCE_RELATION, "AT")])
+        self.assertEqual(1, spo2support[("AT", CO_OCCURRENCE_RELATION, "BT")])
+        self.assertEqual(1, spo2support[("BT", CO_OCCURRENCE_RELATION, "AT")])
+        self.assertEqual(1, spo2support[("BT", CO_OCCURRENCE_RELATION, "BT")])
+        self.assertEqual(4, len(spo2support))
+
+        SchemaSupportGraph.compute_schema_graph(with_co_occurrences=True)
+        sg: SchemaSupportGraph = SchemaSupportGraph()
+        sg.load_schema_graph_from_db()
+        self.assertEqual(2, sg.get_support("AT", CO_OCCURRENCE_RELATION, "AT"))
+        self.assertEqual(3, sg.get_support("AT", "T1", "BT"))
+
+        session.execute(delete(Tag))
+        session.commit()
@@ -0,0 +1,124 @@
+from unittest import TestCase
+
+from narraint.keywords2graph.schema_support_graph import SchemaSupportGraph
+from narraint.keywords2graph.translation import Keyword2GraphTranslation, ASSOCIATED
+from narrant.entity.entity import Entity
+from narrant.entitylinking.enttypes import DRUG, CHEMICAL, DOSAGE_FORM
+from nitests.src.keywords2graph.schema_support_graph_test import insert_schema_graph_test_data, \
+    create_test_predication
+
+# Extends the schema graph test data by:
+# (BT, T1, AT) with support 1 and (BT, T2, AT) with support 4
+# associated edges between AT, BT and CT in both directions, each with support 2
+TRANSLATION_TEST_PREDICATIONS = [create_test_predication(2000, 5, "BT", "T1", "AT"),
+
+                                 create_test_predication(2001, 5, "BT", "T2", "AT"),
+                                 create_test_predication(2002, 6, "BT", "T2", "AT"),
+                                 create_test_predication(2003, 7, "BT", "T2", "AT"),
+                                 create_test_predication(2004, 8, "BT", "T2", "AT")]
+for idx, (s_type, o_type) in enumerate([("AT", "BT"), ("BT", "AT"), ("BT", "CT"),
+                                        ("CT", "BT"), ("AT", "CT"), ("CT", "AT")]):
+    TRANSLATION_TEST_PREDICATIONS.append(create_test_predication(3000 + 2 * idx, 1, s_type, ASSOCIATED, o_type))
+    TRANSLATION_TEST_PREDICATIONS.append(create_test_predication(3001 + 2 * idx, 2, s_type, ASSOCIATED, o_type))
+
+
+class Keyword2GraphTranslationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        insert_schema_graph_test_data(TRANSLATION_TEST_PREDICATIONS)
+        cls.translation = Keyword2GraphTranslation()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        insert_schema_graph_test_data()
+
+    def reference_patterns(self, keywords_with_types):
+        # the exhaustive enumeration that has been used to translate keywords before
+        patterns = self.translation.find_all_possible_query_patterns(keywords_with_types)
+        specific_patterns = [p for p in patterns if p.is_specific()][:2]
+        associated_patterns = [p for p in patterns if p.is_associated()][:1]
+        return specific_patterns + associated_patterns
+
+    def assertPatternsEqual(self, expected_patterns, patterns):
+        self.assertEqual([(p.to_json_data(), p.minimum_support) for p in expected_patterns],
+                         [(p.to_json_data(), p.minimum_support) for p in patterns])
+
+    def test_top_specific_patterns(self):
+        keywords_with_types = [("a", "AT"), ("b", "BT")]
+        patterns = self.translation.find_most_supported_specific_patterns(keywords_with_types, k=2)
+        self.assertEqual(2, len(patterns))
+        self.assertEqual([("a", "T1", "b")], patterns[0].to_json_data())
+        self.assertEqual(3, patterns[0].minimum_support)
+        self.assertEqual([("a", "T2", "b")], patterns[1].to_json_data())
+        self.assertEqual(2, patterns[1].minimum_support)
+
+        self.assertPatternsEqual(self.reference_patterns(keywords_with_types)[:2], patterns)
+
+    def test_flipped_patterns_are_suppressed(self):
+        # (b, T2, a) has a higher support (4) than (a, T2, b) (2), but both result in the same pattern
+        # the first enumerated chain (a, T2, b) represents the pattern (reversed chain is skipped)
+        keywords_with_types = [("a", "AT"), ("b", "BT")]
+        patterns = self.translation.find_most_supported_specific_patterns(keywords_with_types, k=10)
+        self.assertEqual([[("a", "T1", "b")], [("a", "T2", "b")]], [p.to_json_data() for p in patterns])
+        self.assertEqual([3, 2], [p.minimum_support for p in patterns])
+
+        # for the reversed keyword order the chains starting with b come first
+        # so (b, T2, a) and (b, T1, a) represent the patterns and (a, T1, b) and (a, T2, b) are skipped
+        keywords_with_types = [("b", "BT"), ("a", "AT")]
+        patterns = self.translation.find_most_supported_specific_patterns(keywords_with_types, k=10)
+        self.assertEqual([[("b", "T2", "a")], [("b", "T1", "a")]], [p.to_json_data() for p in patterns])
+        self.assertEqual([4, 1], [p.minimum_support for p in patterns])
+        self.assertPatternsEqual(self.reference_patterns(keywords_with_types)[:2], patterns)
+
+    def test_associated_pattern_with_tied_supports(self):
+        # all associated edges have the same support -> the first keyword order is taken
+        keywords_with_types = [("a", "AT"), ("b", "BT"), ("c", "CT")]
+        pattern = self.translation.find_most_supported_associated_pattern(keywords_with_types)
+        self.assertEqual([("a", ASSOCIATED, "b"), ("b", ASSOCIATED, "c")], pattern.to_json_data())
+        self.assertEqual(2, pattern.minimum_support)
+
+        self.assertPatternsEqual(self.reference_patterns(keywords_with_types),
+                                 self.translation.find_most_supported_query_patterns(keywords_with_types))
+
+    def test_associated_pattern_without_support(self):
+        # there is no associated edge between AT_X and BT -> exhaustive fallback
+        keywords_with_types = [("a", "AT_X"), ("b", "BT")]
+        pattern = self.translation.find_most_supported_associated_pattern(keywords_with_types)
+        self.assertEqual([("a", ASSOCIATED, "b")], pattern.to_json_data())
+        self.assertEqual(0, pattern.minimum_support)
+
+        self.assertPatternsEqual(self.reference_patterns(keywords_with_types),
+                                 self.translation.find_most_supported_query_patterns(keywords_with_types))
+
+    def test_single_keyword(self):
+        keywords_with_types = [("a", "AT")]
+        self.assertIsNone(self.translation.find_most_supported_associated_pattern(keywords_with_types))
+
+        # a single keyword results in one empty pattern (as before)
+        patterns = self.translation.find_most_supported_query_patterns(keywords_with_types)
+        self.assertEqual(1, len(patterns))
+        self.assertEqual([], patterns[0].to_json_data())
+        self.assertPatternsEqual(self.reference_patterns(keywords_with_types), patterns)
+
+    def test_schema_graph_loaded(self):
+        sg: SchemaSupportGraph = SchemaSupportGraph()
+        self.assertEqual(4, sg.get_support("BT", "T2", "AT"))
+        self.assertEqual(2, sg.get_support("BT", ASSOCIATED, "CT"))
+
+    def test_greedy_find_most_supported_entity_type(self):
+        entities = [Entity(entity_id="CHEMBL1", entity_type=DRUG), Entity(entity_id="CHEMBL2", entity_type=CHEMICAL)]
+        entity2support = {(DRUG, "CHEMBL1"): 10, (CHEMICAL, "CHEMBL2"): 20, (DRUG, "CHEMBL3"): 100}
+        self.assertEqual(CHEMICAL, Keyword2GraphTranslation.greedy_find_most_supported_entity_type(entities,
+                                                                                                   entity2support))
+
+        # ids and types are combined: (Drug, CHEMBL2) is considered as well
+        entity2support[(DRUG, "CHEMBL2")] = 30
+        self.assertEqual(DRUG, Keyword2GraphTranslation.greedy_find_most_supported_entity_type(entities,
+                                                                                               entity2support))
+
+        # dosage forms are preferred if supports are equal
+        entities = [Entity(entity_id="D1", entity_type=DRUG), Entity(entity_id="D1", entity_type=DOSAGE_FORM)]
+        entity2support = {(DRUG, "D1"): 5, (DOSAGE_FORM, "D1"): 5}
+        self.assertEqual(DOSAGE_FORM, Keyword2GraphTranslation.greedy_find_most_supported_entity_type(entities,
+                                                                                                      entity2support))
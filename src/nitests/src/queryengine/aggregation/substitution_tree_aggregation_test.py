@@ -161,3 +161,37 @@ class SubstitutionTreeAggregationTest(TestCase):
 
         s_count = self.count_substitutions(ranked, o_vars)
         self.assertEqual(sub_plan, s_count)
+
+    def test_page(self):
+        # X: a (3), X: b (2), X: c (1)
+        entity_subs = {l: QueryEntitySubstitution(l, l, l, entity_name=l) for l in ["a", "b", "c"]}
+        documents = []
+        for idx, l in enumerate(["c", "b", "a", "b", "a", "a"]):
+            documents.append(QueryDocumentResult(idx, "Test", "", "", 2000, 0, {"X": entity_subs[l]}, 1.0, {}))
+
+        tree_aggregation = ResultTreeAggregationBySubstitution()
+        ranked, _ = tree_aggregation.rank_results(list(documents), ordered_var_names=["X"], freq_sort_desc=True,
+                                                  year_sort_desc=True, start_pos=0, end_pos=2)
+        self.assertEqual(2, len(ranked.results))
+        self.assertEqual(entity_subs["a"], ranked.results[0].var2substitution["X"])
+        self.assertEqual(entity_subs["b"], ranked.results[1].var2substitution["X"])
+        # the number of substitutions counts all pages
+        self.assertEqual(3, ranked.count_substitutions)
+
+        ranked, _ = tree_aggregation.rank_results(list(documents), ordered_var_names=["X"], freq_sort_desc=False,
+                                                  year_sort_desc=True, start_pos=1, end_pos=3)
+        self.assertEqual(["b", "a"], [r.var2substitution["X"].entity_id for r in ranked.results])
+        self.assertEqual(5, ranked.get_result_size())
+        self.assertEqual(3, ranked.count_substitutions)
+
+    def test_equal_sizes_keep_first_occurrence(self):
+        entity_subs = {l: QueryEntitySubstitution(l, l, l, entity_name=l) for l in ["a", "b", "c"]}
+        documents = []
+        for idx, (year, l) in enumerate([(2001, "b"), (2003, "c"), (2002, "a")]):
+            documents.append(QueryDocumentResult(idx, "Test", "", "", year, 0, {"X": entity_subs[l]}, 1.0, {}))
+
+        tree_aggregation = ResultTreeAggregationBySubstitution()
+        ranked, _ = tree_aggregation.rank_results(documents, ordered_var_names=["X"], freq_sort_desc=True,
+                                                  year_sort_desc=True)
+        # documents are sorted by year before they are grouped
+        self.assertEqual(["c", "a", "b"], [r.var2substitution["X"].entity_id for r in ranked.results])
@@ -0,0 +1,96 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from narraint.queryengine.benchmark import compute_percentile, summarize_durations, compare_with_baseline, \
+    load_query_log_workload, generate_synthetic_workload, run_benchmark, BenchmarkQuery, BENCHMARK_STAGES
+
+
+def execution(total_ms, index_fetch_ms=0.0):
+    return dict(total_ms=total_ms, stages={"engine.inverted_index": index_fetch_ms}, counters={})
+
+
+def results(total_p50=10.0, peak_memory_bytes=1000, rows=100, database_update="2024-01-01"):
+    percentiles = dict(p50=total_p50, p90=total_p50, p99=total_p50)
+    return dict(meta=dict(database_update=database_update),
+                summary=dict(cold=dict(total=percentiles), warm=dict(total=percentiles)),
+                queries=[dict(name="q1", warm=dict(total=percentiles), peak_memory_bytes=peak_memory_bytes,
+                              rows=dict(inverted_index_rows=rows))])
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_compute_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, compute_percentile(values, 50))
+        self.assertEqual(90, compute_percentile(values, 90))
+        self.assertEqual(99, compute_percentile(values, 99))
+        self.assertEqual(7, compute_percentile([7], 99))
+
+    def test_summarize_durations(self):
+        summary = summarize_durations([execution(10.0, 4.0), execution(20.0, 6.0), execution(30.0, 8.0)])
+        self.assertEqual(set(BENCHMARK_STAGES) | {"total"}, set(summary))
+        self.assertEqual(dict(p50=20.0, p90=30.0, p99=30.0), summary["total"])
+        self.assertEqual(6.0, summary["index_fetch"]["p50"])
+        self.assertEqual(0.0, summary["translation"]["p50"])
+        self.assertEqual({}, summarize_durations([]))
+
+    def test_compare_with_baseline(self):
+        baseline = results()
+        self.assertEqual([], compare_with_baseline(results(), baseline))
+        # small latency increases are noise
+        self.assertEqual([], compare_with_baseline(results(total_p50=14.0), baseline))
+
+        regressions = compare_with_baseline(results(total_p50=30.0), baseline)
+        self.assertEqual(7, len(regressions))
+        self.assertIn("q1 warm total p50: 10.0 ms -> 30.0 ms", regressions)
+        self.assertEqual([], compare_with_baseline(results(total_p50=30.0), baseline, dict(latency=5.0)))
+
+        self.assertEqual(["q1 peak memory: 1000 -> 1500 bytes"],
+                         compare_with_baseline(results(peak_memory_bytes=1500), baseline))
+        self.assertEqual(["q1 inverted_index_rows: 100 -> 200"], compare_with_baseline(results(rows=200), baseline))
+        self.assertEqual([], compare_with_baseline(results(rows=200), baseline, dict(rows=1.5)))
+
+    def test_load_query_log_workload(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            with open(os.path.join(log_dir, "2024-01-01-queries.log"), "wt") as f:
+                f.write('timestamp\ttime needed\tcollection\tcache hit\thits\tquery string\tgraph query')
+                f.write('\n2024.01.01-10:00:00\t0:00:01\tPubMed\tFalse\t10\tMetformin treats Diabetes\t...')
+                f.write('\n2024.01.01-10:00:01\t0:00:01\tLitCovid-PubMed\tTrue\t10\tDrug treats Covid19\t...')
+            with open(os.path.join(log_dir, "2024-01-02-queries.log"), "wt") as f:
+                f.write('timestamp\ttime needed\tcollection\tcache hit\thits\tquery string\tgraph query')
+                f.write('\n2024.01.02-10:00:00\t0:00:01\tPubMed\tFalse\t10\tMetformin treats ?X(Disease)\t...')
+
+            workload = load_query_log_workload(log_dir)
+            self.assertEqual(["Metformin treats Diabetes", "Drug treats Covid19", "Metformin treats ?X(Disease)"],
+                             [q.query for q in workload])
+            self.assertEqual(["LitCovid", "PubMed"], workload[1].collections)
+
+            workload = load_query_log_workload(log_dir, limit=2)
+            self.assertEqual(["Drug treats Covid19", "Metformin treats ?X(Disease)"], [q.query for q in workload])
+
+    def test_synthetic_workload_is_reproducible(self):
+        workload = generate_synthetic_workload(["PubMed"], number_of_queries=20, seed=1, entities=1000)
+        self.assertEqual(20, len(workload))
+        self.assertEqual([str(q.graph_query) for q in workload],
+                         [str(q.graph_query) for q in generate_synthetic_workload(["PubMed"], 20, 1, 1000)])
+        self.assertNotEqual([str(q.graph_query) for q in workload],
+                            [str(q.graph_query) for q in generate_synthetic_workload(["PubMed"], 20, 2, 1000)])
+
+    def test_run_benchmark(self):
+        workload = generate_synthetic_workload(["BENCHTEST"], number_of_queries=3, seed=1, entities=1000)
+        benchmark_results = run_benchmark(workload, runs=3)
+
+        self.assertEqual(3, benchmark_results["meta"]["queries"])
+        self.assertEqual(3, len(benchmark_results["queries"]))
+        for query_result in benchmark_results["queries"]:
+            self.assertEqual(0, query_result["documents"])
+            self.assertIn("total", query_result["cold_ms"])
+            self.assertIn("p99", query_result["warm"]["index_fetch"])
+            self.assertGreater(query_result["rows"]["sql_statements"], 0)
+            self.assertGreater(query_result["peak_memory_bytes"], 0)
+        self.assertEqual([], compare_with_baseline(benchmark_results, benchmark_results))
+        self.assertRaises(ValueError, run_benchmark, workload, 0)
+
+    def test_benchmark_query_requires_query(self):
+        self.assertRaises(ValueError, BenchmarkQuery, "empty", ["PubMed"])
@@ -63,3 +63,17 @@ class QueryExpanderTestCase(TestCase):
         self.assertEqual("Metformin", next(iter(queries_expanded[0].fact_patterns[0].subjects)).entity_id)
         self.assertEqual("inhibits", queries_expanded[0].fact_patterns[0].predicate)
         self.assertEqual("mtor", next(iter(queries_expanded[0].fact_patterns[0].objects)).entity_id)
+
+    def test_expand_predicate_directions(self):
+        self.assertEqual({("inhibits", False)}, QueryExpander.expand_predicate_directions("inhibits"))
+        self.assertEqual({("associated", False), ("associated", True)},
+                         QueryExpander.expand_predicate_directions("associated"))
+        self.assertEqual({("interacts", False), ("metabolises", False), ("inhibits", False),
+                          ("interacts", True), ("metabolises", True), ("inhibits", True)},
+                         QueryExpander.expand_predicate_directions("interacts"))
+
+    def test_is_symmetric_expansion(self):
+        self.assertTrue(QueryExpander.is_symmetric_expansion("associated"))
+        self.assertTrue(QueryExpander.is_symmetric_expansion("interacts"))
+        self.assertFalse(QueryExpander.is_symmetric_expansion("treats"))
+        self.assertFalse(QueryExpander.is_symmetric_expansion("inhibits"))
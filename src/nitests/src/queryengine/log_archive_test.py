@@ -0,0 +1,92 @@
+import os
+import tempfile
+from datetime import date, datetime
+from unittest import TestCase
+
+from narraint.queryengine.log_archive import compact_logs, LogArchive, parse_time_needed
+
+API_CALL_HEADER = 'timestamp\ttime needed\tsuccess\troute\tcall'
+
+
+def write_api_calls(log_dir, day: date, entries):
+    path = os.path.join(log_dir, 'api_calls')
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, f'{day.isoformat()}-api_calls.log'), 'wt') as f:
+        f.write(API_CALL_HEADER)
+        for hour, seconds, success, route in entries:
+            f.write(f'\n{day.strftime("%Y.%m.%d")}-{hour:02d}:00:00\t0:00:{seconds:02d}.500000\t{success}\t{route}\tcall')
+
+
+class LogArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_dir = os.path.join(self.tmp_dir.name, 'logs')
+        self.archive_dir = os.path.join(self.tmp_dir.name, 'archive')
+        write_api_calls(self.log_dir, date(2024, 1, 30), [(10, 1, True, 'subgraph'), (11, 3, True, 'subgraph'),
+                                                          (12, 5, False, 'narrative')])
+        write_api_calls(self.log_dir, date(2024, 2, 1), [(10, 7, True, 'subgraph')])
+        # the log file of today is still written and must not be compacted
+        write_api_calls(self.log_dir, date(2024, 2, 2), [(10, 9, True, 'subgraph')])
+        self.assertEqual(2, compact_logs(self.log_dir, self.archive_dir, today=date(2024, 2, 2)))
+        self.archive = LogArchive(self.archive_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_time_needed(self):
+        self.assertEqual(1.25, parse_time_needed('0:00:01.250000'))
+        self.assertEqual(86400 + 3661, parse_time_needed('1 day, 1:01:01'))
+        self.assertEqual(0.5, parse_time_needed('0.5'))
+        self.assertIsNone(parse_time_needed('unknown'))
+
+    def test_compaction_partitions(self):
+        self.assertTrue(os.path.isfile(os.path.join(self.archive_dir, 'log_type=api_calls', 'month=2024-01',
+                                                    '2024-01-30.parquet')))
+        self.assertTrue(os.path.isfile(os.path.join(self.archive_dir, 'log_type=api_calls', 'month=2024-02',
+                                                    '2024-02-01.parquet')))
+        # already archived files are skipped
+        self.assertEqual(0, compact_logs(self.log_dir, self.archive_dir, today=date(2024, 2, 2)))
+
+    def test_scan(self):
+        table = self.archive.scan('api_calls', columns=['time_needed', 'success'])
+        self.assertEqual(['time_needed', 'success'], table.column_names)
+        self.assertEqual([1.5, 3.5, 5.5, 7.5], sorted(table['time_needed'].to_pylist()))
+
+        table = self.archive.scan('api_calls', columns=['route'], start=datetime(2024, 1, 30, 11),
+                                  end=datetime(2024, 2, 1), equals={"success": True})
+        self.assertEqual(['subgraph'], table['route'].to_pylist())
+
+    def test_count(self):
+        result = self.archive.count('api_calls', group_by=['route'])
+        self.assertEqual({'subgraph': 3, 'narrative': 1},
+                         dict(zip(result['route'].to_pylist(), result['count'].to_pylist())))
+
+    def test_latency_percentiles(self):
+        percentiles = self.archive.latency_percentiles('api_calls', percentiles=(0.0, 1.0))
+        self.assertEqual([dict(percentiles={0.0: 1.5, 1.0: 7.5})], percentiles)
+
+        percentiles = self.archive.latency_percentiles('api_calls', percentiles=(0.5,),
+                                                       equals={"route": "narrative"})
+        self.assertEqual([dict(percentiles={0.5: 5.5})], percentiles)
+
+        result = self.archive.latency_percentiles('api_calls', percentiles=(1.0,), group_by=['month'])
+        self.assertEqual([dict(month='2024-01', percentiles={1.0: 5.5}), dict(month='2024-02', percentiles={1.0: 7.5})],
+                         sorted(result, key=lambda r: r['month']))
+
+    def test_scan_min_time_needed(self):
+        table = self.archive.scan('api_calls', columns=['time_needed'], min_time_needed=5.5)
+        self.assertEqual([7.5], table['time_needed'].to_pylist())
+
+    def test_slow_entries(self):
+        # the median over all entries is 4.5 seconds
+        table = self.archive.slow_entries('api_calls', percentile=0.5, columns=['route'])
+        self.assertEqual(['route', 'time_needed'], table.column_names)
+        self.assertEqual([7.5, 5.5], table['time_needed'].to_pylist())
+        self.assertEqual(['subgraph', 'narrative'], table['route'].to_pylist())
+
+        table = self.archive.slow_entries('api_calls', percentile=0.5, equals={"route": "subgraph"})
+        self.assertEqual([7.5], table['time_needed'].to_pylist())
+
+        self.assertEqual(0, self.archive.slow_entries('api_calls', percentile=1.0).num_rows)
+        self.assertEqual(0, self.archive.slow_entries('api_calls', start=datetime(2025, 1, 1)).num_rows)
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from narraint.queryengine.log_statistics import LogStatistics, get_json_of_log, get_amount_of_occurrences, \
+    get_graph_input_per_time, get_most_searched_parameter_per_time, GRAPH_TIME_DELTAS
+
+QUERY_HEADER = 'timestamp\ttime needed\tcollection\tcache hit\thits\tquery string\tgraph query'
+DRUG_HEADER = 'timestamp\tdrug'
+
+
+def write_log(path, filename, header, entries):
+    file = os.path.join(path, filename)
+    new_file = not os.path.isfile(file)
+    with open(file, 'at') as f:
+        if new_file:
+            f.write(header)
+        for day, value in entries:
+            f.write(f'\n{day.strftime("%Y.%m.%d")}-12:00:00\t{value}')
+
+
+def query_entry(query):
+    return f'0:00:01\tPubMed\tFalse\t10\t{query}\tgraph'
+
+
+class LogStatisticsTestCase(TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.log_sources = {}
+        for name, parameter in [("narrative", "query string"), ("overview", "drug"), ("suggestion", "drug")]:
+            path = os.path.join(self.log_dir.name, name)
+            os.makedirs(path)
+            self.log_sources[name] = (path, parameter)
+        self.state_file = os.path.join(self.log_dir.name, 'state', 'state.json')
+        self.today = datetime.now().date()
+
+    def tearDown(self):
+        self.log_dir.cleanup()
+
+    def write_queries(self, days_ago_and_queries):
+        path = self.log_sources["narrative"][0]
+        for days_ago, query in days_ago_and_queries:
+            day = self.today - timedelta(days=days_ago)
+            write_log(path, f'{day}-queries.log', QUERY_HEADER, [(day, query_entry(query))])
+
+    def assert_equal_to_reference(self, statistics: LogStatistics):
+        narrative_json = get_json_of_log(self.log_sources["narrative"][0])
+        self.assertEqual(get_amount_of_occurrences(narrative_json),
+                         statistics.get_amount_of_occurrences("narrative", self.today))
+        self.assertEqual(get_graph_input_per_time(narrative_json, GRAPH_TIME_DELTAS),
+                         statistics.get_graph_input_per_time("narrative", self.today))
+        self.assertEqual(get_most_searched_parameter_per_time(10, narrative_json, "query string"),
+                         statistics.get_most_searched_parameter_per_time("narrative", 10, self.today))
+
+    def test_statistics_equal_to_reference(self):
+        self.write_queries([(0, 'Metformin'), (0, 'Metformin'), (0, 'Metformin'), (0, 'Simvastatin'),
+                            (1, 'Metformin'), (1, 'Aspirin'), (40, 'Aspirin'), (200, 'Insulin'),
+                            (400, 'Insulin')])
+        statistics = LogStatistics(state_file=self.state_file, log_sources=self.log_sources)
+        self.assertEqual(9, statistics.update())
+        self.assert_equal_to_reference(statistics)
+        self.assertEqual({"metformin": 3, "simvastatin": 1},
+                         statistics.get_most_searched_parameter_per_time("narrative", 10, self.today)["t"])
+
+    def test_incremental_update(self):
+        self.write_queries([(0, 'Metformin'), (1, 'Aspirin')])
+        statistics = LogStatistics(state_file=self.state_file, log_sources=self.log_sources)
+        self.assertEqual(2, statistics.update())
+        self.assertEqual(0, statistics.update())
+        statistics.save()
+
+        self.write_queries([(0, 'Metformin'), (0, 'Aspirin'), (3, 'Insulin')])
+        statistics = LogStatistics(state_file=self.state_file, log_sources=self.log_sources)
+        statistics.load()
+        # only appended lines are parsed
+        self.assertEqual(3, statistics.update())
+        self.assert_equal_to_reference(statistics)
+
+    def test_rebuild_after_removed_log_file(self):
+        self.write_queries([(0, 'Metformin'), (5, 'Aspirin')])
+        statistics = LogStatistics(state_file=self.state_file, log_sources=self.log_sources)
+        statistics.update()
+
+        day = self.today - timedelta(days=5)
+        os.remove(os.path.join(self.log_sources["narrative"][0], f'{day}-queries.log'))
+        self.assertEqual(1, statistics.update())
+        self.assert_equal_to_reference(statistics)
+
+    def test_drug_suggestions_and_dictionary(self):
+        path = self.log_sources["suggestion"][0]
+        write_log(path, 'suggestions.log', 'timestamp\tdrug\tdescription',
+                  [(self.today, 'Metformin\tdesc'), (self.today, 'metformin \tdesc'), (self.today, 'Aspirin\tdesc')])
+        write_log(self.log_sources["overview"][0], 'overview.log', DRUG_HEADER, [(self.today, 'Metformin')])
+
+        statistics = LogStatistics(state_file=self.state_file, log_sources=self.log_sources)
+        statistics.update()
+        result = statistics.create_dictionary(today=self.today)
+        self.assertEqual([("metformin", 2), ("aspirin", 1)], result["overview"]["suggestions"])
+        self.assertEqual({"metformin": 1}, result["overview"]["topQueries"]["t"])
+        self.assertEqual(1, result["overview"]["amountQueries"]["t"])
+        # the dictionary is cached as json by the daily worker
+        json.dumps(result, default=str)
@@ -0,0 +1,46 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from narraint.queryengine.logger import QueryLogger, LogEntryWriter
+
+
+class QueryLoggerTestCase(TestCase):
+
+    def test_entries_written_after_flush(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            query_logger = QueryLogger(log_dir=log_dir)
+            for i in range(3):
+                query_logger.write_api_call(True, "subgraph", f"route_{i}")
+            self.assertTrue(query_logger.flush())
+
+            log_files = os.listdir(os.path.join(log_dir, 'api_calls'))
+            self.assertEqual(1, len(log_files))
+            with open(os.path.join(log_dir, 'api_calls', log_files[0]), 'rt') as f:
+                lines = f.read().split('\n')
+
+            self.assertEqual(query_logger.api_call_header, lines[0])
+            self.assertEqual(4, len(lines))
+            for i, line in enumerate(lines[1:]):
+                self.assertEqual(['True', 'subgraph', f'route_{i}'], line.split('\t')[2:])
+
+    def test_header_written_once(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, 'test.log')
+            # two writers simulate two worker processes appending to the same file
+            for writer in [LogEntryWriter(), LogEntryWriter()]:
+                writer.submit('\nentry', log_file, 'header')
+                self.assertTrue(writer.flush())
+
+            with open(log_file, 'rt') as f:
+                self.assertEqual('header\nentry\nentry', f.read())
+
+    def test_batched_by_size(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, 'test.log')
+            writer = LogEntryWriter(flush_after_entries=2, flush_interval=60.0)
+            writer.submit('\na', log_file, 'header')
+            writer.submit('\nb', log_file, 'header')
+            self.assertTrue(writer.flush())
+            with open(log_file, 'rt') as f:
+                self.assertEqual('header\na\nb', f.read())
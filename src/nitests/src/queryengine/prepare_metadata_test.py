@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from sqlalchemy import delete
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import Document, DocumentMetadata, DocumentMetadataService, DocumentClassification
+from narraint.queryengine.prepare_metadata_for_service import compute_document_metadata_service_table, \
+    truncate_authors
+
+COLLECTION = "METATEST"
+
+
+def metadata(document_id, publication_year=2020, authors="A | B"):
+    return dict(document_id=document_id, document_collection=COLLECTION, document_id_original=f"org{document_id}",
+                authors=authors, journals="Journal", publication_year=publication_year, publication_month=1,
+                publication_doi=f"10.1/{document_id}")
+
+
+class PrepareMetadataTestCase(TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        for table in [DocumentMetadataService, DocumentClassification, DocumentMetadata]:
+            session.execute(delete(table).where(table.document_collection == COLLECTION))
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+
+        Document.bulk_insert_values_into_table(session, [dict(id=i, collection=COLLECTION, title=f"Title {i}",
+                                                              abstract="") for i in range(1, 8)])
+        DocumentMetadata.bulk_insert_values_into_table(session, [
+            metadata(1), metadata(2, authors="A | B | C | D | E | F | G"), metadata(3, publication_year=0),
+            metadata(5), metadata(6), metadata(7)
+        ])
+        DocumentClassification.bulk_insert_values_into_table(session, [
+            dict(document_id=1, document_collection=COLLECTION, classification="Pharmaceutical", explanation=""),
+            dict(document_id=1, document_collection=COLLECTION, classification="Plant", explanation=""),
+            dict(document_id=6, document_collection=COLLECTION, classification="Plant", explanation="")
+        ])
+
+    @staticmethod
+    def get_service_metadata():
+        session = SessionExtended.get()
+        q = session.query(DocumentMetadataService).filter(DocumentMetadataService.document_collection == COLLECTION)
+        return {r.document_id: r for r in q}
+
+    def test_truncate_authors(self):
+        self.assertEqual("A | B", truncate_authors("A | B"))
+        self.assertEqual("A | B | C | D | E | 2+", truncate_authors("A | B | C | D | E | F | G"))
+
+    def test_compute_table_in_batches(self):
+        compute_document_metadata_service_table(batch_size=2)
+        doc2metadata = self.get_service_metadata()
+        # document 3 has no publication year and document 4 has no metadata
+        self.assertEqual({1, 2, 5, 6, 7}, set(doc2metadata.keys()))
+        self.assertEqual("Title 1", doc2metadata[1].title)
+        self.assertEqual("org1", doc2metadata[1].document_id_original)
+        self.assertEqual(str(["Pharmaceutical", "Plant"]), doc2metadata[1].document_classifications)
+        self.assertEqual(str(["Plant"]), doc2metadata[6].document_classifications)
+        self.assertIsNone(doc2metadata[5].document_classifications)
+        self.assertEqual("A | B | C | D | E | 2+", doc2metadata[2].authors)
+
+    def test_incremental_update(self):
+        compute_document_metadata_service_table(batch_size=2)
+        session = SessionExtended.get()
+        Document.bulk_insert_values_into_table(session, [dict(id=8, collection=COLLECTION, title="Title 8",
+                                                              abstract="")])
+        DocumentMetadata.bulk_insert_values_into_table(session, [metadata(8)])
+        compute_document_metadata_service_table(batch_size=2)
+        self.assertEqual({1, 2, 5, 6, 7, 8}, set(self.get_service_metadata().keys()))
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from sqlalchemy import delete
+
+from kgextractiontoolbox.backend.models import Document, Sentence, Predication
+from narraint.backend.database import SessionExtended
+from narraint.queryengine.engine import QueryEngine
+from narraint.queryengine.query import GraphQuery, FactPattern
+from narrant.entity.entity import Entity
+from narrant.entitylinking.enttypes import DRUG, DISEASE, GENE
+
+COLLECTION = "PROVTEST"
+OTHER_COLLECTION = "PROVTEST2"
+
+
+def predication(predication_id, predicate, relation, object_id, object_type, sentence_id):
+    return dict(id=predication_id, document_id=1, document_collection=COLLECTION,
+                subject_id="CHEMBL1", subject_type=DRUG, subject_str="metformin",
+                predicate=predicate, relation=relation,
+                object_id=object_id, object_type=object_type, object_str=object_id.lower(),
+                sentence_id=sentence_id, confidence=1.0, extraction_type="Test")
+
+
+class ProvenanceTestCase(TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        session.execute(delete(Predication).where(Predication.document_collection == COLLECTION))
+        session.execute(delete(Sentence).where(Sentence.document_collection.in_([COLLECTION, OTHER_COLLECTION])))
+        session.execute(delete(Document).where(Document.collection == COLLECTION))
+        session.commit()
+
+        Document.bulk_insert_values_into_table(session, [dict(id=1, collection=COLLECTION, title="Test",
+                                                              abstract="Test Abstract")])
+        Sentence.bulk_insert_values_into_table(session, [
+            dict(id=500, document_collection=COLLECTION, text="Metformin treats diabetes.", md5hash="PROV1"),
+            dict(id=501, document_collection=COLLECTION, text="Metformin inhibits mtor.", md5hash="PROV2"),
+            dict(id=502, document_collection=COLLECTION, text="Metformin and aspirin.", md5hash="PROV3"),
+            # sentence ids are only unique per collection
+            dict(id=500, document_collection=OTHER_COLLECTION, text="Another collection.", md5hash="PROV4"),
+            dict(id=501, document_collection=OTHER_COLLECTION, text="Another collection.", md5hash="PROV5")
+        ])
+        Predication.bulk_insert_values_into_table(session, [
+            predication(5000, "treat", "treats", "DIABETES", DISEASE, 500),
+            predication(5001, "inhibit", "inhibits", "MTOR", GENE, 501),
+            predication(5002, "cure", "treats", "DIABETES", DISEASE, 500),
+            predication(5003, "treat", "treats", "ASTHMA", DISEASE, 502)
+        ])
+
+    def assert_explanations(self, query_explanation):
+        explanations = sorted(query_explanation.explanations, key=lambda e: e.sentence)
+        self.assertEqual(2, len(explanations))
+
+        self.assertEqual("Metformin inhibits mtor.", explanations[0].sentence)
+        self.assertEqual({5001}, explanations[0].predication_ids)
+
+        self.assertEqual("Metformin treats diabetes.", explanations[1].sentence)
+        self.assertEqual({"treat", "cure"}, set(explanations[1].predicate.split("//")))
+        self.assertEqual({5000, 5002}, explanations[1].predication_ids)
+
+    def test_explain_document(self):
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "treats", [Entity("DIABETES", DISEASE)]),
+                                  FactPattern([Entity("CHEMBL1", DRUG)], "inhibits", [Entity("MTOR", GENE)])])
+        query_explanation = QueryEngine.explain_document("1", COLLECTION, graph_query)
+        self.assert_explanations(query_explanation)
+        self.assertEqual({"0", "1"}, {e.position for e in query_explanation.explanations})
+
+    def test_explain_document_without_matching_predications(self):
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "treats", [Entity("COVID", DISEASE)])])
+        self.assertEqual([], QueryEngine.explain_document("1", COLLECTION, graph_query).explanations)
+
+    def test_query_provenance_information(self):
+        query_explanation = QueryEngine.query_provenance_information({0: {5000, 5002}, 1: {5001}})
+        self.assert_explanations(query_explanation)
+
+    def test_query_sentences_for_sent_ids(self):
+        self.assertEqual({500: "Metformin treats diabetes.", 501: "Metformin inhibits mtor."},
+                         QueryEngine.query_sentences_for_sent_ids({500, 501}, COLLECTION))
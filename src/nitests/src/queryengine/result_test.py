@@ -0,0 +1,106 @@
+import json
+import pickle
+from unittest import TestCase, mock
+
+from narraint.queryengine import result
+from narraint.queryengine.result import QueryDocumentResult, QueryEntitySubstitution, QueryResultAggregate, \
+    QueryResultAggregateList, QueryDocumentResultList, iter_json_response
+
+
+class QueryResultJsonTestCase(TestCase):
+
+    @staticmethod
+    def create_document(document_id, title="Test", doi=None):
+        return QueryDocumentResult(document_id, title, "Kroll", "Fake", 2000, 1, {}, 1.0, {0: {1, 2}, 1: {3}},
+                                   org_document_id=f"org_{document_id}", doi=doi, document_collection="PubMed")
+
+    def create_aggregate_list(self):
+        entity_sub_a = QueryEntitySubstitution("a", "D001", "Disease", entity_name="Diabète")
+        entity_sub_b = QueryEntitySubstitution("b", "D002", "Disease", entity_name='"b"\n')
+        aggregate_list = QueryResultAggregateList()
+        for idx, sub in enumerate([entity_sub_a, entity_sub_b]):
+            aggregate = QueryResultAggregate({"X": sub, "Y": entity_sub_a})
+            aggregate.add_query_result(self.create_document(idx, title="Titel über Ärzte", doi="10.1/x"))
+            aggregate.add_query_result(self.create_document(idx + 10))
+            aggregate_list.add_query_result(aggregate)
+        return aggregate_list
+
+    def assert_json_equal_to_dict_encoding(self, data, chunk_size=65536):
+        expected = json.dumps({k: v.to_dict() if hasattr(v, "to_dict") else v for k, v in data.items()}).encode()
+        self.assertEqual(expected, b''.join(iter_json_response(data, chunk_size=chunk_size)))
+
+    def test_aggregate_list(self):
+        self.assert_json_equal_to_dict_encoding(dict(valid_query=True, results=self.create_aggregate_list(),
+                                                     year_aggregation={2000: 4}, query_limit_hit="False"))
+
+    def test_document_list(self):
+        document_list = QueryDocumentResultList()
+        self.assert_json_equal_to_dict_encoding(dict(results=document_list))
+        for idx in range(5):
+            document_list.add_query_result(self.create_document(idx))
+        self.assert_json_equal_to_dict_encoding(dict(valid_query=True, results=document_list))
+
+    def test_plain_values_and_chunks(self):
+        self.assert_json_equal_to_dict_encoding(dict(valid_query=False, results=[], query_translation="ä"))
+        data = dict(results=self.create_aggregate_list())
+        self.assertLess(1, len(list(iter_json_response(data, chunk_size=10))))
+        self.assert_json_equal_to_dict_encoding(data, chunk_size=10)
+
+
+class QueryResultObjectsTestCase(TestCase):
+
+    def test_lazy_entity_name(self):
+        with mock.patch.object(result, "EntityResolver") as resolver:
+            resolver.return_value.get_name_for_var_ent_id.return_value = "Diabetes"
+            sub = QueryEntitySubstitution("", "D003920", "Disease")
+            resolver.assert_not_called()
+            self.assertEqual("Diabetes", sub.entity_name)
+            self.assertEqual("Diabetes", sub.entity_name)
+            self.assertEqual(1, resolver.return_value.get_name_for_var_ent_id.call_count)
+
+        sub = QueryEntitySubstitution("", "D003920", "Disease", entity_name="Given")
+        self.assertEqual(dict(n="Given", s="", id="D003920", t="Disease"), sub.to_dict())
+
+    def test_slots(self):
+        document = QueryDocumentResult(1, "Test", "Kroll", "Fake", 2000, 0, {}, 1.0, {})
+        self.assertFalse(hasattr(document, "__dict__"))
+        self.assertFalse(hasattr(QueryEntitySubstitution("a", "a", "a", entity_name="a"), "__dict__"))
+
+    def test_pickle(self):
+        sub = QueryEntitySubstitution("a", "D001", "Disease", entity_name="a")
+        document = QueryDocumentResult(1, "Test", "Kroll", "Fake", 2000, 0, {"X": sub}, 1.0, {0: {1}},
+                                       doi="10.1/x", document_collection="PubMed")
+        documents = pickle.loads(pickle.dumps([document, document]))
+        self.assertEqual(document.to_dict(), documents[0].to_dict())
+        self.assertEqual(sub, documents[0].var2substitution["X"])
+        # shared objects stay shared
+        self.assertIs(documents[0], documents[1])
+
+    def test_restore_state_without_slots(self):
+        # results that have been cached before slots were used are pickled with an instance dictionary
+        sub = QueryEntitySubstitution.__new__(QueryEntitySubstitution)
+        sub.__setstate__(dict(entity_str="a", entity_id="D001", entity_type="Disease", entity_name="a"))
+        document = QueryDocumentResult.__new__(QueryDocumentResult)
+        document.__setstate__(dict(document_id=1, title="Test", journals="Fake", authors="Kroll",
+                                   publication_year=2000, publication_month=0, var2substitution={"X": sub},
+                                   confidence=1.0, position2provenance_ids={}, org_document_id=None, doi=None,
+                                   document_collection="PubMed", document_classes=None))
+        self.assertEqual("a", document.var2substitution["X"].entity_name)
+        self.assertEqual("PubMed", document.to_dict()["collection"])
+
+    def test_freeze_caches_result_sizes(self):
+        aggregate_list = QueryResultJsonTestCase().create_aggregate_list()
+        self.assertEqual(4, aggregate_list.freeze())
+        self.assertEqual(4, aggregate_list.get_result_size())
+        self.assertEqual([2, 2], [r.get_result_size() for r in aggregate_list.results])
+
+        # sizes of frozen nodes are not recomputed
+        aggregate_list.results[0].results.pop()
+        self.assertEqual(2, aggregate_list.results[0].get_result_size())
+        self.assertEqual(3, aggregate_list.freeze())
+
+        # adding results drops the size of the modified node
+        aggregate_list.results[0].add_query_result(QueryResultJsonTestCase.create_document(20))
+        self.assertEqual(2, aggregate_list.results[0].get_result_size())
+        aggregate_list.set_slice(1, 2)
+        self.assertEqual(2, aggregate_list.get_result_size())
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from sqlalchemy import delete
+
+from narraint.backend.database import SessionExtended
+from narraint.backend.models import PredicationInvertedIndex, SubstitutionCount
+from narraint.queryengine.aggregation.substitution_tree import ResultTreeAggregationBySubstitution
+from narraint.queryengine.engine import QueryEngine
+from narraint.queryengine.index.compute_substitution_counts import compute_substitution_counts, count_substitutions
+from narraint.queryengine.query import GraphQuery, FactPattern
+from narraint.queryengine.query_hints import ENTITY_TYPE_VARIABLE
+from narrant.entity.entity import Entity
+from narrant.entitylinking.enttypes import DISEASE, DRUG
+
+COLLECTION = "SUBCOUNTTEST"
+
+INVERTED_INDEX_ROWS = [
+    ("CHEMBL1", DRUG, "treats", "MESH:D1", DISEASE, [5, 3, 1]),
+    ("CHEMBL1", DRUG, "treats", "MESH:D2", DISEASE, [4]),
+    ("CHEMBL2", DRUG, "treats", "MESH:D1", DISEASE, [6, 2]),
+    ("CHEMBL1", DRUG, "associated", "MESH:D1", DISEASE, [5, 2]),
+    ("MESH:D2", DISEASE, "associated", "CHEMBL1", DRUG, [4, 3]),
+    ("MESH:D3", DISEASE, "associated", "CHEMBL1", DRUG, [7]),
+    ("CHEMBL1", DRUG, "associated", "MESH:D3", DISEASE, [7, 1]),
+]
+
+
+def variable(entity_type):
+    return Entity(f'?X({entity_type})', ENTITY_TYPE_VARIABLE)
+
+
+class SubstitutionCountTestCase(TestCase):
+
+    def setUp(self) -> None:
+        session = SessionExtended.get()
+        session.execute(delete(PredicationInvertedIndex))
+        session.execute(delete(SubstitutionCount))
+        session.commit()
+
+        values = [dict(document_collection=COLLECTION, subject_id=s_id, subject_type=s_type, relation=relation,
+                       object_id=o_id, object_type=o_type, support=len(doc_ids),
+                       document_ids="[" + ",".join(str(d) for d in doc_ids) + "]")
+                  for s_id, s_type, relation, o_id, o_type, doc_ids in INVERTED_INDEX_ROWS]
+        PredicationInvertedIndex.bulk_insert_values_into_table(session, values)
+        compute_substitution_counts(COLLECTION)
+
+    def query_engine_counts(self, graph_query: GraphQuery):
+        results = QueryEngine.process_query_with_expansion(graph_query, document_collection_filter={COLLECTION},
+                                                           load_document_metadata=False)
+        results_ranked, _ = ResultTreeAggregationBySubstitution().rank_results(results, freq_sort_desc=True)
+        return [(next(iter(a.var2substitution.values())).entity_id, a.get_result_size())
+                for a in results_ranked.results]
+
+    def assert_equal_to_engine(self, graph_query: GraphQuery):
+        sub_counts = QueryEngine.query_substitution_counts(graph_query, COLLECTION)
+        self.assertIsNotNone(sub_counts)
+        counts = [(sub.entity_id, count) for sub, count in sub_counts]
+        self.assertEqual(dict(self.query_engine_counts(graph_query)), dict(counts))
+        self.assertEqual(sorted((c for _, c in counts), reverse=True), [c for _, c in counts])
+        return counts
+
+    def test_count_substitutions(self):
+        rows = [("A", "T", 2, "[5,3]"), ("B", "T", 1, "[4]"), ("A", "T", 2, "[6,3]")]
+        self.assertEqual({("A", "T"): (3, 6), ("B", "T"): (1, 4)}, count_substitutions(rows))
+
+    def test_variable_object(self):
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "treats", [variable(DISEASE)])])
+        self.assertEqual([("MESH:D1", 3), ("MESH:D2", 1)], self.assert_equal_to_engine(graph_query))
+
+    def test_variable_subject(self):
+        graph_query = GraphQuery([FactPattern([variable(DRUG)], "treats", [Entity("MESH:D1", DISEASE)])])
+        self.assertEqual([("CHEMBL1", 3), ("CHEMBL2", 2)], self.assert_equal_to_engine(graph_query))
+
+    def test_symmetric_predicate_merges_directions(self):
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "associated", [variable(DISEASE)])])
+        self.assertEqual([("MESH:D3", 2), ("MESH:D1", 2), ("MESH:D2", 2)], self.assert_equal_to_engine(graph_query))
+
+        graph_query = GraphQuery([FactPattern([variable(DRUG)], "associated", [Entity("MESH:D3", DISEASE)])])
+        self.assertEqual([("CHEMBL1", 2)], self.assert_equal_to_engine(graph_query))
+
+    def test_fallback_to_engine(self):
+        # both drugs share a substitution - the documents must be merged by the engine
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG), Entity("CHEMBL2", DRUG)], "treats",
+                                              [variable(DISEASE)])])
+        self.assertIsNone(QueryEngine.query_substitution_counts(graph_query, COLLECTION))
+
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "treats", [variable(DISEASE)]),
+                                  FactPattern([Entity("CHEMBL1", DRUG)], "associated", [variable(DISEASE)])])
+        self.assertIsNone(QueryEngine.query_substitution_counts(graph_query, COLLECTION))
+
+        # collection without precomputed counts
+        graph_query = GraphQuery([FactPattern([Entity("CHEMBL1", DRUG)], "treats", [variable(DISEASE)])])
+        self.assertIsNone(QueryEngine.query_substitution_counts(graph_query, "PubMed"))
@@ -0,0 +1,61 @@
+import json
+from unittest import TestCase
+
+from narraint.queryengine.tracing import start_trace, stop_trace, trace_span, trace_count, trace_duration, \
+    get_current_trace
+
+
+class QueryTracingTestCase(TestCase):
+
+    def tearDown(self):
+        stop_trace()
+
+    def test_no_trace(self):
+        self.assertIsNone(get_current_trace())
+        # spans and counters must be usable without a started trace
+        with trace_span("engine"):
+            trace_count("rows", 10)
+            trace_duration("engine.results", 1.0)
+        self.assertIsNone(get_current_trace())
+
+    def test_spans_and_counters(self):
+        trace = start_trace("get_query")
+        with trace_span("engine"):
+            trace_count("rows", 10)
+            trace_count("rows", 5)
+        with trace_span("engine"):
+            pass
+        trace_duration("engine.results", 0.25)
+        trace_count("intersections")
+
+        self.assertEqual(["engine", "engine.results"], list(trace.stage2duration.keys()))
+        self.assertEqual(0.25, trace.stage2duration["engine.results"])
+        self.assertEqual({"rows": 15, "intersections": 1}, trace.counters)
+
+        stop_trace()
+        with trace_span("translation"):
+            trace_count("rows")
+        self.assertNotIn("translation", trace.stage2duration)
+        self.assertEqual(15, trace.counters["rows"])
+
+    def test_span_on_exception(self):
+        trace = start_trace("get_query")
+        with self.assertRaises(ValueError):
+            with trace_span("engine"):
+                raise ValueError()
+        self.assertIn("engine", trace.stage2duration)
+
+    def test_export(self):
+        trace = start_trace("get_query")
+        trace_duration("translation", 0.0012)
+        trace_count("rows", 3)
+
+        log_entry = json.loads(trace.to_log_entry())
+        self.assertEqual("get_query", log_entry["name"])
+        self.assertEqual({"translation": 1.2}, log_entry["stages"])
+        self.assertEqual({"rows": 3}, log_entry["counters"])
+        self.assertNotIn('\n', trace.to_log_entry())
+
+        metrics = trace.to_server_timing().split(', ')
+        self.assertEqual('translation;dur=1.2', metrics[0])
+        self.assertTrue(metrics[1].startswith('total;dur='))